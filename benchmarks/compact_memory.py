@@ -0,0 +1,59 @@
+"""
+Measures the memory used by tracktotrip tracks and compact tracks
+
+Usage:
+    python benchmarks/compact_memory.py [number of points]
+"""
+import gc
+import sys
+import time
+import datetime
+import tracktotrip as tt
+from processmysteps.compact import CompactTrack
+
+def rss():
+    """ Resident memory of this process, in bytes
+    """
+    with open('/proc/self/statm', 'r') as statm:
+        return int(statm.read().split()[1]) * 4096
+
+def build_track(n_points):
+    """ Builds a track with one point per second
+    """
+    start = datetime.datetime(2016, 7, 25, 8, 0, 0)
+    points = [
+        tt.Point(38.7 + i * 1e-6, -9.1 + i * 1e-6, start + datetime.timedelta(seconds=i))
+        for i in xrange(n_points)
+    ]
+    return tt.Track('benchmark', [tt.Segment(points)])
+
+def main(n_points):
+    gc.collect()
+    before = rss()
+    track = build_track(n_points)
+    gc.collect()
+    track_bytes = rss() - before
+
+    start = time.time()
+    compact = CompactTrack.from_track(track)
+    to_compact = time.time() - start
+
+    del track
+    gc.collect()
+    before = rss()
+    start = time.time()
+    track = compact.to_track()
+    from_compact = time.time() - start
+    gc.collect()
+    restored_bytes = rss() - before
+
+    per_million = 1000000.0 / n_points / (1024 * 1024)
+    print 'points: %d' % n_points
+    print 'tracktotrip.Track: %.1f MB per million points' % (track_bytes * per_million)
+    print 'CompactTrack: %.1f MB per million points' % (compact.nbytes * per_million)
+    print 'reduction: %.1fx' % (float(track_bytes) / compact.nbytes)
+    print 'Track -> CompactTrack: %.2fs, CompactTrack -> Track: %.2fs (%.1f MB)' % (
+        to_compact, from_compact, restored_bytes * per_million)
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
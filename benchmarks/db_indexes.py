@@ -0,0 +1,143 @@
+"""
+Measures the latency of the spatial and label queries, before and after
+the indexes of processmysteps/migrations.py
+
+Tables are created from schema.sql, without its indexes, in a scratch
+schema that's dropped at the end, so the database given isn't changed.
+PostGIS must be installed.
+
+Usage:
+    python benchmarks/db_indexes.py <configuration file> [rows ...]
+"""
+import sys
+import json
+import time
+from os.path import join, dirname, abspath
+from processmysteps import db
+from processmysteps.migrations import migrate
+
+SCHEMA = 'processmysteps_benchmark'
+REPEAT = 50
+
+SCHEMA_PATH = join(dirname(abspath(__file__)), '..', 'schema.sql')
+
+def tables():
+    """ Statements of schema.sql that create tables
+
+    Indexes are left out, to be created by the migrations, and so are the
+    extensions, that are shared by all schemas
+    """
+    with open(SCHEMA_PATH, 'r') as schema_file:
+        statements = schema_file.read().split(';')
+    return ';'.join([
+        statement for statement in statements if 'CREATE TABLE' in statement
+    ]) + ';'
+
+# Rows spread over a 1x1 degree area. Bounds, like in db.py, have the
+# latitude as x
+FILL = """
+INSERT INTO locations (label, centroid, point_cluster)
+SELECT 'location ' || (i %% 5000), ST_MakePoint(x, y, 0)::geography,
+    ST_MakeLine(ST_MakePoint(x, y, 0), ST_MakePoint(x + 0.0001, y + 0.0001, 0))::geography
+FROM (SELECT i, -9.5 + random() AS x, 38.5 + random() AS y FROM generate_series(1, %(rows)s) AS i) AS r;
+
+INSERT INTO canonical_trips (bounds, points)
+SELECT ST_Force3DZ(ST_MakeEnvelope(y, x, y + 0.01, x + 0.01, 4326))::geography,
+    ST_MakeLine(ST_MakePoint(x, y, 0), ST_MakePoint(x + 0.01, y + 0.01, 0))::geography
+FROM (SELECT -9.5 + random() AS x, 38.5 + random() AS y FROM generate_series(1, %(rows)s)) AS r;
+
+INSERT INTO trips (start_date, end_date, bounds, points)
+SELECT d, d + interval '30 minutes',
+    ST_Force3DZ(ST_MakeEnvelope(y, x, y + 0.01, x + 0.01, 4326))::geography,
+    ST_MakeLine(ST_MakePoint(x, y, 0), ST_MakePoint(x + 0.01, y + 0.01, 0))::geography
+FROM (
+    SELECT timestamp '2015-01-01' + i * interval '10 minutes' AS d,
+        -9.5 + random() AS x, 38.5 + random() AS y
+    FROM generate_series(1, %(rows)s) AS i
+) AS r;
+
+INSERT INTO canonical_trips_relations (canonical_trip, trip)
+SELECT i, i FROM generate_series(1, %(rows)s) AS i;
+
+ANALYZE;
+"""
+
+# Queries as run by db.py, see `query_locations`, `match_canonical_trip`,
+# `insert_location` and `get_canonical_trips`
+QUERIES = [
+    ('query_locations (ST_DWithin)', """
+        SELECT label, centroid, point_cluster FROM locations
+        WHERE ST_DWithin(centroid, ST_MakePoint(-9.1, 38.9, 0)::geography, 100)
+        """),
+    ('match_canonical_trip (&&)', """
+        SELECT canonical_id, points FROM canonical_trips
+        WHERE bounds && ST_MakeEnvelope(38.9, -9.1, 38.91, -9.09, 4326)
+        """),
+    ('insert_location (label)', """
+        SELECT location_id, label, centroid, point_cluster FROM locations
+        WHERE label='location 42'
+        """),
+    ('trips by date', """
+        SELECT trip_id FROM trips
+        WHERE start_date BETWEEN timestamp '2015-03-01' AND timestamp '2015-03-02'
+        """),
+    ('canonical trip relations', """
+        SELECT trip FROM canonical_trips_relations WHERE canonical_trip = 42
+        """)
+]
+
+def measure(cur, query):
+    """ Median latency of a query, in milliseconds
+    """
+    times = []
+    for _ in range(REPEAT):
+        start = time.time()
+        cur.execute(query)
+        cur.fetchall()
+        times.append((time.time() - start) * 1000)
+    return sorted(times)[len(times) / 2]
+
+def benchmark(conn, rows):
+    """ Measures the latency of the queries, with a number of rows in each table
+    """
+    cur = conn.cursor()
+    cur.execute('DROP SCHEMA IF EXISTS %s CASCADE' % SCHEMA)
+    cur.execute('CREATE SCHEMA %s' % SCHEMA)
+    cur.execute('SET search_path TO %s, public' % SCHEMA)
+    cur.execute(tables())
+    cur.execute(FILL, {'rows': rows})
+    conn.commit()
+
+    before = [measure(cur, query) for _, query in QUERIES]
+    migrate(conn)
+    cur.execute('ANALYZE')
+    after = [measure(cur, query) for _, query in QUERIES]
+
+    print 'rows: %d' % rows
+    for (name, _), without_index, with_index in zip(QUERIES, before, after):
+        print '  %-32s %9.2fms -> %7.2fms' % (name, without_index, with_index)
+
+    cur.execute('DROP SCHEMA %s CASCADE' % SCHEMA)
+    conn.commit()
+    cur.close()
+
+def main(config_path, sizes):
+    with open(config_path, 'r') as config_file:
+        dbc = json.loads(config_file.read()).get('db', {})
+    conn = db.connect_db(
+        dbc.get('host'), dbc.get('name'), dbc.get('user'), dbc.get('port'), dbc.get('pass')
+    )
+    if conn is None:
+        print 'Unable to connect to the database'
+        sys.exit(1)
+    try:
+        for rows in sizes:
+            benchmark(conn, rows)
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print __doc__
+        sys.exit(1)
+    main(sys.argv[1], [int(rows) for rows in sys.argv[2:]] or [10000, 100000, 1000000])
@@ -0,0 +1,47 @@
+"""
+Measures the decoding of canonical trips, as returned by the database,
+with ppygis and with processmysteps.ewkb
+
+Usage:
+    python benchmarks/ewkb_decode.py [number of trips] [points per trip]
+"""
+import sys
+import time
+import ppygis
+from tracktotrip import Point, Segment
+from processmysteps import db
+
+def build_values(n_trips, n_points):
+    """ Hex encoded EWKB of LINESTRINGZs, like the points of canonical_trips
+    """
+    return [
+        ppygis.LineString([
+            ppygis.Point(-9.1 + i * 1e-5, 38.7 + j * 1e-3 + i * 1e-5, 0, srid=4326)
+            for i in xrange(n_points)
+        ], srid=4326).write_ewkb()
+        for j in xrange(n_trips)
+    ]
+
+def ppygis_segment(value):
+    """ Decoding as done before processmysteps.ewkb
+    """
+    return Segment([Point(p.y, p.x, None) for p in ppygis.Geometry.read_ewkb(value).points])
+
+def measure(name, function, values):
+    start = time.time()
+    for value in values:
+        function(value)
+    print '%-40s %.3fs' % (name, time.time() - start)
+
+def main(n_trips, n_points):
+    values = build_values(n_trips, n_points)
+    print 'trips: %d, points: %d' % (n_trips, n_trips * n_points)
+    measure('ppygis -> Segment -> JSON', lambda value: ppygis_segment(value).to_json(), values)
+    measure('ewkb -> Segment -> JSON', lambda value: db.to_segment(value).to_json(), values)
+    measure('ewkb -> JSON', db.to_segment_json, values)
+
+if __name__ == '__main__':
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 1000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    )
@@ -0,0 +1,56 @@
+"""
+Measures the encoding of segments to insert in the database, with
+ppygis and with processmysteps.ewkb
+
+psycopg hex encodes bytea parameters, for PostgreSQL 9 or later, when
+they're prepared for a connection. That's measured with
+`binascii.b2a_hex`, so no database is needed.
+
+Usage:
+    python benchmarks/ewkb_encode.py [points per segment] [repetitions]
+"""
+import sys
+import time
+import binascii
+import datetime
+import ppygis
+from psycopg2.extensions import adapt
+from tracktotrip import Point
+from processmysteps import ewkb
+
+def build_points(n_points):
+    """ Points of a segment, with one point per second
+    """
+    start = datetime.datetime(2016, 7, 25, 8, 0, 0)
+    return [
+        Point(38.7 + i * 1e-6, -9.1 + i * 1e-6, start + datetime.timedelta(seconds=i))
+        for i in xrange(n_points)
+    ]
+
+def ppygis_quoted(points):
+    """ Encoding as done before processmysteps.ewkb
+    """
+    line = ppygis.LineString([ppygis.Point(p.lon, p.lat, 0, srid=4326) for p in points])
+    return adapt(line.write_ewkb()).getquoted()
+
+def ewkb_quoted(points):
+    return binascii.b2a_hex(ewkb.write_linestring(points))
+
+def measure(name, function, points, repeat):
+    start = time.time()
+    for _ in xrange(repeat):
+        function(points)
+    elapsed = (time.time() - start) / repeat
+    print '%-10s %.4fs per segment, %.0f ns per point' % (name, elapsed, elapsed * 1e9 / len(points))
+
+def main(n_points, repeat):
+    points = build_points(n_points)
+    print 'points: %d' % n_points
+    measure('ppygis', ppygis_quoted, points, repeat)
+    measure('ewkb', ewkb_quoted, points, repeat)
+
+if __name__ == '__main__':
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 100000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    )
@@ -1,5 +1,8 @@
 DROP TABLE IF EXISTS trips CASCADE;
 DROP TABLE IF EXISTS locations CASCADE;
 DROP TABLE IF EXISTS trips_transportation_modes CASCADE;
+DROP TABLE IF EXISTS canonical_trips_lod CASCADE;
 DROP TABLE IF EXISTS canonical_trips CASCADE;
 DROP TABLE IF EXISTS canonical_trips_relations CASCADE;
+DROP TABLE IF EXISTS stays CASCADE;
+DROP TABLE IF EXISTS schema_migrations CASCADE;
@@ -0,0 +1,221 @@
+"""
+In-memory caches
+"""
+import math
+import time
+import threading
+from collections import OrderedDict
+from tracktotrip.point import distance
+
+# Estimated memory used by a `tracktotrip.Point`, in bytes
+POINT_SIZE = 1300
+# Meters in one degree of latitude, as used by tracktotrip
+ONE_DEGREE = 1000. * 10000.8 / 90.
+
+class LRUCache(object):
+    """ Least recently used cache, bounded by the total size of its values
+
+    When adding a value exceeds the maximum size, the least recently used
+    values are evicted. Values bigger than the maximum size aren't cached.
+    It's safe to use from multiple threads.
+
+    Attributes:
+        max_size (int): Maximum total size of the values. Shrinking it evicts
+            the least recently used values that don't fit
+        sizeof: Function with signature (value) -> int, that computes the size
+            of a value. Defaults to 1 for every value, bounding the number of
+            entries
+        size (int): Current total size of the values
+    """
+    def __init__(self, max_size, sizeof=None):
+        self.sizeof = sizeof if sizeof else lambda _: 1
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.RLock()
+        self._max_size = max_size
+
+    @property
+    def max_size(self):
+        return self._max_size
+
+    @max_size.setter
+    def max_size(self, max_size):
+        with self.lock:
+            self._max_size = max_size
+            self.evict()
+
+    def evict(self):
+        """ Evicts the least recently used values, until they fit the maximum size
+        """
+        with self.lock:
+            while self.size > self._max_size:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.size = self.size - evicted_size
+
+    def get(self, key, default=None):
+        """ Gets a value, marking it as the most recently used
+
+        Args:
+            key: Key of the value
+            default (optional): Value to return if the key isn't cached.
+                Defaults to None
+        Returns:
+            Cached value or default
+        """
+        with self.lock:
+            if key not in self.entries:
+                return default
+            value, size = self.entries.pop(key)
+            self.entries[key] = (value, size)
+            return value
+
+    def put(self, key, value):
+        """ Caches a value, evicting the least recently used if needed
+
+        Args:
+            key: Key of the value
+            value: Value to cache
+        """
+        size = self.sizeof(value)
+        with self.lock:
+            self.remove(key)
+            if size > self.max_size:
+                return
+            self.entries[key] = (value, size)
+            self.size = self.size + size
+            self.evict()
+
+    def remove(self, key):
+        """ Removes a value from the cache, if it exists
+
+        Args:
+            key: Key of the value
+        """
+        with self.lock:
+            if key in self.entries:
+                _, size = self.entries.pop(key)
+                self.size = self.size - size
+
+    def clear(self):
+        """ Removes all values
+        """
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def keys(self):
+        """ Gets the keys of the cached values
+
+        Returns:
+            :obj:`list`: From the least to the most recently used
+        """
+        with self.lock:
+            return list(self.entries.keys())
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.entries
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
+
+class SpatialCache(object):
+    """ Cache of spatial query results, by grid cell
+
+    The results of a query around a point are computed for the whole cell
+    of the grid it falls in, by querying around the center of the cell with
+    a distance large enough to include the results of any point of the
+    cell. Results of each point are then filtered and sorted by distance.
+    Cells are kept in a `LRUCache` for a limited time.
+
+    Attributes:
+        cell_size (float): Size of the grid cells, in meters
+        ttl (float): Time, in seconds, that results are kept
+        position: Function with signature (result) -> `tracktotrip.Point`,
+            that gets the position of a result
+        cells (:obj:`LRUCache`): Results of each cell, with their expiration time
+    """
+    def __init__(self, max_cells, ttl, cell_size, position):
+        self.cell_size = cell_size
+        self.ttl = ttl
+        self.position = position
+        self.cells = LRUCache(max_cells)
+
+    def cell_of(self, lat, lon):
+        """ Gets the grid cell of a point
+
+        Args:
+            lat (float)
+            lon (float)
+        Returns:
+            (int, int)
+        """
+        size = self.cell_size / ONE_DEGREE
+        return (int(math.floor(lat / size)), int(math.floor(lon / size)))
+
+    def cell_query(self, key):
+        """ Gets the query that covers a cell
+
+        Args:
+            key ((int, int, float)): Cell and query distance
+        Returns:
+            (float, float, float): Latitude and longitude of the center of the
+                cell, and distance to query around it, in meters
+        """
+        row, col, max_distance = key
+        size = self.cell_size / ONE_DEGREE
+        # cells are narrower than cell_size away from the equator
+        return ((row + .5) * size, (col + .5) * size, max_distance + self.cell_size)
+
+    def get(self, lat, lon, max_distance, query):
+        """ Gets the results around a point
+
+        Args:
+            lat (float)
+            lon (float)
+            max_distance (float): Distance, in meters, around the point
+            query: Function with signature (lat, lon, distance) -> list, that
+                gets the results around a point, sorted or not. If it returns
+                None, results aren't cached
+        Returns:
+            :obj:`list`: Results within the distance, sorted by distance
+        """
+        key = self.cell_of(lat, lon) + (max_distance, )
+        cached = self.cells.get(key)
+        if cached is None or cached[0] < time.time():
+            c_lat, c_lon, c_distance = self.cell_query(key)
+            results = query(c_lat, c_lon, c_distance)
+            if results is None:
+                return []
+            cached = (time.time() + self.ttl, results)
+            self.cells.put(key, cached)
+
+        nearby = []
+        for result in cached[1]:
+            point = self.position(result)
+            dist = distance(lat, lon, None, point.lat, point.lon, None)
+            if dist <= max_distance:
+                nearby.append((dist, result))
+        return [result for _, result in sorted(nearby, key=lambda near: near[0])]
+
+    def invalidate(self, bounds):
+        """ Removes the cells with results that may be in an area
+
+        Args:
+            bounds ((float, float, float, float)): Min latitude, min longitude,
+                max latitude and max longitude of the area
+        """
+        min_lat, min_lon, max_lat, max_lon = bounds
+        for key in self.cells.keys():
+            c_lat, c_lon, c_distance = self.cell_query(key)
+            # closest point of the area to the center of the cell
+            lat = min(max(c_lat, min_lat), max_lat)
+            lon = min(max(c_lon, min_lon), max_lon)
+            if distance(c_lat, c_lon, None, lat, lon, None) <= c_distance:
+                self.cells.remove(key)
+
+    def clear(self):
+        """ Removes all results
+        """
+        self.cells.clear()
@@ -0,0 +1,148 @@
+"""
+In-memory spatial index of canonical trips
+"""
+import threading
+from rtree import index as rtree_index
+from tracktotrip import Segment
+from .cache import LRUCache
+from .db import to_segment
+
+class CanonicalTripsIndex(object):
+    """ R-tree of the bounds of the canonical trips, with a cache of their geometries
+
+    Bounds of all canonical trips are loaded from the database the first
+    time they're needed, and then kept in sync as canonical trips are
+    written by this process, see `put`. Only the geometries of the canonical
+    trips whose bounds intersect a query are loaded, and the most recently
+    used are kept in a `LRUCache`, bounded by their number of points.
+
+    Bounds follow `tracktotrip.Segment.bounds`, with the latitude as x, like
+    the bounds stored in the database.
+
+    Attributes:
+        geometries (:obj:`LRUCache`): Cached canonical trips, by id
+        loaded (bool): True if the bounds are loaded
+    """
+    def __init__(self, max_points):
+        self.geometries = LRUCache(max_points, lambda trip: len(trip.points))
+        self.rtree = rtree_index.Index()
+        self.bounds = {}
+        self.loaded = False
+        self.lock = threading.RLock()
+
+    def load(self, cur):
+        """ Loads the bounds of all canonical trips, if they aren't loaded
+
+        Args:
+            cur (:obj:`psycopg2.cursor`)
+        """
+        with self.lock:
+            if self.loaded:
+                return
+            cur.execute("""
+                SELECT canonical_id,
+                    ST_XMin(bounds::geometry), ST_YMin(bounds::geometry),
+                    ST_XMax(bounds::geometry), ST_YMax(bounds::geometry)
+                FROM canonical_trips
+                """)
+            self.bounds = dict([(row[0], tuple(row[1:])) for row in cur.fetchall()])
+            self.rtree = rtree_index.Index()
+            for canonical_id, bounds in self.bounds.items():
+                self.rtree.insert(canonical_id, bounds)
+            self.loaded = True
+
+    def candidates(self, cur, bounds):
+        """ Gets the ids of the canonical trips with bounds that intersect others
+
+        Args:
+            cur (:obj:`psycopg2.cursor`)
+            bounds ((float, float, float, float)): Min latitude, min longitude,
+                max latitude and max longitude
+        Returns:
+            :obj:`list` of int: Sorted ids
+        """
+        with self.lock:
+            self.load(cur)
+            return sorted(self.rtree.intersection(bounds))
+
+    def get(self, cur, ids):
+        """ Gets canonical trips, loading the ones that aren't cached
+
+        Args:
+            cur (:obj:`psycopg2.cursor`)
+            ids (:obj:`list` of int)
+        Returns:
+            :obj:`dict` of int: :obj:`tracktotrip.Segment`: Copies of the
+                canonical trips, so they can be changed
+        """
+        result = {}
+        missing = []
+        for canonical_id in ids:
+            trip = self.geometries.get(canonical_id)
+            if trip is None:
+                missing.append(canonical_id)
+            else:
+                result[canonical_id] = trip
+
+        if len(missing) > 0:
+            cur.execute("""
+                SELECT canonical_id, points FROM canonical_trips
+                WHERE canonical_id = ANY(%s)
+                """, (missing, ))
+            for canonical_id, points in cur.fetchall():
+                trip = to_segment(points)
+                self.geometries.put(canonical_id, trip)
+                result[canonical_id] = trip
+
+        return dict([
+            (canonical_id, Segment(list(trip.points))) for canonical_id, trip in result.items()
+        ])
+
+    def match(self, cur, trip, distance):
+        """ Gets the canonical trips with bounds that intersect the bounds of a trip
+
+        See `db.match_canonical_trip`
+
+        Args:
+            cur (:obj:`psycopg2.cursor`)
+            trip (:obj:`tracktotrip.Segment`)
+            distance (float): Distance, in degrees, to extend the bounds of the trip
+        Returns:
+            :obj:`list` of (int, :obj:`tracktotrip.Segment`)
+        """
+        trips = self.get(cur, self.candidates(cur, trip.bounds(thr=distance)))
+        return sorted(trips.items())
+
+    def put(self, canonical_id, trip):
+        """ Adds or updates a canonical trip
+
+        Must be called after the canonical trip is written to the database
+
+        Args:
+            canonical_id (int)
+            trip (:obj:`tracktotrip.Segment`)
+        """
+        with self.lock:
+            if not self.loaded:
+                return
+            if canonical_id in self.bounds:
+                self.rtree.delete(canonical_id, self.bounds[canonical_id])
+            bounds = trip.bounds()
+            self.bounds[canonical_id] = bounds
+            self.rtree.insert(canonical_id, bounds)
+            self.geometries.put(canonical_id, Segment(list(trip.points)))
+
+    def clear(self):
+        """ Discards the index, it's loaded again when needed
+
+        Used when the database changes, or when writes to it are rolled back
+        """
+        with self.lock:
+            self.rtree = rtree_index.Index()
+            self.bounds = {}
+            self.geometries.clear()
+            self.loaded = False
+
+    def __len__(self):
+        with self.lock:
+            return len(self.bounds)
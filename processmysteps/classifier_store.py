@@ -0,0 +1,170 @@
+"""
+Storage and lazy loading of transportation mode classifiers
+
+Besides tracktotrip's pickled `Classifier`, classifiers can be stored in
+a directory with the arrays of the model, as .npy files, and a manifest:
+
+    manifest.json: format version, classifier parameters and feature length
+    coef.npy, intercept.npy, classes.npy: arrays of the sklearn classifier
+    labels.npy: labels of the classes
+
+The arrays are memory mapped when loaded, so they're only read from disk
+when the classifier is used.
+
+Converts a pickled classifier with:
+
+    python -m processmysteps.classifier_store <pickle file> <directory>
+"""
+import sys
+import json
+import threading
+from os import makedirs
+from os.path import join, expanduser, isdir, isfile
+import numpy as np
+
+FORMAT_VERSION = 1
+MANIFEST = 'manifest.json'
+ARRAYS = ['coef', 'intercept', 'classes', 'labels']
+
+def is_array_format(path):
+    """ Checks if a path has a classifier in the array based format
+
+    Args:
+        path (str)
+    Returns:
+        bool
+    """
+    return isdir(path) and isfile(join(path, MANIFEST))
+
+def save_classifier(clf, path):
+    """ Saves a fitted classifier in the array based format
+
+    Args:
+        clf (:obj:`tracktotrip.classifier.Classifier`)
+        path (str): Directory to save to. It's created if it doesn't exist
+    """
+    path = expanduser(path)
+    if not isdir(path):
+        makedirs(path)
+
+    arrays = {
+        'coef': clf.clf.coef_,
+        'intercept': clf.clf.intercept_,
+        'classes': clf.clf.classes_,
+        'labels': np.array([str(label) for label in clf.labels.classes_])
+    }
+    for name in ARRAYS:
+        np.save(join(path, name + '.npy'), np.ascontiguousarray(arrays[name]))
+
+    params = clf.clf.get_params()
+    manifest = {
+        'version': FORMAT_VERSION,
+        'featureLength': clf.feature_length,
+        'params': dict([
+            (key, value) for key, value in params.items()
+            if value is None or isinstance(value, (bool, int, long, float, str, unicode))
+        ])
+    }
+    with open(join(path, MANIFEST), 'w') as manifest_file:
+        manifest_file.write(json.dumps(manifest, indent=2))
+
+def load_classifier(path, mmap=True):
+    """ Loads a classifier saved in the array based format
+
+    Args:
+        path (str): Directory of the classifier
+        mmap (bool, optional): Memory maps the arrays. A memory mapped
+            classifier is read only, so it can't learn. Defaults to True
+    Returns:
+        :obj:`tracktotrip.classifier.Classifier`
+    """
+    # sklearn is slow to import, so it's only imported by the loader
+    from sklearn.linear_model import SGDClassifier
+    from tracktotrip.classifier import Classifier
+
+    path = expanduser(path)
+    with open(join(path, MANIFEST), 'r') as manifest_file:
+        manifest = json.loads(manifest_file.read())
+    if manifest.get('version') != FORMAT_VERSION:
+        raise ValueError(
+            'Unsupported classifier format version %s, in %s' % (manifest.get('version'), path)
+        )
+
+    mmap_mode = 'r' if mmap else None
+    arrays = dict([
+        (name, np.load(join(path, name + '.npy'), mmap_mode=mmap_mode)) for name in ARRAYS
+    ])
+
+    params = dict([(str(key), value) for key, value in manifest['params'].items()])
+    sgd = SGDClassifier(**params)
+    sgd.coef_ = arrays['coef']
+    sgd.intercept_ = arrays['intercept']
+    sgd.classes_ = arrays['classes']
+
+    clf = Classifier(sgd)
+    clf.labels.classes_ = np.array(arrays['labels'])
+    clf.feature_length = manifest['featureLength']
+    return clf
+
+def read_classifier(path):
+    """ Reads a classifier, in the array based or pickle format
+
+    Args:
+        path (str): Directory or pickle file. If None, an empty classifier
+            is created
+    Returns:
+        :obj:`tracktotrip.classifier.Classifier`
+    """
+    from tracktotrip.classifier import Classifier
+
+    if not path:
+        return Classifier()
+    path = expanduser(path)
+    if is_array_format(path):
+        return load_classifier(path)
+    with open(path, 'rb') as clf_file:
+        return Classifier.load_from_file(clf_file)
+
+class LazyClassifier(object):
+    """ Classifier loaded in a background thread
+
+    Loading starts when it's created, and `get` waits for it to finish
+
+    Attributes:
+        path (str): Path of the classifier, see `read_classifier`
+    """
+    def __init__(self, path):
+        self.path = path
+        self.clf = None
+        self.error = None
+        self.done = threading.Event()
+        thread = threading.Thread(target=self.load)
+        thread.daemon = True
+        thread.start()
+
+    def load(self):
+        """ Loads the classifier
+        """
+        try:
+            self.clf = read_classifier(self.path)
+        except Exception as err:
+            self.error = err
+        finally:
+            self.done.set()
+
+    def get(self):
+        """ Gets the classifier, waiting for it to load
+
+        Returns:
+            :obj:`tracktotrip.classifier.Classifier`
+        """
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.clf
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print 'Usage: python -m processmysteps.classifier_store <pickle file> <directory>'
+        sys.exit(1)
+    save_classifier(read_classifier(sys.argv[1]), sys.argv[2])
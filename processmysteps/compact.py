@@ -0,0 +1,158 @@
+"""
+Compact, array based, track representation
+"""
+import gc
+from contextlib import contextmanager
+import numpy as np
+from tracktotrip import Track, Segment, Point
+
+def naive_time(time):
+    """ Removes the timezone of a datetime
+
+    Args:
+        time (:obj:`datetime.datetime`)
+    Returns:
+        :obj:`datetime.datetime`
+    """
+    if time is None or time.tzinfo is None:
+        return time
+    return time.replace(tzinfo=None)
+
+@contextmanager
+def paused_gc():
+    """ Pauses the cyclic garbage collector
+
+    Creating many objects, like the points of a track, triggers collections
+    that traverse every tracked object of the process. Points don't have
+    reference cycles, so those collections are wasted, and take up to 90%
+    of the time when the process already holds other tracks
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+class CompactSegment(object):
+    """ Segment with its points stored in columns
+
+    Attributes:
+        lat (:obj:`numpy.ndarray`): Latitudes, as float64
+        lon (:obj:`numpy.ndarray`): Longitudes, as float64
+        time (:obj:`numpy.ndarray`): Timestamps, as datetime64[us]. NaT if
+            the point doesn't have a timestamp
+        metrics (:obj:`numpy.ndarray`): dt, dx, vel and acc of each point, as
+            a (n, 4) float64 matrix, so they're restored exactly
+        tzinfo (:obj:`datetime.tzinfo`): Timezone of the timestamps
+        transportation_modes (:obj:`list` of :obj:`dict`)
+        location_from (:obj:`tracktotrip.Location`)
+        location_to (:obj:`tracktotrip.Location`)
+    """
+    __slots__ = (
+        'lat', 'lon', 'time', 'metrics', 'tzinfo',
+        'transportation_modes', 'location_from', 'location_to'
+    )
+
+    def __init__(self, segment):
+        points = segment.points
+        with paused_gc():
+            self.lat = np.array([p.lat for p in points], dtype=np.float64)
+            self.lon = np.array([p.lon for p in points], dtype=np.float64)
+            self.time = np.array([naive_time(p.time) for p in points], dtype='datetime64[us]')
+            self.metrics = np.array(
+                [(p.dt, getattr(p, 'dx', 0.0), p.vel, p.acc) for p in points],
+                dtype=np.float64
+            ).reshape((len(points), 4))
+        self.tzinfo = points[0].time.tzinfo if len(points) > 0 and points[0].time else None
+        self.transportation_modes = list(segment.transportation_modes)
+        self.location_from = segment.location_from
+        self.location_to = segment.location_to
+
+    def to_segment(self):
+        """ Creates a `tracktotrip.Segment`
+
+        Returns:
+            :obj:`tracktotrip.Segment`
+        """
+        points = []
+        with paused_gc():
+            times = self.time.astype(object)
+            if self.tzinfo:
+                times = [time.replace(tzinfo=self.tzinfo) if time else None for time in times]
+
+            for lat, lon, time, (d_t, d_x, vel, acc) in zip(
+                    self.lat.tolist(),
+                    self.lon.tolist(),
+                    times,
+                    self.metrics.tolist()
+                ):
+                point = Point(lat, lon, time)
+                point.dt = d_t
+                point.dx = d_x
+                point.vel = vel
+                point.acc = acc
+                points.append(point)
+
+        segment = Segment(points)
+        segment.transportation_modes = list(self.transportation_modes)
+        segment.location_from = self.location_from
+        segment.location_to = self.location_to
+        return segment
+
+    @property
+    def nbytes(self):
+        """ Memory used by the points, in bytes
+        """
+        return self.lat.nbytes + self.lon.nbytes + self.time.nbytes + self.metrics.nbytes
+
+    def __len__(self):
+        return len(self.lat)
+
+class CompactTrack(object):
+    """ Track with its points stored in columns
+
+    Uses a fraction of the memory of a `tracktotrip.Track`, but must be
+    converted to use tracktotrip methods. See `to_track`
+
+    Attributes:
+        name (str)
+        meta (:obj:`list`)
+        segments (:obj:`list` of :obj:`CompactSegment`)
+    """
+    def __init__(self, name, segments, meta=None):
+        self.name = name
+        self.segments = segments
+        self.meta = meta if meta is not None else []
+
+    @staticmethod
+    def from_track(track):
+        """ Creates from a `tracktotrip.Track`
+
+        Args:
+            track (:obj:`tracktotrip.Track`)
+        Returns:
+            :obj:`CompactTrack`
+        """
+        segments = [CompactSegment(segment) for segment in track.segments]
+        return CompactTrack(track.name, segments, list(track.meta))
+
+    def to_track(self):
+        """ Creates a `tracktotrip.Track`
+
+        Returns:
+            :obj:`tracktotrip.Track`
+        """
+        track = Track(self.name, [segment.to_segment() for segment in self.segments])
+        track.meta = list(self.meta)
+        return track
+
+    @property
+    def nbytes(self):
+        """ Memory used by the points, in bytes
+        """
+        return sum([segment.nbytes for segment in self.segments])
+
+    def __len__(self):
+        return sum([len(segment) for segment in self.segments])
@@ -1,13 +1,40 @@
 """
 Database related functions
 """
+import os
+import time
 import datetime
+import threading
 import ppygis
 import psycopg2
-from psycopg2.extensions import AsIs, adapt, register_adapter
+from psycopg2.pool import ThreadedConnectionPool
+from psycopg2.extensions import register_adapter
 from tracktotrip import Segment, Point
 from tracktotrip.location import update_location_centroid
 from .life import Life
+from . import ewkb
+
+class GeographyAdapter(object):
+    """ Adapts binary EWKB to a geography, to use with `psycopg` methods
+
+    The EWKB is sent as a bytea parameter, see `psycopg2.Binary`
+
+    Args:
+        data (str): Binary EWKB
+    """
+    def __init__(self, data):
+        self.binary = psycopg2.Binary(data)
+
+    def prepare(self, conn):
+        """ Prepares the binary parameter for a connection, so it's hex encoded
+
+        Args:
+            conn (:obj:`psycopg2.connection`)
+        """
+        self.binary.prepare(conn)
+
+    def getquoted(self):
+        return 'ST_GeogFromWKB(%s)' % self.binary.getquoted()
 
 def adapt_point(point):
     """ Adapts a `tracktotrip.Point` to use with `psycopg` methods
@@ -15,8 +42,7 @@ def adapt_point(point):
     Params:
         points (:obj:`tracktotrip.Point`)
     """
-    point = ppygis.Point(point.lon, point.lat, 0, srid=4326)
-    return AsIs(adapt(point.write_ewkb()).getquoted())
+    return GeographyAdapter(ewkb.write_point(point.lat, point.lon))
 
 def to_point(gis_point, time=None):
     """ Creates from raw ppygis representation
@@ -28,8 +54,8 @@ def to_point(gis_point, time=None):
     Returns:
         :obj:`tracktotrip.Point`
     """
-    gis_point = ppygis.Geometry.read_ewkb(gis_point)
-    return Point(gis_point.y, gis_point.x, time)
+    lats, lons = ewkb.read_coordinates(gis_point)
+    return Point(float(lats[0]), float(lons[0]), time)
 
 def to_segment(gis_points, timestamps=None):
     """ Creates from raw ppygis representation
@@ -41,12 +67,34 @@ def to_segment(gis_points, timestamps=None):
     Returns:
         :obj:`tracktotrip.Segment`
     """
-    gis_points = ppygis.Geometry.read_ewkb(gis_points).points
-    result = []
-    for i, point in enumerate(gis_points):
-        tmstmp = timestamps[i] if timestamps is not None else None
-        result.append(Point(point.y, point.x, tmstmp))
-    return Segment(result)
+    lats, lons = ewkb.read_coordinates(gis_points)
+    if timestamps is None:
+        timestamps = [None] * len(lats)
+    return Segment([
+        Point(lat, lon, tmstmp)
+        for lat, lon, tmstmp in zip(lats.tolist(), lons.tolist(), timestamps)
+    ])
+
+def to_segment_json(gis_points, timestamps=None):
+    """ Creates the JSON representation of a segment from raw ppygis representation
+
+    Same as `to_segment(gis_points, timestamps).to_json()`, without creating
+    `tracktotrip.Point`s
+
+    Args:
+        gis_points
+        timestamps (:obj:`list` of :obj:`datatime.datetime`, optional): timestamps to use
+            Defaults to none (all points will have empty timestamps)
+    Returns:
+        :obj:`dict`: See `tracktotrip.Segment.to_json`
+    """
+    lats, lons = ewkb.read_coordinates(gis_points)
+    return {
+        'points': ewkb.to_json_points(lats, lons, timestamps),
+        'transportationModes': [],
+        'locationFrom': None,
+        'locationTo': None
+    }
 
 def adapt_segment(segment):
     """ Adapts a `tracktotrip.Segment` to use with `psycopg` methods
@@ -54,13 +102,95 @@ def adapt_segment(segment):
     Args:
         segment (:obj:`tracktotrip.Segment`)
     """
-    points = [ppygis.Point(p.lon, p.lat, 0, srid=4326) for p in segment.points]
-    return AsIs(adapt(ppygis.LineString(points).write_ewkb()).getquoted())
+    return GeographyAdapter(ewkb.write_linestring(segment.points))
 
 
 register_adapter(Point, adapt_point)
 register_adapter(Segment, adapt_segment)
 
+# Functions to call when rows of a table change, by table. See `on_change`
+LISTENERS = {}
+# Changes not committed yet, by connection. See `changed`
+PENDING_CHANGES = {}
+PENDING_LOCK = threading.Lock()
+
+def on_change(table, listener):
+    """ Registers a function to call when rows of a table change
+
+    Listeners are called after the changes are committed, so they can
+    read them
+
+    Args:
+        table (str): Name of the table
+        listener: Function with signature (bounds) -> None. Bounds are the
+            min latitude, min longitude, max latitude and max longitude of
+            the area that changed
+    Returns:
+        Function with no arguments, that removes the listener
+    """
+    LISTENERS.setdefault(table, []).append(listener)
+
+    def remove():
+        listeners = LISTENERS.get(table, [])
+        if listener in listeners:
+            listeners.remove(listener)
+    return remove
+
+def changed(cur, table, bounds):
+    """ Records that rows of a table changed, in the transaction of a cursor
+
+    The listeners of the table are notified when the transaction is
+    committed, with `notify_changes`, and the changes are discarded if
+    it's rolled back. See `take_changes`
+
+    Args:
+        cur (:obj:`psycopg2.cursor`)
+        table (str): Name of the table
+        bounds ((float, float, float, float)): Area that changed. See `on_change`
+    """
+    with PENDING_LOCK:
+        PENDING_CHANGES.setdefault(cur.connection, []).append((table, bounds))
+
+def take_changes(conn):
+    """ Removes the changes recorded in the transaction of a connection
+
+    Must be called when the transaction ends, before the connection is
+    used again
+
+    Args:
+        conn (:obj:`psycopg2.connection`)
+    Returns:
+        :obj:`list` of (str, (float, float, float, float)): Table and area
+            of each change
+    """
+    with PENDING_LOCK:
+        return PENDING_CHANGES.pop(conn, [])
+
+def notify_changes(changes):
+    """ Notifies the listeners of committed changes
+
+    Args:
+        changes (:obj:`list` of (str, (float, float, float, float))): See
+            `take_changes`
+    """
+    for table, bounds in changes:
+        # listeners may be removed meanwhile
+        for listener in list(LISTENERS.get(table, [])):
+            listener(bounds)
+
+def points_bounds(points):
+    """ Bounds of points
+
+    Args:
+        points (:obj:`list` of :obj:`tracktotrip.Point`)
+    Returns:
+        (float, float, float, float): Min latitude, min longitude, max latitude
+            and max longitude
+    """
+    lats = [point.lat for point in points]
+    lons = [point.lon for point in points]
+    return (min(lats), min(lons), max(lats), max(lons))
+
 def span_date_to_datetime(date, minutes):
     """ Converts date string and minutes to datetime
 
@@ -90,9 +220,32 @@ def life_time(point):
     time = point.time.time()
     return "%02d%02d" % (time.hour, time.minute)
 
+def life_stays(life):
+    """ Gets the stays of a LIFE file
+
+    Args:
+        life (:obj:`Life`)
+    Returns:
+        :obj:`list` of (str, :obj:`datetime.datetime`, :obj:`datetime.datetime`):
+            Location, start and end date of each stay
+    """
+    stays = []
+    for day in life.days:
+        date = day.date
+        for span in day.spans:
+            start = span_date_to_datetime(date, span.start)
+            end = span_date_to_datetime(date, span.end)
+
+            if isinstance(span.place, str):
+                stays.append((span.place, start, end))
+    return stays
+
 def load_from_segments_annotated(cur, track, life_content, max_distance, min_samples):
     """ Uses a LIFE formated string to populate the database
 
+    Inserts the locations of the LIFE file, and of the start and end of
+    each segment, and the stays. Segments are inserted with `insert_segments`
+
     Args:
         cur (:obj:`psycopg2.cursor`)
         track (:obj:`tracktotrip.Track`)
@@ -105,6 +258,8 @@ def load_from_segments_annotated(cur, track, life_content, max_distance, min_sam
     life = Life()
     life.from_string(life_content.encode('utf8').split('\n'))
 
+    locations = LocationBatch(cur, max_distance, min_samples)
+
     def in_loc(points, i):
         point = points[i]
         print('in_loc', i, point.lat, point.lon)
@@ -112,30 +267,21 @@ def load_from_segments_annotated(cur, track, life_content, max_distance, min_sam
         print('location', location)
         if location is not None:
             if isinstance(location, basestring):
-                insert_location(cur, location, point, max_distance, min_samples)
+                locations.add(location, point)
             else:
                 for loc in location:
-                    insert_location(cur, loc, point, max_distance, min_samples)
+                    locations.add(loc, point)
 
     for segment in track.segments:
         in_loc(segment.points, 0)
         in_loc(segment.points, -1)
-        # find trip
-        insert_segment(cur, segment, max_distance, min_samples)
-
-    # Insert stays
-    for day in life.days:
-        date = day.date
-        for span in day.spans:
-            start = span_date_to_datetime(date, span.start)
-            end = span_date_to_datetime(date, span.end)
 
-            if isinstance(span.place, str):
-                insert_stay(cur, span.place, start, end)
+    insert_stays(cur, life_stays(life))
 
     # Insert canonical places
     for place, (lat, lon) in life.locations.items():
-        insert_location(cur, place, Point(lat, lon, None), max_distance, min_samples)
+        locations.add(place, Point(lat, lon, None))
+    locations.flush()
 
 
 def load_from_life(cur, content, max_distance, min_samples):
@@ -153,18 +299,12 @@ def load_from_life(cur, content, max_distance, min_samples):
     life.from_string(content.encode('utf8').split('\n'))
 
     # Insert canonical places
+    locations = LocationBatch(cur, max_distance, min_samples)
     for place, (lat, lon) in life.locations.items():
-        insert_location(cur, place, Point(lat, lon, None), max_distance, min_samples)
+        locations.add(place, Point(lat, lon, None))
+    locations.flush()
 
-    # Insert stays
-    for day in life.days:
-        date = day.date
-        for span in day.spans:
-            start = span_date_to_datetime(date, span.start)
-            end = span_date_to_datetime(date, span.end)
-
-            if isinstance(span.place, str):
-                insert_stay(cur, span.place, start, end)
+    insert_stays(cur, life_stays(life))
 
 
 def connect_db(host, name, user, port, password):
@@ -200,13 +340,206 @@ def dispose(conn, cur):
         cur (:obj:`psycopg2.cursor`): Cursor
     """
     if conn:
-        conn.commit()
+        try:
+            conn.commit()
+        except psycopg2.Error:
+            take_changes(conn)
+            raise
+        notify_changes(take_changes(conn))
         if cur:
             cur.close()
         conn.close()
     elif cur:
         cur.close()
 
+class ConnectionPool(object):
+    """ Pool of database connections, safe to use from multiple threads
+
+    A thread gets the same connection until it releases it as many times as
+    it got it. When all connections are in use, threads wait for one to be
+    released. Connections of threads that ended without releasing them are
+    rolled back and reused. Connections idle for some time are checked
+    before being used, and replaced if they're broken. Connections aren't
+    shared with forked processes, which create their own. Closing the pool
+    closes the connections in use when they're released.
+
+    Attributes:
+        min_size (int): Connections kept open
+        max_size (int): Maximum number of connections
+        check_after (float): Time, in seconds, that a connection can be idle
+            before being checked
+        params (:obj:`dict`): Arguments to `psycopg2.connect`
+    """
+    def __init__(self, min_size, max_size, check_after=30, **params):
+        self.min_size = min_size
+        self.max_size = max(min_size, max_size, 1)
+        self.check_after = check_after
+        self.params = params
+        self.condition = threading.Condition()
+        self.pid = None
+        self.pool = None
+        self.held = {}
+        self.last_used = {}
+        self.closed = False
+
+    def ensure_process(self):
+        """ Creates the connections of the current process, if needed
+        """
+        if self.pid != os.getpid():
+            # connections of the parent process are left to it
+            self.pool = ThreadedConnectionPool(self.min_size, self.max_size, **self.params)
+            self.pid = os.getpid()
+            self.held = {}
+            self.last_used = {}
+
+    def reclaim(self):
+        """ Returns the connections of threads that ended to the pool
+        """
+        for thread, (conn, _) in self.held.items():
+            if not thread.is_alive():
+                del self.held[thread]
+                self.put_back(conn, rollback=True)
+
+    def put_back(self, conn, rollback=False):
+        """ Returns a connection to the pool
+
+        Args:
+            conn (:obj:`psycopg2.connection`)
+            rollback (bool, optional): Rolls back the current transaction,
+                instead of committing it. Defaults to False
+        Returns:
+            :obj:`list`: Changes committed, see `take_changes`. They must be
+                notified, with `notify_changes`, once the pool is unlocked
+        """
+        try:
+            if rollback:
+                conn.rollback()
+            else:
+                conn.commit()
+            # taken before the connection can be got by another thread
+            changes = take_changes(conn)
+            self.last_used[id(conn)] = time.time()
+            self.pool.putconn(conn)
+            return [] if rollback else changes
+        except psycopg2.Error:
+            take_changes(conn)
+            self.last_used.pop(id(conn), None)
+            self.pool.putconn(conn, close=True)
+            if rollback:
+                return []
+            raise
+        finally:
+            self.close_unused()
+            self.condition.notify()
+
+    def close_unused(self):
+        """ Closes all connections, if the pool is closed and none is in use
+        """
+        if self.closed and len(self.held) == 0 and self.pool is not None:
+            self.pool.closeall()
+            self.pool = None
+
+    def healthy(self, conn):
+        """ Checks if a connection can be used
+
+        Args:
+            conn (:obj:`psycopg2.connection`)
+        Returns:
+            bool
+        """
+        if conn.closed:
+            return False
+        last_used = self.last_used.get(id(conn))
+        # new connections weren't used yet
+        if last_used is None or time.time() - last_used < self.check_after:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute('SELECT 1')
+            cur.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def connect(self):
+        """ Gets a connection for the current thread
+
+        Must be released with `release`
+
+        Returns:
+            :obj:`psycopg2.connection`
+        """
+        thread = threading.current_thread()
+        with self.condition:
+            if self.closed:
+                raise psycopg2.InterfaceError('connection pool is closed')
+            self.ensure_process()
+            if thread in self.held:
+                conn, count = self.held[thread]
+                self.held[thread] = (conn, count + 1)
+                return conn
+
+            self.reclaim()
+            while len(self.held) >= self.max_size:
+                # threads that end without releasing don't notify
+                self.condition.wait(1.0)
+                self.reclaim()
+
+            conn = self.pool.getconn()
+            # idle connections may all be broken, after a database restart
+            for _ in range(self.max_size):
+                if self.healthy(conn):
+                    break
+                self.last_used.pop(id(conn), None)
+                self.pool.putconn(conn, close=True)
+                conn = self.pool.getconn()
+            self.held[thread] = (conn, 1)
+            return conn
+
+    def release(self, conn, rollback=False):
+        """ Releases a connection of the current thread
+
+        The transaction is committed, or rolled back, when the connection is
+        released as many times as it was got. Then the listeners of the
+        committed changes are notified, see `changed`
+
+        Args:
+            conn (:obj:`psycopg2.connection`)
+            rollback (bool, optional): Rolls back the current transaction,
+                instead of committing it. Defaults to False
+        Returns:
+            bool: True if the connection was returned to the pool
+        """
+        thread = threading.current_thread()
+        with self.condition:
+            held, count = self.held.get(thread, (None, 0))
+            if held is not conn or self.pid != os.getpid():
+                return False
+            if count > 1:
+                self.held[thread] = (conn, count - 1)
+                return False
+            del self.held[thread]
+            changes = self.put_back(conn, rollback)
+        notify_changes(changes)
+        return True
+
+    def close(self):
+        """ Closes all connections
+
+        Connections in use are closed once they're released, so threads
+        that hold them can finish their transactions. The pool can't be
+        used to get connections anymore
+        """
+        with self.condition:
+            self.closed = True
+            if self.pid != os.getpid():
+                # connections of the parent process are left to it
+                self.pool = None
+                return
+            self.reclaim()
+            self.close_unused()
+
 
 def gis_bounds(bound):
     """ Converts bounds to its representation
@@ -233,7 +566,7 @@ def insert_location(cur, label, point, max_distance, min_samples):
     """
 
     label = unicode(label, 'utf-8')
-    print 'Inserting location %s, %f, %f' % (label, point.lat, point.lon)
+    print 'Inserting location %s, %f, %f' % (label.encode('utf-8'), point.lat, point.lon)
 
     cur.execute("""
             SELECT location_id, label, centroid, point_cluster
@@ -248,6 +581,7 @@ def insert_location(cur, label, point, max_distance, min_samples):
         point_cluster = to_segment(point_cluster).points
 
         # print 'Previous point %s, cluster %s' % (point, [p.to_json() for p in point_cluster])
+        previous_centroid = centroid
         centroid, point_cluster = update_location_centroid(
             point,
             point_cluster,
@@ -262,6 +596,7 @@ def insert_location(cur, label, point, max_distance, min_samples):
                 SET centroid=%s, point_cluster=%s
                 WHERE location_id=%s
                 """, (centroid, Segment(point_cluster), location_id))
+        changed(cur, 'locations', points_bounds([previous_centroid, centroid]))
     else:
         # print 'New location'
         # Creates new location
@@ -269,32 +604,183 @@ def insert_location(cur, label, point, max_distance, min_samples):
                 INSERT INTO locations (label, centroid, point_cluster)
                 VALUES (%s, %s, %s)
                 """, (label, point, Segment([point])))
+        changed(cur, 'locations', points_bounds([point]))
 
-def insert_transportation_mode(cur, tmode, trip_id, segment):
-    """ Inserts transportation mode in the database
+class LocationBatch(object):
+    """ Location observations, written at once
+
+    Like calling `insert_location` for each observation, but each location
+    is read and written only once. Locations of all observed labels are
+    read with one query, observations are merged in memory, and `flush`
+    writes the changed locations with one statement, and the new ones with
+    another.
+
+    Attributes:
+        max_distance (float): Max location distance. See
+            `tracktotrip.location.update_location_centroid`
+        min_samples (float): Minimum samples requires for location.  See
+            `tracktotrip.location.update_location_centroid`
+        observations (:obj:`list` of (unicode, :obj:`tracktotrip.Point`)):
+            Observations, in order, waiting to be written
+    """
+    def __init__(self, cur, max_distance, min_samples):
+        self.cur = cur
+        self.max_distance = max_distance
+        self.min_samples = min_samples
+        self.observations = []
+
+    def add(self, label, point):
+        """ Adds an observation of a location
+
+        Args:
+            label (str): Location's name
+            point (:obj:`Point`): Position marked with the label
+        """
+        if not isinstance(label, unicode):
+            label = unicode(label, 'utf-8')
+        self.observations.append((label, point))
+
+    def flush(self):
+        """ Writes the observations to the database
+        """
+        if len(self.observations) == 0:
+            return
+        cur = self.cur
+
+        cur.execute("""
+            SELECT location_id, label, centroid, point_cluster
+            FROM locations
+            WHERE label = ANY(%s)
+            """, (list(set([label for label, _ in self.observations])), ))
+        locations = {}
+        for location_id, label, centroid, point_cluster in cur.fetchall():
+            if not isinstance(label, unicode):
+                label = unicode(label, 'utf-8')
+            centroid = to_point(centroid)
+            locations.setdefault(label, []).append({
+                'id': location_id,
+                'label': label,
+                'centroid': centroid,
+                'cluster': to_segment(point_cluster).points,
+                'previous': centroid
+            })
+
+        changes = []
+        for label, point in self.observations:
+            print 'Inserting location %s, %f, %f' % (label.encode('utf-8'), point.lat, point.lon)
+            if label not in locations:
+                location = {
+                    'id': None,
+                    'label': label,
+                    'centroid': point,
+                    'cluster': [point],
+                    'previous': point
+                }
+                locations[label] = [location]
+                changes.append(location)
+                continue
+
+            # merges with the closest location with the same label
+            location = min(locations[label], key=lambda loc: loc['centroid'].distance(point))
+            location['centroid'], location['cluster'] = update_location_centroid(
+                point,
+                location['cluster'],
+                self.max_distance,
+                self.min_samples
+            )
+            if not any([location is change for change in changes]):
+                changes.append(location)
+
+        updated = [location for location in changes if location['id'] is not None]
+        if len(updated) > 0:
+            values = ','.join([
+                cur.mogrify('(%s, %s, %s)', (
+                    location['id'],
+                    location['centroid'],
+                    Segment(location['cluster'])
+                ))
+                for location in updated
+            ])
+            cur.execute("""
+                UPDATE locations
+                SET centroid=changes.centroid::geography,
+                    point_cluster=changes.point_cluster::geography
+                FROM (VALUES %s) AS changes (location_id, centroid, point_cluster)
+                WHERE locations.location_id=changes.location_id
+                """ % values)
+
+        insert_rows(
+            cur,
+            'INSERT INTO locations (label, centroid, point_cluster)',
+            '(%s, %s, %s)',
+            [
+                (location['label'], location['centroid'], Segment(location['cluster']))
+                for location in changes if location['id'] is None
+            ]
+        )
+
+        for location in changes:
+            changed(cur, 'locations', points_bounds([location['previous'], location['centroid']]))
+        self.observations = []
+
+def transportation_mode_row(tmode, trip_id, segment):
+    """ Values of a transportation mode, to insert in the database
 
     Args:
-        cur (:obj:`psycopg2.cursor`)
         tmode (:obj:`dict`): transportation mode, with keys: label, from and to
         trip_id (int): Id of the trip that generated the current tranportation mode
         segment (:obj:`tracktotrip.Segment`): Segment that generated the current transportation mode
+    Returns:
+        tuple: Values of the trip_id, label, start_date, end_date, start_index,
+            end_index and bounds columns
     """
     label = tmode['label']
     from_index = tmode['from']
     to_index = tmode['to']
 
+    return (
+        trip_id,
+        label,
+        segment.points[from_index].time,
+        segment.points[to_index].time,
+        from_index,
+        to_index,
+        gis_bounds(segment.bounds(from_index, to_index))
+    )
+
+def insert_transportation_mode(cur, tmode, trip_id, segment):
+    """ Inserts transportation mode in the database
+
+    Args:
+        cur (:obj:`psycopg2.cursor`)
+        tmode (:obj:`dict`): transportation mode, with keys: label, from and to
+        trip_id (int): Id of the trip that generated the current tranportation mode
+        segment (:obj:`tracktotrip.Segment`): Segment that generated the current transportation mode
+    """
     cur.execute("""
             INSERT INTO trips_transportation_modes(trip_id, label, start_date, end_date, start_index, end_index, bounds)
             VALUES (%s, %s, %s, %s, %s, %s, %s)
-            """, (
-                trip_id,
-                label,
-                segment.points[from_index].time,
-                segment.points[to_index].time,
-                from_index,
-                to_index,
-                gis_bounds(segment.bounds(from_index, to_index))
-            ))
+            """, transportation_mode_row(tmode, trip_id, segment))
+
+def insert_rows(cur, statement, template, rows, returning=''):
+    """ Inserts many rows with a single statement
+
+    Args:
+        cur (:obj:`psycopg2.cursor`)
+        statement (str): Insert statement, up to the VALUES keyword
+        template (str): Placeholders of a row, such as (%s, %s)
+        rows (:obj:`list` of tuple): Values of each row
+        returning (str, optional): RETURNING clause. Defaults to none
+    Returns:
+        :obj:`list` of tuple: Returned rows, in the same order as the
+            inserted rows. Empty if there's no RETURNING clause
+    """
+    if len(rows) == 0:
+        return []
+    values = ','.join([cur.mogrify(template, row) for row in rows])
+    # without parameters, % in the values isn't interpreted by psycopg
+    cur.execute('%s VALUES %s %s' % (statement, values, returning))
+    return cur.fetchall() if returning else []
 
 def insert_stay(cur, label, start_date, end_date):
     """ Inserts stay in the database
@@ -324,41 +810,91 @@ def insert_segment(cur, segment, max_distance, min_samples):
     Returns:
         int: Segment id
     """
-    # insert_location(cur, segment.location_from.label, segment.points[0], max_distance, min_samples)
-    # insert_location(cur, segment.location_to.label, segment.points[-1], max_distance, min_samples)
+    return insert_segments(cur, [segment])[0]
 
-    # def toTsmp(d):
-    #     return psycopg2.Timestamp(d.year, d.month, d.day, d.hour, d.minute, d.second)
+def segment_row(segment):
+    """ Values of a segment, to insert in the database
 
-    tstamps = [p.time for p in segment.points]
+    Args:
+        segment (:obj:`tracktotrip.Segment`)
+    Returns:
+        tuple: Values of the start_date, end_date, bounds, points and
+            timestamps columns
+    """
+    return (
+        segment.points[0].time,
+        segment.points[-1].time,
+        gis_bounds(segment.bounds()),
+        segment,
+        [p.time for p in segment.points]
+    )
 
-    cur.execute("""
-            INSERT INTO trips (start_date, end_date, bounds, points, timestamps)
-            VALUES (%s, %s, %s, %s, %s)
-            RETURNING trip_id
-            """, (
-                segment.points[0].time,
-                segment.points[-1].time,
-                gis_bounds(segment.bounds()),
-                segment,
-                tstamps
-            ))
-    trip_id = cur.fetchone()
-    trip_id = trip_id[0]
-
-    for tmode in segment.transportation_modes:
-        insert_transportation_mode(cur, tmode, trip_id, segment)
-
-    return trip_id
-
-def match_canonical_trip(cur, trip, distance):
+def insert_segments(cur, segments):
+    """ Inserts segments, and their transportation modes, in the database
+
+    Uses one statement for all segments, and another for all transportation
+    modes
+
+    Args:
+        cur (:obj:`psycopg2.cursor`)
+        segments (:obj:`list` of :obj:`tracktotrip.Segment`)
+    Returns:
+        :obj:`list` of int: Trip id of each segment
+    """
+    # rows of a multi-row insert are returned in the order they're given
+    trip_ids = [row[0] for row in insert_rows(
+        cur,
+        'INSERT INTO trips (start_date, end_date, bounds, points, timestamps)',
+        '(%s, %s, %s, %s, %s)',
+        [segment_row(segment) for segment in segments],
+        'RETURNING trip_id'
+    )]
+
+    insert_rows(
+        cur,
+        'INSERT INTO trips_transportation_modes' \
+        '(trip_id, label, start_date, end_date, start_index, end_index, bounds)',
+        '(%s, %s, %s, %s, %s, %s, %s)',
+        [
+            transportation_mode_row(tmode, trip_id, segment)
+            for trip_id, segment in zip(trip_ids, segments)
+            for tmode in segment.transportation_modes
+        ]
+    )
+
+    for segment in segments:
+        changed(cur, 'trips', points_bounds(segment.points))
+
+    return trip_ids
+
+def insert_stays(cur, stays):
+    """ Inserts stays in the database, with a single statement
+
+    Args:
+        cur (:obj:`psycopg2.cursor`)
+        stays (:obj:`list` of (str, :obj:`datetime.datetime`, :obj:`datetime.datetime`)):
+            Location, start and end date of each stay
+    """
+    insert_rows(
+        cur,
+        'INSERT INTO stays(location_label, start_date, end_date)',
+        '(%s, %s, %s)',
+        stays
+    )
+
+def match_canonical_trip(cur, trip, distance, index=None):
     """ Queries database for canonical trips with bounding boxes that intersect the bounding
         box of the given trip
 
     Args:
         cur (:obj:`psycopg2.cursor`)
         trip (:obj:`tracktotrip.Segment`): Trip to match
+        index (:obj:`canonical_index.CanonicalTripsIndex`, optional): Index
+            to find the canonical trips with. Defaults to None, to query them
     """
+    if index is not None:
+        return index.match(cur, trip, distance)
+
     cur.execute("""
         SELECT canonical_id, points FROM canonical_trips WHERE bounds && ST_MakeEnvelope(%s, %s, %s, %s, 4326)
         """ % trip.bounds(thr=distance))
@@ -399,7 +935,57 @@ def match_canonical_trip_bounds(cur, bounds):
 
     return can_trips
 
-def insert_canonical_trip(cur, can_trip, mother_trip_id):
+# Zoom levels with simplified canonical trips, in canonical_trips_lod. Above
+# the last one, the full geometry is used
+LOD_ZOOMS = [4, 6, 8, 10, 12, 14, 16]
+
+def lod_tolerance(zoom):
+    """ Simplification tolerance of a zoom level, the size of one pixel
+
+    Args:
+        zoom (int): Zoom level, of 256 pixels tiles
+    Returns:
+        float: Tolerance, in degrees
+    """
+    return 360.0 / (256 * 2 ** zoom)
+
+def lod_zoom(zoom):
+    """ Gets the zoom level with simplified canonical trips to use for a zoom
+
+    Args:
+        zoom (int)
+    Returns:
+        int: Highest level of `LOD_ZOOMS` not above the zoom. None if the
+            full geometries should be used
+    """
+    if zoom is None or zoom > LOD_ZOOMS[-1]:
+        return None
+    return max([LOD_ZOOMS[0]] + [level for level in LOD_ZOOMS if level <= zoom])
+
+def update_canonical_lod(cur, can_ids):
+    """ Computes the simplified geometries of canonical trips, for each zoom level
+
+    See `LOD_ZOOMS`
+
+    Args:
+        cur (:obj:`psycopg2.cursor`)
+        can_ids (:obj:`list` of int): Ids of the canonical trips
+    """
+    if len(can_ids) == 0:
+        return
+    cur.execute("""
+        DELETE FROM canonical_trips_lod WHERE canonical_id = ANY(%s)
+        """, (can_ids, ))
+    levels = ','.join([cur.mogrify('(%s, %s)', (zoom, lod_tolerance(zoom))) for zoom in LOD_ZOOMS])
+    cur.execute("""
+        INSERT INTO canonical_trips_lod (canonical_id, zoom, points)
+        SELECT can.canonical_id, levels.zoom,
+            COALESCE(ST_Simplify(can.points::geometry, levels.tolerance), can.points::geometry)::geography
+        FROM canonical_trips AS can, (VALUES %s) AS levels (zoom, tolerance)
+        WHERE can.canonical_id = ANY(%%s)
+        """ % levels, (can_ids, ))
+
+def insert_canonical_trip(cur, can_trip, mother_trip_id, index=None):
     """ Inserts a new canonical trip into the database
 
     It also creates a relation between the trip that originated
@@ -409,6 +995,8 @@ def insert_canonical_trip(cur, can_trip, mother_trip_id):
         cur (:obj:`psycopg2.cursor`)
         can_trip (:obj:`tracktotrip.Segment`): Canonical trip
         mother_trip_id (int): Id of the trip that originated the canonical representation
+        index (:obj:`canonical_index.CanonicalTripsIndex`, optional): Index to
+            add the canonical trip to. Defaults to None
     Returns:
         int: Canonical trip id
     """
@@ -429,9 +1017,15 @@ def insert_canonical_trip(cur, can_trip, mother_trip_id):
         VALUES (%s, %s)
         """, (c_trip_id, mother_trip_id))
 
+    update_canonical_lod(cur, [c_trip_id])
+    changed(cur, 'canonical_trips', points_bounds(can_trip.points))
+
+    if index is not None:
+        index.put(c_trip_id, can_trip)
+
     return c_trip_id
 
-def update_canonical_trip(cur, can_id, trip, mother_trip_id):
+def update_canonical_trip(cur, can_id, trip, mother_trip_id, index=None):
     """ Updates a canonical trip
 
     Args:
@@ -439,8 +1033,17 @@ def update_canonical_trip(cur, can_id, trip, mother_trip_id):
         can_id (int): canonical trip id to update
         trip (:obj:`tracktotrip.Segment): canonical trip
         mother_trip_id (int): Id of trip that caused the update
+        index (:obj:`canonical_index.CanonicalTripsIndex`, optional): Index to
+            update the canonical trip in. Defaults to None
     """
 
+    cur.execute("""
+        SELECT ST_XMin(bounds::geometry), ST_YMin(bounds::geometry),
+            ST_XMax(bounds::geometry), ST_YMax(bounds::geometry)
+        FROM canonical_trips WHERE canonical_id=%s
+        """, (can_id, ))
+    previous_bounds = cur.fetchone()
+
     cur.execute("""
         UPDATE canonical_trips
         SET bounds=%s, points=%s
@@ -452,6 +1055,178 @@ def update_canonical_trip(cur, can_id, trip, mother_trip_id):
         VALUES (%s, %s)
         """, (can_id, mother_trip_id))
 
+    update_canonical_lod(cur, [can_id])
+    if previous_bounds is not None:
+        changed(cur, 'canonical_trips', previous_bounds)
+    changed(cur, 'canonical_trips', points_bounds(trip.points))
+
+    if index is not None:
+        index.put(can_id, trip)
+
+def bounds_intersect(bounds, other):
+    """ Checks if two bounds intersect
+
+    Args:
+        bounds ((float, float, float, float)): Min latitude, min longitude,
+            max latitude and max longitude
+        other ((float, float, float, float)): Same as bounds
+    Returns:
+        bool
+    """
+    return bounds[0] <= other[2] and other[0] <= bounds[2] and \
+        bounds[1] <= other[3] and other[1] <= bounds[3]
+
+class CanonicalTripsBatch(object):
+    """ Learns canonical trips from many trips, writing the changes at once
+
+    Canonical trips that may match any of the trips are read with one query,
+    or from a `canonical_index.CanonicalTripsIndex`, that's updated on `flush`.
+    Changes are kept in memory, so later trips are matched against them,
+    and written by `flush`, with one statement for new canonical trips,
+    one for the updated ones, and one for the relations.
+
+    Attributes:
+        trips (:obj:`dict` of int: :obj:`tracktotrip.Segment`): Canonical trips,
+            by id. New canonical trips have negative ids until `flush`
+        inserted (:obj:`list` of int): Ids of new canonical trips
+        updated (:obj:`set` of int): Ids of updated canonical trips
+        relations (:obj:`list` of (int, int)): Canonical trip id and trip id
+        index (:obj:`canonical_index.CanonicalTripsIndex`): None to query the
+            database
+        previous_bounds (:obj:`dict` of int: (float, float, float, float)):
+            Bounds of the canonical trips when they were last written, see
+            `changed`
+    """
+    def __init__(self, cur, segments, distance, index=None):
+        self.cur = cur
+        self.index = index
+        self.trips = {}
+        self.inserted = []
+        self.updated = set()
+        self.relations = []
+
+        envelopes = [segment.bounds(thr=distance) for segment in segments]
+        if index is not None:
+            candidates = set()
+            for envelope in envelopes:
+                candidates.update(index.candidates(cur, envelope))
+            self.trips = index.get(cur, sorted(candidates))
+        elif len(envelopes) > 0:
+            cur.execute(
+                'SELECT canonical_id, points FROM canonical_trips WHERE ' +
+                ' OR '.join(['bounds && ST_MakeEnvelope(%s, %s, %s, %s, 4326)'] * len(envelopes)),
+                [value for envelope in envelopes for value in envelope]
+            )
+            for canonical_id, points in cur.fetchall():
+                self.trips[canonical_id] = to_segment(points)
+
+        # canonical trips are changed in place, see `tracktotrip.learn_trip`
+        self.previous_bounds = dict([
+            (canonical_id, points_bounds(trip.points))
+            for canonical_id, trip in self.trips.items()
+        ])
+
+    def match(self, trip, distance):
+        """ Gets the canonical trips with bounds that intersect the bounds of a trip
+
+        See `match_canonical_trip`
+
+        Args:
+            trip (:obj:`tracktotrip.Segment`)
+            distance (float): Distance, in degrees, to extend the bounds of the trip
+        Returns:
+            :obj:`list` of (int, :obj:`tracktotrip.Segment`)
+        """
+        bounds = trip.bounds(thr=distance)
+        return [
+            (canonical_id, can_trip) for canonical_id, can_trip in sorted(self.trips.items())
+            if bounds_intersect(bounds, can_trip.bounds())
+        ]
+
+    def insert(self, can_trip, mother_trip_id):
+        """ Adds a new canonical trip
+
+        See `insert_canonical_trip`
+
+        Args:
+            can_trip (:obj:`tracktotrip.Segment`): Canonical trip
+            mother_trip_id (int): Id of the trip that originated the canonical representation
+        """
+        canonical_id = -(len(self.inserted) + 1)
+        self.trips[canonical_id] = Segment(can_trip.points)
+        self.inserted.append(canonical_id)
+        self.relations.append((canonical_id, mother_trip_id))
+
+    def update(self, can_id, trip, mother_trip_id):
+        """ Updates a canonical trip
+
+        See `update_canonical_trip`
+
+        Args:
+            can_id (int): canonical trip id to update
+            trip (:obj:`tracktotrip.Segment): canonical trip
+            mother_trip_id (int): Id of trip that caused the update
+        """
+        self.trips[can_id] = trip
+        if can_id > 0:
+            self.updated.add(can_id)
+        self.relations.append((can_id, mother_trip_id))
+
+    def flush(self):
+        """ Writes the changes to the database
+        """
+        cur = self.cur
+        # rows of a multi-row insert are returned in the order they're given
+        ids = dict(zip(self.inserted, [row[0] for row in insert_rows(
+            cur,
+            'INSERT INTO canonical_trips (bounds, points)',
+            '(%s, %s)',
+            [
+                (gis_bounds(self.trips[can_id].bounds()), self.trips[can_id])
+                for can_id in self.inserted
+            ],
+            'RETURNING canonical_id'
+        )]))
+
+        if len(self.updated) > 0:
+            values = ','.join([
+                cur.mogrify('(%s, %s, %s)', (
+                    can_id,
+                    gis_bounds(self.trips[can_id].bounds()),
+                    self.trips[can_id]
+                ))
+                for can_id in sorted(self.updated)
+            ])
+            cur.execute("""
+                UPDATE canonical_trips
+                SET bounds=changes.bounds::geography, points=changes.points::geography
+                FROM (VALUES %s) AS changes (canonical_id, bounds, points)
+                WHERE canonical_trips.canonical_id=changes.canonical_id
+                """ % values)
+
+        insert_rows(
+            cur,
+            'INSERT INTO canonical_trips_relations (canonical_trip, trip)',
+            '(%s, %s)',
+            [(ids.get(can_id, can_id), trip_id) for can_id, trip_id in self.relations]
+        )
+
+        written = [ids[can_id] for can_id in self.inserted] + sorted(self.updated)
+        update_canonical_lod(cur, written)
+
+        for can_id in self.inserted:
+            self.trips[ids[can_id]] = self.trips.pop(can_id)
+        for can_id in self.updated:
+            changed(cur, 'canonical_trips', self.previous_bounds[can_id])
+        for can_id in written:
+            self.previous_bounds[can_id] = points_bounds(self.trips[can_id].points)
+            changed(cur, 'canonical_trips', self.previous_bounds[can_id])
+            if self.index is not None:
+                self.index.put(can_id, self.trips[can_id])
+        self.inserted = []
+        self.updated = set()
+        self.relations = []
+
 def query_locations(cur, lat, lon, radius):
     """ Queries the database for location around a point location
 
@@ -484,28 +1259,153 @@ def query_locations(cur, lat, lon, radius):
     print a
     return a
 
-def get_canonical_trips(cur):
+def get_canonical_trips(cur, as_json=False):
     """ Gets canonical trips
 
     Args:
         cur (:obj:`psycopg2.cursor`)
+        as_json (bool, optional): Gets the JSON representation of the points,
+            see `to_segment_json`, instead of a `tracktotrip.Segment`. Defaults
+            to False
     Returns:
         :obj:`list` of :obj:`dict`:
             [{ 'id': 1, 'points': <tracktotrip.Segment> }, ...]
     """
+    convert = to_segment_json if as_json else to_segment
     cur.execute("SELECT canonical_id, points FROM canonical_trips")
     trips = cur.fetchall()
-    return [{'id': t[0], 'points': to_segment(t[1])} for t in trips]
+    return [{'id': t[0], 'points': convert(t[1])} for t in trips]
+
+def get_canonical_trips_page(cur, bbox=None, zoom=None, cursor=None, limit=100):
+    """ Gets a page of canonical trips, in a viewport, simplified for a zoom level
+
+    Canonical trips are ordered by id, and each page starts after the last
+    id of the previous one
+
+    Args:
+        cur (:obj:`psycopg2.cursor`)
+        bbox ((float, float, float, float), optional): Min latitude, min
+            longitude, max latitude and max longitude of the viewport.
+            Defaults to None, for no viewport
+        zoom (int, optional): Zoom level, see `lod_zoom`. Defaults to None,
+            for the full geometries
+        cursor (int, optional): Id of the last canonical trip of the previous
+            page. Defaults to None, for the first page
+        limit (int, optional): Max number of canonical trips. Defaults to 100
+    Returns:
+        (:obj:`list` of :obj:`dict`, int): Canonical trips, as
+            [{ 'id': 1, 'points': <see to_segment_json> }, ...], and the
+            cursor of the next page, or None if it's the last one
+    """
+    level = lod_zoom(zoom)
+    params = []
+    if level is None:
+        query = 'SELECT can.canonical_id, can.points FROM canonical_trips AS can'
+    else:
+        query = """
+            SELECT can.canonical_id, COALESCE(lod.points, can.points)
+            FROM canonical_trips AS can
+                LEFT JOIN canonical_trips_lod AS lod
+                    ON lod.canonical_id = can.canonical_id AND lod.zoom = %s
+            """
+        params.append(level)
+
+    conditions = []
+    if bbox is not None:
+        # bounds have the latitude as x, see gis_bounds
+        conditions.append('can.bounds && ST_MakeEnvelope(%s, %s, %s, %s, 4326)')
+        params.extend(bbox)
+    if cursor is not None:
+        conditions.append('can.canonical_id > %s')
+        params.append(cursor)
+    if len(conditions) > 0:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    query += ' ORDER BY can.canonical_id LIMIT %s'
+    params.append(limit + 1)
+
+    cur.execute(query, params)
+    trips = cur.fetchall()
+    next_cursor = trips[limit - 1][0] if len(trips) > limit else None
+    return [{'id': t[0], 'points': to_segment_json(t[1])} for t in trips[:limit]], next_cursor
 
-def get_canonical_locations(cur):
+def get_canonical_locations(cur, as_json=False):
     """ Gets canonical trips
 
     Args:
         cur (:obj:`psycopg2.cursor`)
+        as_json (bool, optional): Gets the JSON representation of the points,
+            see `to_segment_json`, instead of a `tracktotrip.Segment`. Defaults
+            to False
     Returns:
         :obj:`list` of :obj:`dict`:
             [{ 'id': 1, 'points': <tracktotrip.Segment> }, ...]
     """
+    convert = to_segment_json if as_json else to_segment
     cur.execute("SELECT label, point_cluster FROM locations")
     locations = cur.fetchall()
-    return [{'label': t[0], 'points': to_segment(t[1])} for t in locations]
+    return [{'label': t[0], 'points': convert(t[1])} for t in locations]
+
+def iter_location_summaries(conn, bbox=None, batch_size=1000):
+    """ Gets the label, centroid, number of samples and radius of locations
+
+    Rows are read as they're needed, with a server side cursor, so the
+    point clusters aren't sent
+
+    Args:
+        conn (:obj:`psycopg2.connection`)
+        bbox ((float, float, float, float), optional): Min latitude, min
+            longitude, max latitude and max longitude of the centroids.
+            Defaults to None, for all locations
+        batch_size (int, optional): Rows fetched at a time. Defaults to 1000
+    Yields:
+        :obj:`dict`: { 'id': 1, 'label': 'Home', 'lat': 38.7, 'lon': -9.1,
+            'samples': 12, 'radius': 15.3 }, with the radius, in meters, as
+            the distance from the centroid to the farthest sample
+    """
+    query = """
+        SELECT location_id, label,
+            ST_Y(centroid::geometry), ST_X(centroid::geometry),
+            ST_NPoints(point_cluster::geometry),
+            ST_Length(ST_LongestLine(centroid::geometry, point_cluster::geometry)::geography)
+        FROM locations
+        """
+    params = []
+    if bbox is not None:
+        # centroids have the longitude as x
+        query += ' WHERE centroid && ST_MakeEnvelope(%s, %s, %s, %s, 4326)'
+        params = [bbox[1], bbox[0], bbox[3], bbox[2]]
+    query += ' ORDER BY location_id'
+
+    cur = conn.cursor(name='location_summaries')
+    cur.itersize = batch_size
+    try:
+        cur.execute(query, params)
+        for (location_id, label, lat, lon, samples, radius) in cur:
+            yield {
+                'id': location_id,
+                'label': label,
+                'lat': lat,
+                'lon': lon,
+                'samples': samples,
+                'radius': radius
+            }
+    finally:
+        cur.close()
+
+def get_canonical_location(cur, location_id):
+    """ Gets a location, with its point cluster
+
+    Args:
+        cur (:obj:`psycopg2.cursor`)
+        location_id (int)
+    Returns:
+        :obj:`dict`: { 'id': 1, 'label': 'Home', 'points': <see to_segment_json> },
+            or None if it doesn't exist
+    """
+    cur.execute("""
+        SELECT location_id, label, point_cluster FROM locations WHERE location_id=%s
+        """, (location_id, ))
+    row = cur.fetchone()
+    if row is None:
+        return None
+    return {'id': row[0], 'label': row[1], 'points': to_segment_json(row[2])}
@@ -8,12 +8,15 @@ CONFIG = {
     'output_path': None,
     'life_path': None,
     'life_all': None,
+    'index_path': None, # defaults to .gpxindex.json, in the input path
     'db': {
         'host': None,
         'port': None,
         'name': None,
         'user': None,
-        'pass': None
+        'pass': None,
+        'pool_min': 1,
+        'pool_max': 8
     },
     'default_timezone': 1,
     'life_annotations': 'all', # all (for stays + trips), stays, trips
@@ -42,7 +45,20 @@ CONFIG = {
         'google_key': '',
         'use_foursquare': True,
         'foursquare_client_id': '',
-        'foursquare_client_secret': ''
+        'foursquare_client_secret': '',
+        'cache': {
+            'use': True,
+            'ttl': 3600, # seconds
+            'cells': 1024,
+            'cell_size': 1000 # meters
+        },
+        'places_cache': {
+            'use': True,
+            'path': None, # defaults to .places.sqlite, in the input path
+            'ttl': 30 * 24 * 60 * 60, # seconds
+            'max_entries': 100000,
+            'precision': 4 # decimal places of the coordinates
+        }
     },
     'transportation': {
         'use': True,
@@ -52,7 +68,35 @@ CONFIG = {
     },
     'trip_learning': {
         'use': True,
-        'epsilon': 0.0
+        'epsilon': 0.0,
+        'index': {
+            'use': True,
+            'max_points': 1000000 # points of the cached canonical trips
+        }
+    },
+    'canonical_trips': {
+        'page_size': 100,
+        'max_page_size': 1000
+    },
+    'tiles': {
+        'use': True,
+        'path': None, # defaults to .tiles, in the input path
+        'ttl': 24 * 60 * 60, # seconds
+        'max_zoom': 22,
+        'extent': 4096,
+        'buffer': 64
+    },
+    'cache': {
+        'tracks_memory': 256 # megabytes
+    },
+    'prefetch': {
+        'use': True,
+        'speculative': False
+    },
+    'bulk': {
+        'queue_size': 2,
+        'parallel': False,
+        'processes': None # defaults to the number of CPUs
     },
     'trip_name_format': '%Y-%m-%d'
 }
@@ -0,0 +1,293 @@
+"""
+Edit operations over tracks
+
+Edits are sent by the client instead of the whole track, each being
+a dictionary with a type and the segment it applies to:
+
+    + move: `{'type': 'move', 'segment': 0, 'point': 3, 'lat': 38.7, 'lon': -9.1}`
+    + delete: `{'type': 'delete', 'segment': 0, 'from': 3, 'to': 5}`, removes
+        points 3 to 5, inclusive. Segments without points are removed
+    + split: `{'type': 'split', 'segment': 0, 'point': 3}`, point 3 becomes
+        the last point of the segment, and the rest a new segment
+    + merge: `{'type': 'merge', 'segment': 0}`, merges segment 0 with 1
+    + relabel: `{'type': 'relabel', 'segment': 0, 'mode': 1, 'label': 'walk'}`,
+        changes the label of a transportation mode, or
+        `{'type': 'relabel', 'segment': 0, 'location': 'from', 'label': 'Home'}`
+        changes the label of the start ('from') or end ('to') location
+
+Edits are validated against the track as left by the previous edits, and
+invalid ones raise an `EditError`, see `validate_edit`
+"""
+from tracktotrip import Segment
+from tracktotrip.location import Location
+from .history import copy_segments, copy_point
+
+class EditError(ValueError):
+    """ Raised when an edit can't be applied to a track
+    """
+    pass
+
+def refresh_metrics(points, index):
+    """ Recomputes the metrics of the points affected by a change at an index
+
+    Affected points are copied, so the given points aren't changed
+
+    Args:
+        points (:obj:`list` of :obj:`tracktotrip.Point`): Points to update
+        index (int): Index of the changed point
+    """
+    if index == 0 and len(points) > 0:
+        points[0] = copy_point(points[0])
+        points[0].dt = points[0].dx = points[0].vel = points[0].acc = .0
+    for i in range(max(index, 1), min(index + 3, len(points))):
+        points[i] = copy_point(points[i]).compute_metrics(points[i - 1])
+
+def slice_modes(modes, start, end, offset=0):
+    """ Gets the transportation modes of a range of points
+
+    Args:
+        modes (:obj:`list` of :obj:`dict`): Transportation modes
+        start (int): Start index of the range
+        end (int): End index of the range, exclusive
+        offset (int, optional): Index of the start of the range in the
+            result. Defaults to 0
+    Returns:
+        :obj:`list` of :obj:`dict`: Transportation modes of the range
+    """
+    result = []
+    for mode in modes:
+        if mode['to'] >= start and mode['from'] < end:
+            mode = dict(mode)
+            mode['from'] = max(mode['from'], start) - start + offset
+            mode['to'] = min(mode['to'], end - 1) - start + offset
+            result.append(mode)
+    return result
+
+def join_modes(modes, others):
+    """ Concatenates two lists of transportation modes
+
+    Adjacent modes with the same label, at the junction, are joined
+
+    Args:
+        modes (:obj:`list` of :obj:`dict`): Transportation modes
+        others (:obj:`list` of :obj:`dict`): Transportation modes that
+            follow the ones in modes
+    Returns:
+        :obj:`list` of :obj:`dict`
+    """
+    if len(modes) > 0 and len(others) > 0 and modes[-1]['label'] == others[0]['label']:
+        joined = dict(modes[-1])
+        joined['to'] = others[0]['to']
+        return modes[:-1] + [joined] + others[1:]
+    return modes + others
+
+def move_point(segments, edit):
+    """ Changes the position of a point
+
+    Args:
+        segments (:obj:`list` of :obj:`tracktotrip.Segment`)
+        edit (:obj:`dict`)
+    """
+    segment = segments[edit['segment']]
+    index = edit['point']
+    points = list(segment.points)
+    points[index] = copy_point(points[index])
+    points[index].lat = edit['lat']
+    points[index].lon = edit['lon']
+    refresh_metrics(points, index)
+    segment.points = points
+
+def delete_points(segments, edit):
+    """ Removes a range of points
+
+    Args:
+        segments (:obj:`list` of :obj:`tracktotrip.Segment`)
+        edit (:obj:`dict`)
+    """
+    segment = segments[edit['segment']]
+    start = edit['from']
+    end = edit['to'] + 1
+    length = len(segment.points)
+    points = segment.points[:start] + segment.points[end:]
+    if len(points) == 0:
+        del segments[edit['segment']]
+        return
+
+    refresh_metrics(points, start)
+    segment.points = points
+    segment.transportation_modes = join_modes(
+        slice_modes(segment.transportation_modes, 0, start),
+        slice_modes(segment.transportation_modes, end, length, offset=start)
+    )
+
+def split_segment(segments, edit):
+    """ Splits a segment in two, after a point
+
+    Args:
+        segments (:obj:`list` of :obj:`tracktotrip.Segment`)
+        edit (:obj:`dict`)
+    """
+    index = edit['segment']
+    segment = segments[index]
+    split = edit['point'] + 1
+    length = len(segment.points)
+    if split <= 0 or split >= length:
+        return
+
+    first = Segment(segment.points[:split])
+    first.location_from = segment.location_from
+    first.transportation_modes = slice_modes(segment.transportation_modes, 0, split)
+
+    second = Segment(segment.points[split:])
+    second.location_to = segment.location_to
+    second.transportation_modes = slice_modes(segment.transportation_modes, split, length)
+    refresh_metrics(second.points, 0)
+
+    segments[index:index + 1] = [first, second]
+
+def merge_segments(segments, edit):
+    """ Merges a segment with the one after it
+
+    Args:
+        segments (:obj:`list` of :obj:`tracktotrip.Segment`)
+        edit (:obj:`dict`)
+    """
+    index = edit['segment']
+    first = segments[index]
+    second = segments[index + 1]
+    length = len(first.points)
+
+    merged = Segment(first.points + second.points)
+    merged.location_from = first.location_from
+    merged.location_to = second.location_to
+    merged.transportation_modes = join_modes(
+        slice_modes(first.transportation_modes, 0, length),
+        slice_modes(second.transportation_modes, 0, len(second.points), offset=length)
+    )
+    refresh_metrics(merged.points, length)
+
+    segments[index:index + 2] = [merged]
+
+def relabel(segments, edit):
+    """ Changes the label of a transportation mode or location
+
+    Args:
+        segments (:obj:`list` of :obj:`tracktotrip.Segment`)
+        edit (:obj:`dict`)
+    """
+    segment = segments[edit['segment']]
+    if 'mode' in edit:
+        modes = [dict(mode) for mode in segment.transportation_modes]
+        modes[edit['mode']]['label'] = edit['label']
+        segment.transportation_modes = modes
+    elif edit.get('location') in ['from', 'to']:
+        if edit['location'] == 'from':
+            location, point = segment.location_from, segment.points[0]
+        else:
+            location, point = segment.location_to, segment.points[-1]
+
+        if location:
+            location = Location(edit['label'], location.centroid, location.other)
+        else:
+            location = Location(edit['label'], point, [])
+
+        if edit['location'] == 'from':
+            segment.location_from = location
+        else:
+            segment.location_to = location
+    else:
+        raise EditError('Invalid relabel edit: %s' % edit)
+
+def is_number(value):
+    """ Checks if a value is an int or a float, as decoded from JSON
+
+    Args:
+        value
+    Returns:
+        bool
+    """
+    return isinstance(value, (int, long, float)) and not isinstance(value, bool)
+
+def check_index(edit, key, length):
+    """ Checks that a field of an edit is an index of a list
+
+    Args:
+        edit (:obj:`dict`)
+        key (str): Field of the edit
+        length (int): Length of the list
+    Returns:
+        int: The index
+    """
+    index = edit.get(key)
+    if not is_number(index) or isinstance(index, float):
+        raise EditError('Invalid %s in edit: %s' % (key, edit))
+    if not 0 <= index < length:
+        raise EditError('%s out of range in edit: %s' % (key.capitalize(), edit))
+    return index
+
+def validate_edit(segments, edit):
+    """ Checks that an edit can be applied to segments
+
+    Indexes must exist in the segments, a range can't end before it
+    starts, and the last segment can't be merged. Raises an `EditError`
+    otherwise
+
+    Args:
+        segments (:obj:`list` of :obj:`tracktotrip.Segment`)
+        edit (:obj:`dict`)
+    """
+    if not isinstance(edit, dict) or edit.get('type') not in EDITS:
+        raise EditError('Unknown edit: %s' % edit)
+    kind = edit['type']
+    segment = segments[check_index(edit, 'segment', len(segments))]
+    length = len(segment.points)
+
+    if kind in ['move', 'split']:
+        check_index(edit, 'point', length)
+    if kind == 'move':
+        for key in ['lat', 'lon']:
+            if not is_number(edit.get(key)):
+                raise EditError('Invalid %s in edit: %s' % (key, edit))
+    elif kind == 'delete':
+        if check_index(edit, 'from', length) > check_index(edit, 'to', length):
+            raise EditError('From is after to in edit: %s' % edit)
+    elif kind == 'merge':
+        if edit['segment'] == len(segments) - 1:
+            raise EditError('Last segment can\'t be merged: %s' % edit)
+    elif kind == 'relabel':
+        if not isinstance(edit.get('label'), basestring):
+            raise EditError('Invalid label in edit: %s' % edit)
+        if 'mode' in edit:
+            check_index(edit, 'mode', len(segment.transportation_modes))
+        elif edit.get('location') not in ['from', 'to']:
+            raise EditError('Invalid relabel edit: %s' % edit)
+
+EDITS = {
+    'move': move_point,
+    'delete': delete_points,
+    'split': split_segment,
+    'merge': merge_segments,
+    'relabel': relabel
+}
+
+def apply_edits(track, edits):
+    """ Applies edits to a track
+
+    The given track isn't changed, the result shares all the points that
+    weren't edited with it. See `history.copy_segments`. Raises an
+    `EditError` if an edit is invalid, see `validate_edit`
+
+    Args:
+        track (:obj:`tracktotrip.Track`)
+        edits (:obj:`list` of :obj:`dict`): Edits to apply, in order. See
+            the module documentation for the available edits
+    Returns:
+        :obj:`tracktotrip.Track`
+    """
+    if not isinstance(edits, list):
+        raise EditError('Edits must be a list: %s' % edits)
+    result = copy_segments(track)
+    for edit in edits:
+        validate_edit(result.segments, edit)
+        EDITS[edit['type']](result.segments, edit)
+    return result
@@ -0,0 +1,154 @@
+"""
+Encoding and decoding of PostGIS EWKB values with numpy
+
+Reads the coordinates of POINT and LINESTRING geometries, as returned
+by psycopg for geography columns, straight from the WKB buffer into
+numpy arrays, and writes them from the coordinates in one pass. See
+`ppygis.Geometry` for the general encoder and decoder.
+
+EWKB layout:
+
+    byte order (1 byte): 0 for big endian, 1 for little endian
+    type (uint32): geometry type, with the Z, M and SRID flags
+    srid (uint32): if the SRID flag is set
+    number of points (uint32): only for LINESTRING
+    coordinates (double): x, y, and z and m if the flags are set, per point
+"""
+import struct
+import binascii
+import numpy as np
+
+POINT = 1
+LINESTRING = 2
+Z_FLAG = 0x80000000
+M_FLAG = 0x40000000
+SRID_FLAG = 0x20000000
+TYPE_MASK = 0x0fffffff
+SRID = 4326
+
+def to_buffer(value):
+    """ Gets the binary EWKB of a value
+
+    Args:
+        value (str or buffer): Hex encoded EWKB, as returned by psycopg for
+            geography columns, or binary EWKB
+    Returns:
+        str or buffer
+    """
+    if isinstance(value, basestring) and value[:1] in ('0', '1'):
+        return binascii.a2b_hex(value)
+    return value
+
+def read_header(data):
+    """ Reads the header of an EWKB geometry
+
+    Args:
+        data (str or buffer): Binary EWKB
+    Returns:
+        (str, int, int, int, int): Byte order, as a numpy/struct prefix,
+            geometry type, without flags, number of dimensions, number of
+            points and offset of the first coordinate
+    """
+    order = '<' if struct.unpack_from('B', data, 0)[0] == 1 else '>'
+    (geometry_type, ) = struct.unpack_from(order + 'I', data, 1)
+    offset = 5
+    if geometry_type & SRID_FLAG:
+        offset += 4
+    dimensions = 2 + bool(geometry_type & Z_FLAG) + bool(geometry_type & M_FLAG)
+    geometry_type = geometry_type & TYPE_MASK
+
+    if geometry_type == POINT:
+        count = 1
+    elif geometry_type == LINESTRING:
+        (count, ) = struct.unpack_from(order + 'I', data, offset)
+        offset += 4
+    else:
+        raise ValueError('Unsupported geometry type: %d' % geometry_type)
+    return order, geometry_type, dimensions, count, offset
+
+def read_coordinates(value):
+    """ Reads the coordinates of a POINT or LINESTRING
+
+    The arrays are read-only views of the binary EWKB, nothing is copied
+
+    Args:
+        value (str or buffer): Hex encoded or binary EWKB
+    Returns:
+        (:obj:`numpy.ndarray`, :obj:`numpy.ndarray`): Latitudes and longitudes
+    """
+    data = to_buffer(value)
+    order, _, dimensions, count, offset = read_header(data)
+    coordinates = np.frombuffer(
+        data,
+        dtype=np.dtype(order + 'f8'),
+        count=count * dimensions,
+        offset=offset
+    ).reshape((count, dimensions))
+    return coordinates[:, 1], coordinates[:, 0]
+
+def to_json_points(lats, lons, timestamps=None):
+    """ JSON representation of points, without creating `tracktotrip.Point`s
+
+    Args:
+        lats (:obj:`numpy.ndarray`)
+        lons (:obj:`numpy.ndarray`)
+        timestamps (:obj:`list` of :obj:`datetime.datetime`, optional):
+            Timestamps of the points. Defaults to None
+    Returns:
+        :obj:`list` of :obj:`dict`: See `tracktotrip.Point.to_json`
+    """
+    if timestamps is None:
+        return [
+            {'lat': lat, 'lon': lon, 'time': None}
+            for lat, lon in zip(lats.tolist(), lons.tolist())
+        ]
+    return [
+        {'lat': lat, 'lon': lon, 'time': time.isoformat() if time is not None else None}
+        for lat, lon, time in zip(lats.tolist(), lons.tolist(), timestamps)
+    ]
+
+def write_coordinates(geometry_type, lats, lons, srid=SRID):
+    """ Writes a POINT or LINESTRING, with Z set to 0, as little endian EWKB
+
+    Args:
+        geometry_type (int): `POINT` or `LINESTRING`
+        lats (:obj:`numpy.ndarray`)
+        lons (:obj:`numpy.ndarray`)
+        srid (int, optional): Defaults to 4326
+    Returns:
+        str: Binary EWKB
+    """
+    header = struct.pack('<BII', 1, geometry_type | Z_FLAG | SRID_FLAG, srid)
+    if geometry_type == LINESTRING:
+        header += struct.pack('<I', len(lats))
+    coordinates = np.zeros((len(lats), 3), dtype='<f8')
+    coordinates[:, 0] = lons
+    coordinates[:, 1] = lats
+    return header + coordinates.tostring()
+
+def write_point(lat, lon, srid=SRID):
+    """ Writes a POINT as EWKB
+
+    Args:
+        lat (float)
+        lon (float)
+        srid (int, optional): Defaults to 4326
+    Returns:
+        str: Binary EWKB
+    """
+    return struct.pack('<BIIddd', 1, POINT | Z_FLAG | SRID_FLAG, srid, lon, lat, 0)
+
+def write_linestring(points, srid=SRID):
+    """ Writes points as an EWKB LINESTRING
+
+    Args:
+        points (:obj:`list` of :obj:`tracktotrip.Point`): Or any object with
+            lat and lon attributes
+        srid (int, optional): Defaults to 4326
+    Returns:
+        str: Binary EWKB
+    """
+    count = len(points)
+    lats = np.fromiter((point.lat for point in points), dtype=np.float64, count=count)
+    lons = np.fromiter((point.lon for point in points), dtype=np.float64, count=count)
+    return write_coordinates(LINESTRING, lats, lons, srid)
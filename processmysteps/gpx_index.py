@@ -0,0 +1,111 @@
+"""
+Persistent index of the GPX files in the input folder
+"""
+import json
+from os import stat, rename
+from os.path import join, isfile
+from tracktotrip.utils import isostr_to_datetime
+
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+def to_entry(details):
+    """ Converts file details to its serializable representation
+
+    Args:
+        details (:obj:`dict`): See `process_manager.file_details`
+    Returns:
+        :obj:`dict`
+    """
+    entry = dict(details)
+    entry['start'] = details['start'].strftime(DATE_FORMAT)
+    entry['end'] = details['end'].strftime(DATE_FORMAT)
+    return entry
+
+def from_entry(entry):
+    """ Converts an index entry back to file details
+
+    Args:
+        entry (:obj:`dict`): See `to_entry`
+    Returns:
+        :obj:`dict`
+    """
+    details = dict(entry)
+    details['start'] = isostr_to_datetime(entry['start'])
+    details['end'] = isostr_to_datetime(entry['end'])
+    return details
+
+class GPXIndex(object):
+    """ On-disk index of GPX files details
+
+    Each entry is keyed by the file path, and is only recomputed when the
+    size or the modification time of the file change. Rescanning a folder
+    is proportional to the number of changed files, instead of the number
+    of bytes in it.
+
+    Attributes:
+        path (str): Path of the index file. If None, the index is kept in memory
+        entries (:obj:`dict`): Serializable file details, keyed by file path
+    """
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.load()
+
+    def load(self):
+        """ Loads the index from its file, discarding it if it's invalid
+        """
+        self.entries = {}
+        if self.path and isfile(self.path):
+            try:
+                with open(self.path, 'r') as index_file:
+                    self.entries = json.loads(index_file.read())
+            except (IOError, ValueError):
+                self.entries = {}
+
+    def save(self):
+        """ Writes the index to its file
+
+        The index is written to a temporary file first, so that an
+        interrupted write doesn't corrupt it
+        """
+        if not self.path:
+            return
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w') as index_file:
+                index_file.write(json.dumps(self.entries))
+            rename(tmp_path, self.path)
+        except (IOError, OSError):
+            pass
+
+    def details(self, base_path, filenames, compute):
+        """ Gets the details of files, refreshing the stale ones
+
+        Entries of files that are no longer in the folder are dropped
+
+        Args:
+            base_path (str): Folder of the files
+            filenames (:obj:`list` of str): Names of the files
+            compute: Function with signature (str, str) -> :obj:`dict`, to
+                compute the details of a file. See `process_manager.file_details`
+        Returns:
+            :obj:`list` of :obj:`dict`
+        """
+        entries = {}
+        changed = False
+        for filename in filenames:
+            complete_path = join(base_path, filename)
+            file_stat = stat(complete_path)
+            entry = self.entries.get(complete_path)
+
+            if entry is None or entry['size'] != file_stat.st_size or \
+                    entry['mtime'] != file_stat.st_mtime:
+                entry = to_entry(compute(base_path, filename))
+                changed = True
+            entries[complete_path] = entry
+
+        if changed or len(entries) != len(self.entries):
+            self.entries = entries
+            self.save()
+
+        return [from_entry(entry) for entry in entries.values()]
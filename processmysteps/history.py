@@ -0,0 +1,170 @@
+"""
+Processing history, with states that share unchanged points
+"""
+from tracktotrip import Track, Segment, Point
+from .cache import POINT_SIZE
+from .compact import CompactTrack
+
+def copy_segments(track):
+    """ Copies a track, sharing the points with the original
+
+    Segments are copied, so their points, locations and transportation modes
+    can be replaced, but the points themselves must not be changed in place
+
+    Args:
+        track (:obj:`tracktotrip.Track`)
+    Returns:
+        :obj:`tracktotrip.Track`
+    """
+    segments = []
+    for segment in track.segments:
+        copy = Segment(segment.points)
+        copy.transportation_modes = list(segment.transportation_modes)
+        copy.location_from = segment.location_from
+        copy.location_to = segment.location_to
+        segments.append(copy)
+
+    result = Track(track.name, segments)
+    result.meta = list(track.meta)
+    return result
+
+def copy_points(track):
+    """ Copies a track and its points
+
+    Cheaper than `tracktotrip.Track.copy`, since locations and transportation
+    modes are shared with the original instead of deep copied
+
+    Args:
+        track (:obj:`tracktotrip.Track`)
+    Returns:
+        :obj:`tracktotrip.Track`
+    """
+    result = copy_segments(track)
+    for segment in result.segments:
+        segment.points = [copy_point(point) for point in segment.points]
+    return result
+
+def copy_point(point):
+    """ Copies a point
+
+    Args:
+        point (:obj:`tracktotrip.Point`)
+    Returns:
+        :obj:`tracktotrip.Point`
+    """
+    copy = Point.__new__(Point)
+    copy.__dict__.update(point.__dict__)
+    return copy
+
+def shares_points(track, other):
+    """ Checks if two tracks share lists of points
+
+    Args:
+        track (:obj:`tracktotrip.Track`)
+        other (:obj:`tracktotrip.Track`)
+    Returns:
+        bool
+    """
+    lists = set([id(segment.points) for segment in track.segments])
+    return any([id(segment.points) in lists for segment in other.segments])
+
+class History(object):
+    """ Undo history of the processing steps
+
+    States are `tracktotrip.Track` instances, the last one being the current
+    state. Steps that don't change points, see `copy_segments`, create states
+    that share them with the previous state, so a state costs only what
+    changed since the one before it. Past states that don't share points
+    with the next one are stored as `compact.CompactTrack`, and converted
+    back when they become the current state again.
+
+    Attributes:
+        states (:obj:`list` of :obj:`tracktotrip.Track` or :obj:`compact.CompactTrack`)
+        version (int): Incremented every time the history changes
+    """
+    def __init__(self):
+        self.states = []
+        self.version = 0
+
+    def reset(self, track=None):
+        """ Clears the history
+
+        Args:
+            track (:obj:`tracktotrip.Track`, optional): First state
+        """
+        self.states = [track] if track is not None else []
+        self.version = self.version + 1
+
+    def push(self, track):
+        """ Adds a new current state
+
+        Args:
+            track (:obj:`tracktotrip.Track`)
+        """
+        previous = self.current()
+        if previous is not None and not shares_points(previous, track):
+            self.states[-1] = CompactTrack.from_track(previous)
+        self.states.append(track)
+        self.version = self.version + 1
+
+    def pop(self):
+        """ Removes the current state, going back to the previous one
+
+        Returns:
+            :obj:`tracktotrip.Track`: Removed state
+        """
+        removed = self.states.pop()
+        if len(self.states) > 0 and isinstance(self.states[-1], CompactTrack):
+            self.states[-1] = self.states[-1].to_track()
+        self.version = self.version + 1
+        return removed
+
+    def replace(self, track):
+        """ Replaces the current state
+
+        Args:
+            track (:obj:`tracktotrip.Track`)
+        """
+        self.states[-1] = track
+        self.version = self.version + 1
+
+    def current(self):
+        """ Gets the current state
+
+        Returns:
+            :obj:`tracktotrip.Track` or None
+        """
+        return self.states[-1] if len(self.states) > 0 else None
+
+    def footprint(self):
+        """ Estimates the memory used by the history
+
+        Points shared by more than one state are only counted once, and
+        compact states count the size of their arrays
+
+        Returns:
+            :obj:`dict`: With the number of states, the number of distinct
+                points and the estimated size in bytes
+        """
+        points = set()
+        total = 0
+        compact_points = 0
+        compact_bytes = 0
+        for state in self.states:
+            if isinstance(state, CompactTrack):
+                compact_points = compact_points + len(state)
+                compact_bytes = compact_bytes + state.nbytes
+                continue
+            for segment in state.segments:
+                points.update([id(point) for point in segment.points])
+                total = total + len(segment.points)
+
+        return {
+            'states': len(self.states),
+            'points': len(points) + compact_points,
+            'sharedPoints': total - len(points),
+            'bytes': len(points) * POINT_SIZE + compact_bytes
+        }
+
+    def __len__(self):
+        return len(self.states)
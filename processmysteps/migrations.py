@@ -0,0 +1,144 @@
+"""
+Versioned database migrations
+
+Upgrades existing databases in place. `schema.sql` always has the latest
+schema, and every migration can also run over it, so new databases can
+be created with either.
+
+Applies the pending migrations with:
+
+    python -m processmysteps.migrations --config <configuration file>
+"""
+import json
+import argparse
+from copy import deepcopy
+from os.path import expanduser
+from processmysteps import db
+from .default_config import CONFIG
+
+# (version, description, statements), in order. Applied migrations must
+# not be changed, add another one instead. Levels of detail follow
+# db.LOD_ZOOMS and db.lod_tolerance, like db.update_canonical_lod
+MIGRATIONS = [
+    (1, 'Spatial and temporal indexes', [
+        'CREATE INDEX IF NOT EXISTS locations_centroid_idx ON locations USING GIST (centroid)',
+        'CREATE INDEX IF NOT EXISTS locations_label_idx ON locations (label)',
+        'CREATE INDEX IF NOT EXISTS trips_bounds_idx ON trips USING GIST (bounds)',
+        'CREATE INDEX IF NOT EXISTS trips_start_date_idx ON trips (start_date)',
+        'CREATE INDEX IF NOT EXISTS trips_transportation_modes_trip_id_idx ' \
+            'ON trips_transportation_modes (trip_id)',
+        'CREATE INDEX IF NOT EXISTS stays_start_date_idx ON stays (start_date)',
+        'CREATE INDEX IF NOT EXISTS canonical_trips_bounds_idx ON canonical_trips USING GIST (bounds)',
+        'CREATE INDEX IF NOT EXISTS canonical_trips_relations_canonical_trip_idx ' \
+            'ON canonical_trips_relations (canonical_trip)',
+        'CREATE INDEX IF NOT EXISTS canonical_trips_relations_trip_idx ' \
+            'ON canonical_trips_relations (trip)'
+    ]),
+    (2, 'Simplified canonical trips per zoom level', [
+        """
+        CREATE TABLE IF NOT EXISTS canonical_trips_lod (
+            canonical_id INTEGER REFERENCES canonical_trips(canonical_id) ON DELETE CASCADE,
+            zoom SMALLINT NOT NULL,
+            points geography(LINESTRINGZ, 4326) NOT NULL,
+            PRIMARY KEY (canonical_id, zoom)
+        )
+        """,
+        """
+        INSERT INTO canonical_trips_lod (canonical_id, zoom, points)
+        SELECT can.canonical_id, levels.zoom, COALESCE(
+            ST_Simplify(can.points::geometry, levels.tolerance),
+            can.points::geometry
+        )::geography
+        FROM canonical_trips AS can, (VALUES %s) AS levels (zoom, tolerance)
+        WHERE NOT EXISTS (
+            SELECT 1 FROM canonical_trips_lod AS lod
+            WHERE lod.canonical_id = can.canonical_id AND lod.zoom = levels.zoom
+        )
+        """ % ', '.join(['(%d, %r)' % (zoom, db.lod_tolerance(zoom)) for zoom in db.LOD_ZOOMS])
+    ])
+]
+
+def applied_versions(cur):
+    """ Gets the versions of the applied migrations
+
+    Creates the table that keeps them, if it doesn't exist
+
+    Args:
+        cur (:obj:`psycopg2.cursor`)
+    Returns:
+        :obj:`set` of int
+    """
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now()
+        )
+        """)
+    cur.execute('SELECT version FROM schema_migrations')
+    return set([version for (version, ) in cur.fetchall()])
+
+def migrate(conn, migrations=None):
+    """ Applies the pending migrations
+
+    Each migration is applied in its own transaction
+
+    Args:
+        conn (:obj:`psycopg2.connection`)
+        migrations (:obj:`list`, optional): Migrations to consider. Defaults
+            to `MIGRATIONS`
+    Returns:
+        :obj:`list` of int: Versions applied
+    """
+    migrations = migrations if migrations is not None else MIGRATIONS
+    cur = conn.cursor()
+    applied = applied_versions(cur)
+    conn.commit()
+
+    result = []
+    for version, description, statements in sorted(migrations):
+        if version in applied:
+            continue
+        try:
+            for statement in statements:
+                cur.execute(statement)
+            cur.execute("""
+                INSERT INTO schema_migrations (version, description)
+                VALUES (%s, %s)
+                """, (version, description))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        print 'Applied migration %d: %s' % (version, description)
+        result.append(version)
+
+    cur.close()
+    return result
+
+def main():
+    """ Applies the pending migrations to the database of a configuration file
+    """
+    parser = argparse.ArgumentParser(description='Applies pending database migrations')
+    parser.add_argument('--config', '-c', dest='config', metavar='c', type=str,
+            required=True,
+            help='configuration file')
+    args = parser.parse_args()
+
+    config = deepcopy(CONFIG)
+    with open(expanduser(args.config), 'r') as config_file:
+        config['db'].update(json.loads(config_file.read()).get('db', {}))
+    dbc = config['db']
+
+    conn = db.connect_db(dbc['host'], dbc['name'], dbc['user'], dbc['port'], dbc['pass'])
+    if conn is None:
+        print 'Unable to connect to the database'
+        return
+    try:
+        if len(migrate(conn)) == 0:
+            print 'Database is up to date'
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+Staged processing pipeline
+"""
+import sys
+import threading
+from Queue import Queue
+from collections import deque
+
+STOP = object()
+
+class Pipeline(object):
+    """ Chain of processing stages
+
+    Each stage runs in its own thread and is connected to the next one by a
+    bounded queue, so that I/O bound and CPU bound stages overlap on
+    different items, while a slow stage blocks the ones before it instead
+    of letting items pile up in memory. Items are processed in order.
+
+    Attributes:
+        stages (:obj:`list`): Functions with signature (item) -> item
+        maxsize (int): Maximum number of items waiting between two stages
+    """
+    def __init__(self, stages, maxsize=2):
+        self.stages = stages
+        self.maxsize = maxsize
+        self.error = None
+
+    def run(self, items):
+        """ Runs the items through all stages
+
+        If a stage raises an exception, the remaining items are skipped and
+        the exception is raised again, after all threads stop
+
+        Args:
+            items (iterable): Items to process
+        Returns:
+            :obj:`list`: Results of the last stage
+        """
+        self.error = None
+        queues = [Queue(self.maxsize) for _ in range(len(self.stages) + 1)]
+        threads = [threading.Thread(target=self.feed, args=(items, queues[0]))]
+        for i, stage in enumerate(self.stages):
+            threads.append(threading.Thread(
+                target=self.work,
+                args=(stage, queues[i], queues[i + 1])
+            ))
+
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        results = []
+        while True:
+            item = queues[-1].get()
+            if item is STOP:
+                break
+            results.append(item)
+
+        for thread in threads:
+            thread.join()
+
+        if self.error:
+            raise self.error[0], self.error[1], self.error[2]
+        return results
+
+    def feed(self, items, output):
+        """ Puts items in the first queue
+
+        Args:
+            items (iterable)
+            output (:obj:`Queue.Queue`)
+        """
+        try:
+            for item in items:
+                if self.error:
+                    break
+                output.put(item)
+        except Exception:
+            self.error = sys.exc_info()
+        output.put(STOP)
+
+    def work(self, stage, source, output):
+        """ Runs a stage over the items of a queue
+
+        Args:
+            stage: Function with signature (item) -> item
+            source (:obj:`Queue.Queue`)
+            output (:obj:`Queue.Queue`)
+        """
+        while True:
+            item = source.get()
+            if item is STOP:
+                output.put(STOP)
+                return
+            if self.error:
+                continue
+            try:
+                output.put(stage(item))
+            except Exception:
+                self.error = sys.exc_info()
+
+def bounded_imap(pool, function, items, window):
+    """ Like `multiprocessing.Pool.imap`, but with a bounded number of items in flight
+
+    `Pool.imap` hands all items to the workers at once, and keeps all their
+    results until they're read. Here, an item is only handed to the pool
+    when there are less than window items that were handed and not yet
+    read, so a slow reader stops the workers instead of letting results
+    pile up in memory.
+
+    Args:
+        pool (:obj:`multiprocessing.Pool`)
+        function: Function with signature (item) -> result
+        items (iterable)
+        window (int): Maximum number of items in flight
+    Yields:
+        Results, in the order of the items
+    """
+    pending = deque()
+    for item in items:
+        if len(pending) >= window:
+            yield pending.popleft().get()
+        pending.append(pool.apply_async(function, (item, )))
+    while len(pending) > 0:
+        yield pending.popleft().get()
@@ -0,0 +1,230 @@
+"""
+Location inference with place providers, and a persistent cache of their results
+
+Providers are functions with signature (:obj:`tracktotrip.Point`, float) ->
+:obj:`list` of :obj:`dict`, that get the places within a radius of a point,
+like `tracktotrip.location.query_google` and `query_foursquare`.
+"""
+import json
+import time
+import sqlite3
+from contextlib import contextmanager
+from os.path import expanduser
+from tracktotrip.location import Location, query_google, query_foursquare
+
+# Time, in seconds, that an empty result is cached. Providers also give
+# empty results when they fail
+EMPTY_TTL = 24 * 60 * 60
+
+class PlacesCache(object):
+    """ Persistent cache of places, in a SQLite file
+
+    Results are stored by provider, rounded coordinates and radius. They
+    expire after some time, and the least recently used are removed when
+    there are too many.
+
+    Attributes:
+        path (str): Path of the SQLite file
+        ttl (float): Time, in seconds, that results are kept
+        max_entries (int): Maximum number of results
+        precision (int): Decimal places of the coordinates of the keys
+    """
+    def __init__(self, path, ttl, max_entries, precision):
+        self.path = expanduser(path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.precision = precision
+        with self.connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS places (
+                    provider TEXT NOT NULL,
+                    lat REAL NOT NULL,
+                    lon REAL NOT NULL,
+                    radius REAL NOT NULL,
+                    created REAL NOT NULL,
+                    used REAL NOT NULL,
+                    places TEXT NOT NULL,
+                    PRIMARY KEY (provider, lat, lon, radius)
+                )
+                """)
+            conn.execute("CREATE INDEX IF NOT EXISTS places_used ON places (used)")
+
+    @contextmanager
+    def connect(self):
+        """ Opens a connection to the cache file, committing and closing it at the end
+
+        A connection is opened for each operation, so the cache can be
+        used from multiple threads and processes
+
+        Yields:
+            :obj:`sqlite3.Connection`
+        """
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def key(self, provider, point, radius):
+        """ Key of the results of a query
+
+        Args:
+            provider (str): Name of the provider
+            point (:obj:`tracktotrip.Point`)
+            radius (float): Radius, in meters
+        Returns:
+            (str, float, float, float)
+        """
+        return (
+            provider,
+            round(point.lat, self.precision),
+            round(point.lon, self.precision),
+            float(radius)
+        )
+
+    def get(self, provider, point, radius):
+        """ Gets the places of a query
+
+        Args:
+            provider (str): Name of the provider
+            point (:obj:`tracktotrip.Point`)
+            radius (float): Radius, in meters
+        Returns:
+            :obj:`list` of :obj:`dict`: None if they aren't cached
+        """
+        key = self.key(provider, point, radius)
+        now = time.time()
+        with self.connect() as conn:
+            row = conn.execute("""
+                SELECT created, places FROM places
+                WHERE provider=? AND lat=? AND lon=? AND radius=?
+                """, key).fetchone()
+            if row is None:
+                return None
+
+            created, places = row
+            places = json.loads(places)
+            ttl = self.ttl if len(places) > 0 else min(self.ttl, EMPTY_TTL)
+            if created + ttl < now:
+                return None
+
+            conn.execute("""
+                UPDATE places SET used=?
+                WHERE provider=? AND lat=? AND lon=? AND radius=?
+                """, (now, ) + key)
+            return places
+
+    def put(self, provider, point, radius, places):
+        """ Stores the places of a query
+
+        Args:
+            provider (str): Name of the provider
+            point (:obj:`tracktotrip.Point`)
+            radius (float): Radius, in meters
+            places (:obj:`list` of :obj:`dict`)
+        """
+        key = self.key(provider, point, radius)
+        now = time.time()
+        with self.connect() as conn:
+            conn.execute("""
+                INSERT OR REPLACE INTO places (provider, lat, lon, radius, created, used, places)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, key + (now, now, json.dumps(places)))
+            (count, ) = conn.execute("SELECT COUNT(*) FROM places").fetchone()
+            if count > self.max_entries:
+                conn.execute("""
+                    DELETE FROM places WHERE rowid IN (
+                        SELECT rowid FROM places ORDER BY used LIMIT ?
+                    )
+                    """, (count - self.max_entries, ))
+
+    def cached(self, provider, query):
+        """ Wraps a provider, caching its results
+
+        Args:
+            provider (str): Name of the provider
+            query: Provider function
+        Returns:
+            Provider function
+        """
+        def cached_query(point, radius):
+            """ Gets the places of a query, from the cache if possible
+
+            Args:
+                point (:obj:`tracktotrip.Point`)
+                radius (float): Radius, in meters
+            Returns:
+                :obj:`list` of :obj:`dict`
+            """
+            places = self.get(provider, point, radius)
+            if places is None:
+                places = query(point, radius)
+                self.put(provider, point, radius, places)
+            return places
+        return cached_query
+
+    def __len__(self):
+        with self.connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM places").fetchone()[0]
+
+def google_provider(key):
+    """ Google Places provider
+
+    Args:
+        key (str): Google maps api key
+    Returns:
+        Provider function
+    """
+    return lambda point, radius: query_google(point, radius, key)
+
+def foursquare_provider(client_id, client_secret):
+    """ Foursquare provider
+
+    Args:
+        client_id (str): Foursquare client id
+        client_secret (str): Foursquare client secret
+    Returns:
+        Provider function
+    """
+    return lambda point, radius: query_foursquare(point, radius, client_id, client_secret)
+
+def infer_location(point, location_query, max_distance, providers, limit):
+    """ Infers the semantic location of a point
+
+    Like `tracktotrip.location.infer_location`, but with any providers
+
+    Args:
+        point (:obj:`tracktotrip.Point`)
+        location_query: Function with signature (:obj:`tracktotrip.Point`, float)
+            -> :obj:`list` of (str, :obj:`tracktotrip.Point`, ...), that gets
+            known locations. See `ProcessingManager.query_locations`
+        max_distance (float): Max distance to a location, in meters
+        providers (:obj:`list`): Provider functions, queried if there aren't
+            enough known locations
+        limit (int): Max number of locations
+    Returns:
+        :obj:`tracktotrip.location.Location`: With the closest location, and
+            the alternatives
+    """
+    locations = []
+    if location_query is not None:
+        for (label, centroid, _) in location_query(point, max_distance):
+            locations.append({
+                'label': unicode(label, 'utf-8'),
+                'distance': centroid.distance(point),
+                'suggestion_type': 'KB'
+            })
+
+    api_locations = []
+    if len(locations) <= limit:
+        for provider in providers:
+            api_locations.extend(provider(point, max_distance))
+
+    if len(locations) > 0 or len(api_locations) > 0:
+        locations = sorted(locations, key=lambda d: d['distance'])
+        api_locations = sorted(api_locations, key=lambda d: d['distance'])
+        locations = (locations + api_locations)[:limit]
+        return Location(locations[0]['label'], point, locations)
+    else:
+        return Location('#?', point, [])
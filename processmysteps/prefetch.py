@@ -0,0 +1,83 @@
+"""
+Background preparation of work
+"""
+import threading
+
+class Prefetcher(object):
+    """ Runs work in a background thread, keeping the result of the latest request
+
+    Each request has a key that identifies the inputs it depends on. Results
+    are only given for the same key, and starting another request, or
+    discarding the current one, drops results of older requests, even if
+    they are still running. Requests that fail can be started again.
+
+    Attributes:
+        key: Key of the latest request, or None
+        result: Result of the latest request, or None if it isn't done
+    """
+    def __init__(self):
+        self.key = None
+        self.result = None
+        self.lock = threading.Lock()
+
+    def start(self, key, work):
+        """ Starts a request, unless one with the same key exists
+
+        Args:
+            key: Hashable value that identifies the request
+            work: Function with no arguments, that returns the result
+        """
+        with self.lock:
+            if self.key == key:
+                return
+            self.key = key
+            self.result = None
+
+        thread = threading.Thread(target=self.run, args=(key, work))
+        thread.daemon = True
+        thread.start()
+
+    def run(self, key, work):
+        """ Runs a request, storing its result if it's still the latest
+
+        Args:
+            key: Key of the request
+            work: Function with no arguments, that returns the result
+        """
+        try:
+            result = work()
+        except Exception as err:
+            print 'Prefetch failed: %s' % err
+            with self.lock:
+                # so it's tried again
+                if self.key == key:
+                    self.key = None
+            return
+        with self.lock:
+            if self.key == key:
+                self.result = result
+
+    def take(self, key):
+        """ Gets the result of a request, if it's done
+
+        The result is only given once
+
+        Args:
+            key: Key of the request
+        Returns:
+            Result of the request or None
+        """
+        with self.lock:
+            if self.key != key or self.result is None:
+                return None
+            result = self.result
+            self.key = None
+            self.result = None
+            return result
+
+    def discard(self):
+        """ Discards the latest request and its result
+        """
+        with self.lock:
+            self.key = None
+            self.result = None
@@ -4,17 +4,34 @@ Contains class that orchestrates processing
 """
 import re
 import json
+import time
+import threading
+from uuid import uuid4
+from multiprocessing import Pool, cpu_count
 from os import listdir, stat, rename
 from os.path import join, expanduser, isfile
+from copy import deepcopy
+from bisect import bisect_left
 from collections import OrderedDict
+import psycopg2
 import tracktotrip as tt
-from tracktotrip.utils import pairwise, estimate_meters_to_deg
-from tracktotrip.location import infer_location
-from tracktotrip.classifier import Classifier
+from tracktotrip.utils import estimate_meters_to_deg
 from tracktotrip.learn_trip import learn_trip, complete_trip
 from tracktotrip.transportation_mode import learn_transportation_mode, classify
 from processmysteps import db
 from .life import Life
+from .gpx_index import GPXIndex
+from .pipeline import Pipeline, bounded_imap
+from .cache import LRUCache, SpatialCache
+from .canonical_index import CanonicalTripsIndex
+from .compact import CompactTrack, naive_time
+from .prefetch import Prefetcher
+from .history import History, copy_points, copy_segments
+from .edits import apply_edits
+from .classifier_store import LazyClassifier
+from .transportation import classify_segments
+from .places import PlacesCache, infer_location, google_provider, foursquare_provider
+from .tiles import LAYERS, TileCache, is_valid_tile, render_tile
 
 from .default_config import CONFIG
 
@@ -24,25 +41,65 @@ def inside(to_find, modes):
             return elm.lower()
     return None
 
-def gte_time(small, big):
-    if small.hour < big.hour:
-        return True
-    elif small.hour == big.hour and small.minute <= big.minute:
-        return True
-    else:
-        return False
+def minute_key(time):
+    """ Truncates a time to the minute, the precision of LIFE spans
 
-def is_time_between(lower, time, upper):
-    return gte_time(lower, time) and gte_time(time, upper)
+    Args:
+        time (:obj:`datetime.datetime`)
+    Returns:
+        :obj:`datetime.datetime`: Without timezone
+    """
+    return naive_time(time).replace(second=0, microsecond=0)
+
+class TimeIndex(object):
+    """ Sorted timestamps of the points of a track, by segment
+
+    Points are compared with minute precision, and their timezone is ignored.
+    The points of each segment must be sorted by time.
+
+    Attributes:
+        segments (:obj:`list` of (:obj:`datetime.datetime`, :obj:`datetime.datetime`,
+            :obj:`list` of :obj:`datetime.datetime`)): Start, end and times of
+            the points of each segment
+    """
+    def __init__(self, track):
+        self.segments = []
+        for segment in track.segments:
+            times = [minute_key(point.time) for point in segment.points]
+            if len(times) > 1:
+                self.segments.append((times[0], times[-1], times))
+            else:
+                self.segments.append((None, None, times))
+
+    def find(self, time):
+        """ Finds the first pair of consecutive points around a time
+
+        Args:
+            time (:obj:`datetime.datetime`)
+        Returns:
+            (int, int): Index of the segment and of the first point of the
+                pair. (None, None) if there isn't one
+        """
+        time = minute_key(time)
+        for j, (start, end, times) in enumerate(self.segments):
+            if start is None or time < start or time > end:
+                continue
+            # the point before the first one that isn't before the time
+            return (j, max(bisect_left(times, time) - 1, 0))
+        return None, None
 
 def find_index_point(track, time):
-    for j, segment in enumerate(track.segments):
-        i = 0
-        for p_a, p_b in pairwise(segment.points):
-            if is_time_between(p_a.time, time, p_b.time):
-                return (j, i)
-            i = i + 1
-    return None, None
+    """ Finds the first pair of consecutive points around a time
+
+    See `TimeIndex.find`. Use a `TimeIndex` to search more than one time
+
+    Args:
+        track (:obj:`tracktotrip.Track`)
+        time (:obj:`datetime.datetime`)
+    Returns:
+        (int, int): Index of the segment and of the first point of the pair
+    """
+    return TimeIndex(track).find(time)
 
 def apply_transportation_mode_to(track, life_content, transportation_modes):
     life = Life()
@@ -51,6 +108,7 @@ def apply_transportation_mode_to(track, life_content, transportation_modes):
     for segment in track.segments:
         segment.transportation_modes = []
 
+    index = TimeIndex(track)
     for day in life.days:
         for span in day.spans:
             has = inside(span.tags, transportation_modes)
@@ -58,8 +116,8 @@ def apply_transportation_mode_to(track, life_content, transportation_modes):
                 start_time = db.span_date_to_datetime(span.day, span.start)
                 end_time = db.span_date_to_datetime(span.day, span.end)
 
-                start_segment, start_index = find_index_point(track, start_time)
-                end_segment, end_index = find_index_point(track, end_time)
+                start_segment, start_index = index.find(start_time)
+                end_segment, end_index = index.find(end_time)
                 if start_segment is not None:
                     if end_index is None or end_segment != start_segment:
                         end_index = len(track.segments[start_segment].points) - 1
@@ -83,10 +141,86 @@ def save_to_file(path, content, mode="w"):
         dest_file.write(content.encode('utf-8'))
 
 TIME_RX = re.compile(r'\<time\>([^\<]+)\<\/time\>')
+POINT_TAG = '<trkpt'
+CHUNK_SIZE = 64 * 1024
+# Longest match of TIME_RX that is expected, kept between chunks
+MAX_TAG_LENGTH = 256
+
+def search_forward(opened_file, regex, chunk_size=CHUNK_SIZE):
+    """ Finds the first match of a regular expression in a file, reading it in chunks
+
+    The end of each chunk is kept, so that matches split across chunk
+    boundaries are still found. Stops reading at the first match.
+
+    Args:
+        opened_file (:obj:`file`)
+        regex (:obj:`re.RegexObject`): Expression to match, no longer than MAX_TAG_LENGTH
+        chunk_size (int, optional): Bytes to read at a time. Defaults to CHUNK_SIZE
+    Returns:
+        :obj:`re.MatchObject` or None
+    """
+    opened_file.seek(0)
+    buff = ''
+    while True:
+        chunk = opened_file.read(chunk_size)
+        if not chunk:
+            return None
+        buff = buff[-MAX_TAG_LENGTH:] + chunk
+        result = regex.search(buff)
+        if result:
+            return result
+
+def search_backward(opened_file, regex, chunk_size=CHUNK_SIZE):
+    """ Finds the last match of a regular expression in a file, reading it in chunks
+        from the end
+
+    Args:
+        opened_file (:obj:`file`)
+        regex (:obj:`re.RegexObject`): Expression to match, no longer than MAX_TAG_LENGTH
+        chunk_size (int, optional): Bytes to read at a time. Defaults to CHUNK_SIZE
+    Returns:
+        :obj:`re.MatchObject` or None
+    """
+    opened_file.seek(0, 2)
+    position = opened_file.tell()
+    buff = ''
+    while position > 0:
+        read_size = min(chunk_size, position)
+        position = position - read_size
+        opened_file.seek(position)
+        buff = opened_file.read(read_size) + buff[:MAX_TAG_LENGTH]
+        result = None
+        for result in regex.finditer(buff):
+            pass
+        if result:
+            return result
+    return None
+
+def count_points(opened_file, chunk_size=CHUNK_SIZE):
+    """ Counts the track points of a GPX file, reading it in chunks
+
+    Args:
+        opened_file (:obj:`file`)
+        chunk_size (int, optional): Bytes to read at a time. Defaults to CHUNK_SIZE
+    Returns:
+        int
+    """
+    opened_file.seek(0)
+    tail_length = len(POINT_TAG) - 1
+    count = 0
+    buff = ''
+    while True:
+        chunk = opened_file.read(chunk_size)
+        if not chunk:
+            return count
+        buff = buff[-tail_length:] + chunk
+        count = count + buff.count(POINT_TAG)
+
 def predict_start_date(filename):
     """ Predicts the start date of a GPX file
 
-    Reads the first valid date, by matching TIME_RX regular expression
+    Reads the first valid date, by matching TIME_RX regular expression.
+    The file is only read until the first match
 
     Args:
         filename (str): file path
@@ -94,9 +228,44 @@ def predict_start_date(filename):
         :obj:`datetime.datetime`
     """
     with open(filename, 'r') as opened_file:
-        result = TIME_RX.search(opened_file.read())
+        result = search_forward(opened_file, TIME_RX)
         return tt.utils.isostr_to_datetime(result.group(1))
 
+def predict_end_date(filename):
+    """ Predicts the end date of a GPX file
+
+    Reads the last valid date, by matching TIME_RX regular expression.
+    The file is read backwards, until the first match
+
+    Args:
+        filename (str): file path
+    Returns:
+        :obj:`datetime.datetime`
+    """
+    with open(filename, 'r') as opened_file:
+        result = search_backward(opened_file, TIME_RX)
+        return tt.utils.isostr_to_datetime(result.group(1))
+
+def predict_time_span(filename):
+    """ Predicts the start and end dates, and the number of points, of a GPX file
+
+    See `predict_start_date`, `predict_end_date` and `count_points`
+
+    Args:
+        filename (str): file path
+    Returns:
+        (:obj:`datetime.datetime`, :obj:`datetime.datetime`, int)
+    """
+    with open(filename, 'r') as opened_file:
+        start = search_forward(opened_file, TIME_RX)
+        end = search_backward(opened_file, TIME_RX)
+        points = count_points(opened_file)
+        return (
+            tt.utils.isostr_to_datetime(start.group(1)),
+            tt.utils.isostr_to_datetime(end.group(1)),
+            points
+        )
+
 def file_details(base_path, filepath):
     """ Returns file details
 
@@ -106,8 +275,11 @@ def file_details(base_path, filepath):
             'name': '25072016.gpx',
             'path': '/users/username/tracks/25072016.gpx',
             'size': 39083,
+            'mtime': 1469432452.0,
             'start': <datetime.datetime>,
-            'date': '2016-07-25t07:40:52z'
+            'end': <datetime.datetime>,
+            'points': 1530,
+            'date': '2016-07-25'
         }
 
     Args:
@@ -117,15 +289,18 @@ def file_details(base_path, filepath):
         :obj:`dict`: See example
     """
     complete_path = join(base_path, filepath)
-    (_, _, _, _, _, _, size, _, _, _) = stat(complete_path)
+    file_stat = stat(complete_path)
 
-    date = predict_start_date(complete_path)
+    start, end, points = predict_time_span(complete_path)
     return {
         'name': filepath,
         'path': complete_path,
-        'size': size,
-        'start': date,
-        'date': date.date().isoformat()
+        'size': file_stat.st_size,
+        'mtime': file_stat.st_mtime,
+        'start': start,
+        'end': end,
+        'points': points,
+        'date': start.date().isoformat()
     }
 
 def update_dict(target, updater):
@@ -175,6 +350,32 @@ class Step(object):
         """
         return (current - 1) % Step._len
 
+def init_bulk_worker(config):
+    """ Initializes a bulk processing worker process
+
+    Each worker has its own `ProcessingManager`, without any queue
+
+    Args:
+        config (:obj:`dict`): Configuration of the main manager
+    """
+    global BULK_WORKER
+    BULK_WORKER = ProcessingManager(None, config=config, load=False)
+
+def bulk_process_day(job):
+    """ Processes a day in a bulk processing worker
+
+    See `ProcessingManager.process_day`
+
+    Args:
+        job ((str, :obj:`list` of :obj:`dict`)): Day and its GPXs details
+    Returns:
+        (str, :obj:`tracktotrip.Track`): Day and its processed track
+    """
+    day, gpxs = job
+    return day, BULK_WORKER.process_day(gpxs)
+
+BULK_WORKER = None
+
 class ProcessingManager(object):
     """ Manages the processing phases
 
@@ -183,9 +384,10 @@ class ProcessingManager(object):
             processed. Doesn't include the current file
         currentFile: String with the current file being
             processed
-        history: Array of TrackToTrip.Track. Must always
+        history: History of TrackToTrip.Track. Must always
             have length greater or equal to ONE. The
-            last element is the current state of the system
+            last element is the current state of the system.
+            See `history.History`
         INPUT_PATH: String with the path to the input folder
         BACKUP_PATH: String with the path to the backup folder
         OUTPUT_PATH: String with the path to the output folder
@@ -193,33 +395,67 @@ class ProcessingManager(object):
             folder
     """
 
-    def __init__(self, config_file):
-        self.config = dict(CONFIG)
+    def __init__(self, config_file, config=None, load=True):
+        self.config = deepcopy(CONFIG)
 
         if config_file and isfile(expanduser(config_file)):
             with open(expanduser(config_file), 'r') as config_file:
-                config = json.loads(config_file.read())
-                update_dict(self.config, config)
-
-        clf_path = self.config['transportation']['classifier_path']
-        if clf_path:
-            self.clf = Classifier.load_from_file(open(expanduser(clf_path), 'rb'))
-        else:
-            self.clf = Classifier()
-
+                config_content = json.loads(config_file.read())
+                update_dict(self.config, config_content)
+        if config:
+            update_dict(self.config, config)
+
+        self.classifier = LazyClassifier(self.config['transportation']['classifier_path'])
+        self.gpx_index = None
+        self.track_cache = LRUCache(self.tracks_cache_size(), lambda track: track.nbytes)
+        self.prefetcher = Prefetcher()
+        self.location_cache = self.create_location_cache()
+        self.places_cache = None
+        self.db_pool = None
+        # pool of each connection in use, see db_connect
+        self.db_pools = {}
+        self.db_lock = threading.Lock()
+        self.canonical_index = CanonicalTripsIndex(
+            self.config['trip_learning']['index']['max_points']
+        )
+        # removed by close
+        self.listeners = [db.on_change('locations', self.location_cache.invalidate)]
+        self.tile_cache = None
+        for layer, definition in LAYERS.items():
+            self.listeners.append(db.on_change(
+                definition['table'],
+                lambda bounds, layer=layer: self.invalidate_tiles(layer, bounds)
+            ))
+        self.speculative = None
+        self.config_version = 0
         self.is_bulk_processing = False
         self.queue = {}
+        self.queue_version = 0
+        self.instance_id = uuid4().hex[:8]
         self.life_queue = []
         self.current_step = None
-        self.history = []
+        self.history = History()
         self.current_day = None
-        self.reset()
+        self.bulk_stats = None
+        if load:
+            self.reset()
+
+    @property
+    def clf(self):
+        """ Transportation mode classifier
+
+        It's loaded in the background, see `classifier_store.LazyClassifier`
+
+        Returns:
+            :obj:`tracktotrip.classifier.Classifier`
+        """
+        return self.classifier.get()
 
     def list_gpxs(self):
         """ Lists gpx files from the input path, and some details
 
-        Result is sorted by start date
-        See `file_details`
+        Result is sorted by start date. Details are cached in the GPX index,
+        see `gpx_index.GPXIndex` and `file_details`
 
         Returns:
             :obj:`list` of :obj:`dict`
@@ -231,7 +467,14 @@ class ProcessingManager(object):
         files = listdir(input_path)
         files = [f for f in files if f.split('.')[-1] == 'gpx']
 
-        files = [file_details(input_path, f) for f in files]
+        if self.config['index_path']:
+            index_path = expanduser(self.config['index_path'])
+        else:
+            index_path = join(input_path, '.gpxindex.json')
+        if self.gpx_index is None or self.gpx_index.path != index_path:
+            self.gpx_index = GPXIndex(index_path)
+
+        files = self.gpx_index.details(input_path, files, file_details)
         files = sorted(files, key=lambda f: f['date'])
         return files
 
@@ -261,9 +504,10 @@ class ProcessingManager(object):
             self.load_days()
         else:
             self.queue = {}
+            self.queue_version = self.queue_version + 1
             self.current_day = None
             self.current_step = Step.done
-            self.history = []
+            self.history.reset()
 
         return self
 
@@ -274,24 +518,152 @@ class ProcessingManager(object):
             day (:obj:`datetime.date`): Only loads if it's an existing key in queue
         """
         if day in self.queue.keys():
-            key_to_use = day
-            gpxs_to_use = self.queue[key_to_use]
-            gpxs_to_use = [tt.Track.from_gpx(gpx['path'])[0] for gpx in gpxs_to_use]
-
-            self.current_day = key_to_use
-
-            segs = []
-            for gpx in gpxs_to_use:
-                segs.extend(gpx.segments)
-
-            track = tt.Track('', segments=segs)
-            track.name = track.generate_name(self.config['trip_name_format'])
+            prefetched = self.prefetcher.take(self.prefetch_key(day))
+            if prefetched:
+                track, self.speculative = prefetched
+            else:
+                track = self.load_track(self.queue[day])
+                self.speculative = None
 
-            self.history = [track]
+            self.current_day = day
+            self.history.reset(track)
             self.current_step = Step.preview
         else:
             raise TypeError('Cannot find any track for day: %s' % day)
 
+    def prefetch_key(self, day):
+        """ Gets the key of the prefetch of a day
+
+        It changes when the GPXs of the day, or the configuration change
+
+        Args:
+            day (str): Day in the queue
+        Returns:
+            tuple
+        """
+        gpxs = tuple([(gpx['path'], gpx['mtime'], gpx['size']) for gpx in self.queue[day]])
+        return (day, gpxs, self.config_version)
+
+    def following_day(self, delete=True):
+        """ Gets the day that `next_day` moves to
+
+        Args:
+            delete (bool, optional): True if the current day is deleted from
+                the queue, like when it's stored. Defaults to True
+        Returns:
+            str: Day in the queue, or None
+        """
+        days = list(self.queue.keys())
+        if self.current_day not in days:
+            return days[0] if len(days) > 0 else None
+        index = days.index(self.current_day)
+        days.remove(self.current_day)
+        if len(days) == 0:
+            return None
+        if delete:
+            # the oldest day, see `load_days`
+            return days[0]
+        return days[index] if index < len(days) else days[0]
+
+    def prefetch(self):
+        """ Prepares the following day in the background
+
+        The GPXs of the day are parsed and, if `prefetch.speculative` is set,
+        `preview_to_adjust` is computed with the current configuration.
+        The result is used by `change_day`, unless the day or the
+        configuration change in the meantime
+        """
+        c_prefetch = self.config['prefetch']
+        day = self.following_day()
+        if not c_prefetch['use'] or self.is_bulk_processing or day is None:
+            return
+
+        gpxs = list(self.queue[day])
+        speculative = c_prefetch['speculative']
+
+        def work():
+            """ Loads the day and, optionally, computes the next step
+
+            Returns:
+                (:obj:`tracktotrip.Track`, :obj:`tracktotrip.Track`): The
+                    second one is None if the step isn't computed
+            """
+            track = self.load_track(gpxs)
+            if speculative:
+                return track, self.preview_to_adjust(copy_points(track))
+            return track, None
+
+        self.prefetcher.start(self.prefetch_key(day), work)
+
+    def load_track(self, gpxs, use_cache=True):
+        """ Loads the GPXs of a day into a single track
+
+        Args:
+            gpxs (:obj:`list` of :obj:`dict`): GPXs details, see `file_details`
+            use_cache (bool, optional): True to use the parsed tracks cache, see
+                `load_gpx`. Defaults to True
+        Returns:
+            :obj:`tracktotrip.Track`
+        """
+        segs = []
+        for gpx in gpxs:
+            segs.extend(self.load_gpx(gpx, use_cache).segments)
+
+        track = tt.Track('', segments=segs)
+        track.name = track.generate_name(self.config['trip_name_format'])
+        return track
+
+    def load_gpx(self, gpx, use_cache=True):
+        """ Loads a GPX file
+
+        Parsed tracks are kept in a LRU cache, as `compact.CompactTrack`, keyed
+        by the path, modification time and size of the file.
+        The cache size is set by `cache.tracks_memory`, in megabytes.
+        A cache hit still creates a new `tracktotrip.Track`, that callers
+        can change, which takes about 0.1s for a day of points at 1Hz,
+        against about 9s to parse it
+
+        Args:
+            gpx (:obj:`dict`): GPX details, see `file_details`
+            use_cache (bool, optional): False to always parse the file, without
+                caching it. Defaults to True
+        Returns:
+            :obj:`tracktotrip.Track`
+        """
+        key = (gpx['path'], gpx['mtime'], gpx['size'])
+        compact = self.track_cache.get(key) if use_cache else None
+        if compact is not None:
+            return compact.to_track()
+
+        track = tt.Track.from_gpx(gpx['path'])[0]
+        if use_cache:
+            self.track_cache.put(key, CompactTrack.from_track(track))
+        return track
+
+    def create_location_cache(self):
+        """ Creates the cache of nearby locations
+
+        See `query_locations`
+
+        Returns:
+            :obj:`cache.SpatialCache`
+        """
+        c_cache = self.config['location']['cache']
+        return SpatialCache(
+            c_cache['cells'],
+            c_cache['ttl'],
+            c_cache['cell_size'],
+            lambda location: location[1]
+        )
+
+    def tracks_cache_size(self):
+        """ Gets the maximum size of the parsed tracks cache
+
+        Returns:
+            int: Size in bytes
+        """
+        return int(self.config['cache']['tracks_memory'] * 1024 * 1024)
+
     def reload_queue(self):
         """ Reloads the current queue, filling it with the current file's details existing
             in the input folder
@@ -308,7 +680,9 @@ class ProcessingManager(object):
                 queue[day] = [gpx]
 
         self.queue = OrderedDict(sorted(queue.items()))
+        self.queue_version = self.queue_version + 1
         self.life_queue = lifes
+        self.prefetcher.discard()
 
     def next_day(self, delete=True):
         """ Advances a day (to next existing one)
@@ -317,18 +691,13 @@ class ProcessingManager(object):
             delete (bool, optional): True to delete day from queue, NOT from input folder.
                 Defaults to true
         """
+        day = self.following_day(delete)
         if delete:
             del self.queue[self.current_day]
-        existing_days = list(self.queue.keys())
-        if self.current_day in existing_days:
-            index = existing_days.index(self.current_day)
-            next_day = index if len(existing_days) > index + 1 else 0
-            existing_days.remove(self.current_day)
-        else:
-            next_day = 0
+            self.queue_version = self.queue_version + 1
 
-        if len(existing_days) > 0:
-            self.change_day(existing_days[next_day])
+        if day is not None:
+            self.change_day(day)
         else:
             self.reset()
 
@@ -364,16 +733,25 @@ class ProcessingManager(object):
         else:
             life = ''
 
-        if len(changes) > 0:
+        if data.get('edits'):
+            # raises edits.EditError before the state is changed
+            self.history.replace(apply_edits(self.current_track(), data['edits']))
+            self.speculative = None
+        elif len(changes) > 0:
             track = tt.Track.from_json(data['track'])
-            self.history[-1] = track
-        track = self.current_track().copy()
-
-        if step == Step.preview:
-            result = self.preview_to_adjust(track)#, changes)
+            self.history.replace(track)
+            self.speculative = None
+
+        if step == Step.preview and self.speculative:
+            result = self.speculative
+            self.speculative = None
+        elif step == Step.preview:
+            # points are changed in place by tracktotrip
+            result = self.preview_to_adjust(copy_points(self.current_track()))#, changes)
         elif step == Step.adjust:
-            result = self.adjust_to_annotate(track)
+            result = self.adjust_to_annotate(copy_segments(self.current_track()))
         elif step == Step.annotate:
+            track = copy_segments(self.current_track())
             if not life or len(life) == 0:
                 life = track.to_life()
             return self.annotate_to_next(track, life)
@@ -382,24 +760,146 @@ class ProcessingManager(object):
 
         if result:
             self.current_step = Step.next(self.current_step)
-            self.history.append(result)
+            self.history.push(result)
+            if self.current_step == Step.annotate:
+                self.prefetch()
 
         return result
 
     def bulk_process(self):
         """ Starts bulk processing all GPXs queued
+
+        Days go through a `pipeline.Pipeline`, with parsing, `preview_to_adjust`,
+        `adjust_to_annotate` and `store_day` as stages, so that reading the
+        files of the next days and storing the previous ones overlaps with
+        the processing of the current day. The number of days waiting
+        between stages is set by `bulk.queue_size`.
+
+        If `bulk.parallel` is set, the CPU bound steps of each day (parsing,
+        `preview_to_adjust` and transportation mode inference) run in a pool
+        of `bulk.processes` processes, defaulting to the number of CPUs.
+        At most one day per process, plus `bulk.queue_size`, is handed to the
+        pool and not yet read, so memory stays bounded when storing is slower
+        than the workers.
+        Location inference and storage always run in this process, in queue
+        order, so database writes and canonical trips learning are the same
+        in both modes.
+
+        Returns:
+            :obj:`dict`: Bulk processing statistics, see `update_bulk_stats`
         """
+        c_bulk = self.config['bulk']
         self.is_bulk_processing = True
-        lifes = [open(expanduser(join(self.config['input_path'], f)), 'r') for f in self.life_queue]
-        lifes = u'\n'.join(lifes)
-        while len(self.queue.values()) > 0:
-            # preview -> adjust
-            self.process({'changes': [], 'LIFE': ''})
-            # adjust -> annotate
-            self.process({'changes': [], 'LIFE': ''})
-            # annotate -> store
-            self.process({'changes': [], 'LIFE': lifes})
-        self.is_bulk_processing = False
+        lifes = self.read_lifes()
+        start_time = time.time()
+        jobs = list(self.queue.items())
+        total = len(jobs)
+        self.update_bulk_stats(0, total, start_time)
+
+        def parse(job):
+            day, gpxs = job
+            return day, self.load_track(gpxs, use_cache=False)
+
+        def transform(job):
+            day, track = job
+            return day, self.preview_to_adjust(track)
+
+        def enrich(job):
+            day, track = job
+            return day, self.adjust_to_annotate(track)
+
+        def enrich_location(job):
+            day, track = job
+            return day, self.infer_location(track)
+
+        def persist(job):
+            day, track = job
+            life = lifes if lifes else track.to_life()
+            self.store_day(day, track, life)
+            del self.queue[day]
+            self.queue_version = self.queue_version + 1
+            self.update_bulk_stats(total - len(self.queue), total, start_time)
+            return day
+
+        pool = None
+        try:
+            if c_bulk['parallel']:
+                processes = c_bulk['processes'] or cpu_count()
+                pool = Pool(
+                    processes=processes,
+                    initializer=init_bulk_worker,
+                    initargs=(self.config,)
+                )
+                source = bounded_imap(
+                    pool,
+                    bulk_process_day,
+                    jobs,
+                    processes + c_bulk['queue_size']
+                )
+                stages = [enrich_location, persist]
+            else:
+                source = jobs
+                stages = [parse, transform, enrich, persist]
+
+            Pipeline(stages, maxsize=c_bulk['queue_size']).run(source)
+
+            if pool:
+                pool.close()
+        except:
+            if pool:
+                pool.terminate()
+            raise
+        finally:
+            if pool:
+                pool.join()
+            self.is_bulk_processing = False
+
+        self.reset()
+        return self.bulk_stats
+
+    def read_lifes(self):
+        """ Reads the LIFE files in the input folder
+
+        Returns:
+            str: Content of all LIFE files
+        """
+        lifes = []
+        for life_file in self.life_queue:
+            with open(expanduser(join(self.config['input_path'], life_file)), 'r') as opened:
+                lifes.append(opened.read().decode('utf-8'))
+        return u'\n'.join(lifes)
+
+    def update_bulk_stats(self, done, total, start_time):
+        """ Updates and prints the bulk processing statistics
+
+        Args:
+            done (int): Number of days processed
+            total (int): Number of days to process
+            start_time (float): Time when bulk processing started, in seconds
+        """
+        elapsed = time.time() - start_time
+        self.bulk_stats = {
+            'done': done,
+            'total': total,
+            'elapsed': elapsed,
+            'daysPerMinute': done / elapsed * 60 if elapsed > 0 else 0.0
+        }
+        print 'Bulk processed %d/%d days, %.2f days/minute' % (
+            done, total, self.bulk_stats['daysPerMinute'])
+
+    def process_day(self, gpxs):
+        """ Runs the CPU bound steps of a day
+
+        Parses the GPXs, runs `preview_to_adjust` and infers the transportation
+        modes. Used by the bulk processing workers
+
+        Args:
+            gpxs (:obj:`list` of :obj:`dict`): GPXs details, see `file_details`
+        Returns:
+            :obj:`tracktotrip.Track`
+        """
+        track = self.preview_to_adjust(self.load_track(gpxs, use_cache=False))
+        return self.infer_transportation_mode(track)
 
     def preview_to_adjust(self, track):
         """ Processes a track so that it becomes a trip
@@ -440,72 +940,243 @@ class ProcessingManager(object):
         Returns:
             :obj:`tracktotrip.Track`
         """
+        self.infer_location(track)
+        return self.infer_transportation_mode(track)
 
-        config = self.config
-        c_loc = config['location']
+    def infer_location(self, track):
+        """ Infers the start and end locations of each segment
 
-        conn, cur = self.db_connect()
+        Args:
+            track (:obj:`tracktotrip.Track`)
+        Returns:
+            :obj:`tracktotrip.Track`
+        """
 
-        def get_locations(point, radius):
-            """ Gets locations within a radius of a point
+        c_loc = self.config['location']
+        providers = self.place_providers()
+
+        for segment in track.segments:
+            segment.location_from, segment.location_to = [
+                infer_location(
+                    point,
+                    self.query_locations,
+                    c_loc['max_distance'],
+                    providers,
+                    c_loc['limit']
+                )
+                for point in [segment.points[0], segment.points[-1]]
+            ]
 
-            See `db.query_locations`
+        return track
 
-            Args:
-                point (:obj:`tracktotrip.Point`)
-                radius (float): Radius, in meters
-            Returns:
-                :obj:`list` of (str, ?, ?)
-            """
-            if cur:
-                return db.query_locations(cur, point.lat, point.lon, radius)
-            else:
-                return []
-
-        track.infer_location(
-            get_locations,
-            max_distance=c_loc['max_distance'],
-            google_key=c_loc['google_key'],
-            foursquare_client_id=c_loc['foursquare_client_id'],
-            foursquare_client_secret=c_loc['foursquare_client_secret'],
-            limit=c_loc['limit']
-        )
-        track.infer_transportation_mode(
+    def place_providers(self):
+        """ Gets the enabled place providers, see `places`
+
+        Their results are cached, if the places cache is enabled
+
+        Returns:
+            :obj:`list`: Provider functions
+        """
+        c_loc = self.config['location']
+        providers = []
+        if c_loc['use_google'] and c_loc['google_key']:
+            providers.append(('google', google_provider(c_loc['google_key'])))
+        if c_loc['use_foursquare'] and c_loc['foursquare_client_id'] \
+                and c_loc['foursquare_client_secret']:
+            providers.append(('foursquare', foursquare_provider(
+                c_loc['foursquare_client_id'],
+                c_loc['foursquare_client_secret']
+            )))
+
+        places_cache = self.get_places_cache()
+        if places_cache is None:
+            return [provider for _, provider in providers]
+        return [places_cache.cached(name, provider) for name, provider in providers]
+
+    def get_places_cache(self):
+        """ Gets the cache of place providers' results
+
+        Returns:
+            :obj:`places.PlacesCache`: None if it's disabled, or there isn't
+                a path to store it
+        """
+        c_cache = self.config['location']['places_cache']
+        if not c_cache['use']:
+            return None
+        if c_cache['path']:
+            path = expanduser(c_cache['path'])
+        elif self.config['input_path']:
+            path = join(expanduser(self.config['input_path']), '.places.sqlite')
+        else:
+            return None
+
+        if self.places_cache is None or self.places_cache.path != path:
+            self.places_cache = PlacesCache(
+                path,
+                c_cache['ttl'],
+                c_cache['max_entries'],
+                c_cache['precision']
+            )
+        else:
+            self.places_cache.ttl = c_cache['ttl']
+            self.places_cache.max_entries = c_cache['max_entries']
+            self.places_cache.precision = c_cache['precision']
+        return self.places_cache
+
+    def query_locations(self, point, radius):
+        """ Gets locations within a radius of a point
+
+        See `db.query_locations`. Results are cached, see `cache.SpatialCache`,
+        and invalidated when locations change
+
+        Args:
+            point (:obj:`tracktotrip.Point`)
+            radius (float): Radius, in meters
+        Returns:
+            :obj:`list` of (str, :obj:`tracktotrip.Point`, :obj:`tracktotrip.Segment`)
+        """
+        if not self.config['location']['cache']['use']:
+            return self.fetch_locations(point.lat, point.lon, radius * 4) or []
+
+        # db.query_locations searches within four times the radius
+        return self.location_cache.get(point.lat, point.lon, radius * 4, self.fetch_locations)
+
+    def fetch_locations(self, lat, lon, max_distance):
+        """ Gets locations within a distance of a point, from the database
+
+        Args:
+            lat (float)
+            lon (float)
+            max_distance (float): Distance, in meters
+        Returns:
+            :obj:`list` of (str, :obj:`tracktotrip.Point`, :obj:`tracktotrip.Segment`):
+                None if there's no connection to the database
+        """
+        conn, cur = self.db_connect()
+        if not cur:
+            return None
+        result = db.query_locations(cur, lat, lon, max_distance / 4.0)
+        self.db_dispose(conn, cur)
+        return result
+
+    def infer_transportation_mode(self, track):
+        """ Infers the transportation modes of each segment
+
+        Args:
+            track (:obj:`tracktotrip.Track`)
+        Returns:
+            :obj:`tracktotrip.Track`
+        """
+        return track.infer_transportation_mode(
             self.clf,
-            config['transportation']['min_time']
+            self.config['transportation']['min_time']
         )
 
-        db.dispose(conn, cur)
+    def close(self):
+        """ Stops listening to database changes and closes the connection pool
 
-        return track
+        The manager shouldn't be used afterwards
+        """
+        for remove in self.listeners:
+            remove()
+        self.listeners = []
+        self.prefetcher.discard()
+        with self.db_lock:
+            if self.db_pool is not None:
+                self.db_pool.close()
+                self.db_pool = None
 
     def db_connect(self):
-        """ Creates a connection with the database
+        """ Gets a connection with the database, from the pool
 
-        Use `db.dispose` to commit and close cursor and connection
+        Use `db_dispose` to commit, close the cursor and release the connection
 
         Returns:
             (psycopg2.connection, psycopg2.cursor): Both are None if the connection is invalid
         """
         dbc = self.config['db']
-        conn = db.connect_db(dbc['host'], dbc['name'], dbc['user'], dbc['port'], dbc['pass'])
-        if conn:
-            return conn, conn.cursor()
-        else:
+        if dbc['host'] is None or dbc['name'] is None or dbc['user'] is None \
+                or dbc['pass'] is None:
+            return None, None
+
+        with self.db_lock:
+            if self.db_pool is None:
+                self.db_pool = db.ConnectionPool(
+                    dbc['pool_min'],
+                    dbc['pool_max'],
+                    host=dbc['host'],
+                    database=dbc['name'],
+                    user=dbc['user'],
+                    password=dbc['pass'],
+                    port=dbc['port']
+                )
+            pool = self.db_pool
+        try:
+            conn = pool.connect()
+        except psycopg2.Error:
             return None, None
+        with self.db_lock:
+            self.db_pools[conn] = pool
+        return conn, conn.cursor()
+
+    def db_dispose(self, conn, cur, rollback=False):
+        """ Commits, closes the cursor and releases a connection to the pool
+
+        The connection is released to the pool it was got from, that may
+        have been replaced since, see `update_config`
+
+        Args:
+            conn (:obj:`psycopg2.connection`)
+            cur (:obj:`psycopg2.cursor`)
+            rollback (bool, optional): Rolls back, instead of committing.
+                Defaults to False
+        """
+        if cur:
+            cur.close()
+        if conn:
+            with self.db_lock:
+                pool = self.db_pools.get(conn)
+            if pool is None:
+                return
+            # a failed commit also returns the connection
+            released = True
+            try:
+                released = pool.release(conn, rollback)
+            finally:
+                if released:
+                    with self.db_lock:
+                        self.db_pools.pop(conn, None)
 
     def annotate_to_next(self, track, life):
         """ Stores the track and dequeues another track to be
         processed.
 
-        Moves the current GPX file from the input path to the
+        See `store_day`
+
+        Args:
+            track (:obj:tracktotrip.Track`)
+            life (str): LIFE formated string of the track
+        Returns:
+            :obj:`tracktotrip.Track`: Track of the next day
+        """
+        self.store_day(self.current_day, track, life)
+
+        self.next_day()
+        self.current_step = Step.preview
+        return self.current_track()
+
+    def store_day(self, day, track, life):
+        """ Stores the track of a day
+
+        Moves the GPX files of the day from the input path to the
         backup path, creates a LIFE file in the life path
         and creates a trip entry in the database. Finally the
         trip is exported as a GPX file to the output path.
 
         Args:
+            day (str): Day of the track, must be in the queue
             track (:obj:tracktotrip.Track`)
-            changes (:obj:`list` of :obj:`dict`): Details of, user made, changes
+            life (str): LIFE formated string of the track
         """
 
         if not track.name or len(track.name) == 0:
@@ -535,82 +1206,59 @@ class ProcessingManager(object):
         conn, cur = self.db_connect()
 
         if conn and cur:
-
-            db.load_from_segments_annotated(
-                cur,
-                self.current_track(),
-                life,
-                self.config['location']['max_distance'],
-                self.config['location']['min_samples']
-            )
-
-            def insert_can_trip(can_trip, mother_trip_id):
-                """ Insert a cannonical trip into the database
-
-                See `db.insert_canonical_trip`
-
-                Args:
-                    can_trip (:obj:`tracktotrip.Segment`): Canonical trip
-                    mother_trip_id (int): Id of the trip that originated the canonical
-                        representation
-                Returns:
-                    int: Canonical trip id
-                """
-                return db.insert_canonical_trip(cur, can_trip, mother_trip_id)
-
-            def update_can_trip(can_id, trip, mother_trip_id):
-                """ Updates a cannonical trip on the database
-
-                See `db.update_canonical_trip`
-
-                Args:
-                    can_id (int): Canonical trip id
-                    trip (:obj:`tracktotrip.Segment`): Canonical trip
-                    mother_trip_id (int): Id of the trip that originated the canonical
-                        representation
-                """
-                db.update_canonical_trip(cur, can_id, trip, mother_trip_id)
-
-            trips_ids = []
-            for trip in track.segments:
-                # To database
-                trip_id = db.insert_segment(
+            # the day is written in a single transaction
+            try:
+                db.load_from_segments_annotated(
                     cur,
-                    trip,
+                    track,
+                    life,
                     self.config['location']['max_distance'],
                     self.config['location']['min_samples']
                 )
-                trips_ids.append(trip_id)
 
+                trips_ids = db.insert_segments(cur, track.segments)
+
+                # Build/learn canonical trips
                 d_latlon = estimate_meters_to_deg(self.config['location']['max_distance'])
-                # Build/learn canonical trip
-                canonical_trips = db.match_canonical_trip(cur, trip, d_latlon)
-                print "canonical_trips # = %d" % len(canonical_trips)
-
-                learn_trip(
-                    trip,
-                    trip_id,
-                    canonical_trips,
-                    insert_can_trip,
-                    update_can_trip,
-                    self.config['simplification']['eps'],
-                    d_latlon
+                canonical = db.CanonicalTripsBatch(
+                    cur,
+                    track.segments,
+                    d_latlon,
+                    self.canonical_index if self.config['trip_learning']['index']['use'] else None
                 )
-
-            # db.insertStays(cur, trip, trips_ids, life)
-            db.dispose(conn, cur)
+                for trip, trip_id in zip(track.segments, trips_ids):
+                    canonical_trips = canonical.match(trip, d_latlon)
+                    print "canonical_trips # = %d" % len(canonical_trips)
+
+                    learn_trip(
+                        trip,
+                        trip_id,
+                        canonical_trips,
+                        canonical.insert,
+                        canonical.update,
+                        self.config['simplification']['eps'],
+                        d_latlon
+                    )
+                canonical.flush()
+            except Exception:
+                self.db_dispose(conn, cur, rollback=True)
+                # the index may have changes that were rolled back
+                self.canonical_index.clear()
+                raise
+            try:
+                self.db_dispose(conn, cur)
+            except Exception:
+                # the commit failed, so the index has changes that weren't stored
+                self.canonical_index.clear()
+                raise
 
         # Backup
         if self.config['backup_path']:
-            for gpx in self.queue[self.current_day]:
+            for gpx in self.queue[day]:
                 from_path = gpx['path']
                 to_path = join(expanduser(self.config['backup_path']), gpx['name'])
                 rename(from_path, to_path)
 
-        self.next_day()
-        self.current_step = Step.preview
-        return self.current_track()
-
     def current_track(self):
         """ Gets the current trip/track
 
@@ -621,10 +1269,25 @@ class ProcessingManager(object):
         """
         if self.current_step is Step.done:
             return None
-        elif len(self.history) > 0:
-            return self.history[-1]
         else:
-            return None
+            return self.history.current()
+
+    def state_etag(self):
+        """ Gets a tag that changes whenever the current state changes
+
+        It's based on the current step and day, and on the versions of the
+        history and of the queue. See `current_state`
+
+        Returns:
+            str
+        """
+        return '%s-%s-%s-%d-%d' % (
+            self.instance_id,
+            self.current_step,
+            self.current_day,
+            self.history.version,
+            self.queue_version
+        )
 
     def current_state(self):
         """ Gets the current processing/server state
@@ -639,7 +1302,8 @@ class ProcessingManager(object):
             'track': current.to_json() if current else None,
             'life': current.to_life() if current and self.current_step is Step.annotate else '',
             'currentDay': self.current_day,
-            'lifeQueue': self.life_queue
+            'lifeQueue': self.life_queue,
+            'history': self.history.footprint()
         }
 
     def complete_trip(self, from_point, to_point):
@@ -670,7 +1334,7 @@ class ProcessingManager(object):
             # get matching canonical trips, based on bounding box
             canonical_trips = db.match_canonical_trip_bounds(cur, b_box)
             print(len(canonical_trips))
-            db.dispose(conn, cur)
+            self.db_dispose(conn, cur)
 
         return complete_trip(canonical_trips, from_point, to_point, self.config['location']['max_distance'])
 
@@ -693,43 +1357,47 @@ class ProcessingManager(object):
                 self.config['location']['min_samples']
             )
 
-        db.dispose(conn, cur)
+        self.db_dispose(conn, cur)
 
     def update_config(self, new_config):
+        db_config = dict(self.config['db'])
         update_dict(self.config, new_config)
+        if self.config['db'] != db_config:
+            self.canonical_index.clear()
+            # connections in use are closed when they're released
+            with self.db_lock:
+                if self.db_pool is not None:
+                    self.db_pool.close()
+                    self.db_pool = None
+        clf_path = self.config['transportation']['classifier_path']
+        if clf_path != self.classifier.path:
+            self.classifier = LazyClassifier(clf_path)
+        self.track_cache.max_size = self.tracks_cache_size()
+        self.canonical_index.geometries.max_size = \
+            self.config['trip_learning']['index']['max_points']
+        c_cache = self.config['location']['cache']
+        self.location_cache.cells.max_size = c_cache['cells']
+        self.location_cache.ttl = c_cache['ttl']
+        self.location_cache.cell_size = c_cache['cell_size']
+        # the database, or cell size, may have changed
+        self.location_cache.clear()
+        self.config_version = self.config_version + 1
+        self.prefetcher.discard()
+        self.speculative = None
         if self.current_step is Step.done:
             self.load_days()
+        elif self.current_step == Step.annotate:
+            self.prefetch()
 
     def location_suggestion(self, point):
         c_loc = self.config['location']
-        conn, cur = self.db_connect()
-
-        def get_locations(point, radius):
-            """ Gets locations within a radius of a point
-
-            See `db.query_locations`
-
-            Args:
-                point (:obj:`tracktotrip.Point`)
-                radius (float): Radius, in meters
-            Returns:
-                :obj:`list` of (str, ?, ?)
-            """
-            if cur:
-                return db.query_locations(cur, point.lat, point.lon, radius)
-            else:
-                return []
-
         locs = infer_location(
             point,
-            get_locations,
-            max_distance=c_loc['max_distance'],
-            google_key=c_loc['google_key'],
-            foursquare_client_id=c_loc['foursquare_client_id'],
-            foursquare_client_secret=c_loc['foursquare_client_secret'],
-            limit=c_loc['limit']
+            self.query_locations,
+            c_loc['max_distance'],
+            self.place_providers(),
+            c_loc['limit']
         )
-        db.dispose(conn, cur)
 
         return locs.to_json()
 
@@ -737,34 +1405,194 @@ class ProcessingManager(object):
         conn, cur = self.db_connect()
         result = []
         if conn and cur:
-            result = db.get_canonical_trips(cur)
+            result = db.get_canonical_trips(cur, as_json=True)
         for val in result:
-            val['points'] = val['points'].to_json()
             val['points']['id'] = val['id']
-        db.dispose(conn, cur)
+        self.db_dispose(conn, cur)
         return [r['points'] for r in result]
 
+    def get_canonical_trips_page(self, bbox=None, zoom=None, cursor=None, limit=None):
+        """ Gets a page of canonical trips, see `db.get_canonical_trips_page`
+
+        Args:
+            bbox ((float, float, float, float), optional): Min latitude, min
+                longitude, max latitude and max longitude. Defaults to None
+            zoom (int, optional): Defaults to None
+            cursor (int, optional): Defaults to None
+            limit (int, optional): Defaults to `canonical_trips.page_size`,
+                and is kept between 1 and `canonical_trips.max_page_size`
+        Returns:
+            :obj:`dict`: With the canonical trips, in the same format as
+                `get_canonical_trips`, and the cursor of the next page:
+                { 'trips': [...], 'next': 12 }
+        """
+        c_trips = self.config['canonical_trips']
+        limit = max(min(limit or c_trips['page_size'], c_trips['max_page_size']), 1)
+        conn, cur = self.db_connect()
+        result, next_cursor = [], None
+        if conn and cur:
+            result, next_cursor = db.get_canonical_trips_page(cur, bbox, zoom, cursor, limit)
+        for val in result:
+            val['points']['id'] = val['id']
+        self.db_dispose(conn, cur)
+        return {'trips': [r['points'] for r in result], 'next': next_cursor}
+
     def get_canonical_locations(self):
         conn, cur = self.db_connect()
         result = []
         if conn and cur:
-            result = db.get_canonical_locations(cur)
+            result = db.get_canonical_locations(cur, as_json=True)
         for val in result:
-            val['points'] = val['points'].to_json()
             val['points']['label'] = val['label']
-        db.dispose(conn, cur)
+        self.db_dispose(conn, cur)
         return [r['points'] for r in result]
 
+    def iter_location_summaries(self, bbox=None):
+        """ Gets summaries of the locations, see `db.iter_location_summaries`
+
+        The database connection is held until all summaries are read, or
+        the generator is closed. Then, the server side cursor is closed
+        before the connection is released to the pool
+
+        Args:
+            bbox ((float, float, float, float), optional): Min latitude, min
+                longitude, max latitude and max longitude. Defaults to None
+        Yields:
+            :obj:`dict`
+        """
+        conn, cur = self.db_connect()
+        if not conn or not cur:
+            return
+        summaries = db.iter_location_summaries(conn, bbox)
+        try:
+            for summary in summaries:
+                yield summary
+        finally:
+            try:
+                summaries.close()
+            finally:
+                self.db_dispose(conn, cur)
+
+    def get_canonical_location(self, location_id):
+        """ Gets a location, with its point cluster
+
+        Args:
+            location_id (int)
+        Returns:
+            :obj:`dict`: In the same format as the elements of
+                `get_canonical_locations`, with its id. None if it doesn't exist
+        """
+        conn, cur = self.db_connect()
+        result = None
+        if conn and cur:
+            result = db.get_canonical_location(cur, location_id)
+        self.db_dispose(conn, cur)
+        if result is None:
+            return None
+        result['points']['id'] = result['id']
+        result['points']['label'] = result['label']
+        return result['points']
+
+    def get_tile_cache(self):
+        """ Gets the cache of rendered tiles
+
+        Returns:
+            :obj:`tiles.TileCache`: None if it's disabled, or there isn't a
+                path to store it
+        """
+        c_tiles = self.config['tiles']
+        if not c_tiles['use']:
+            return None
+        if c_tiles['path']:
+            path = expanduser(c_tiles['path'])
+        elif self.config['input_path']:
+            path = join(expanduser(self.config['input_path']), '.tiles')
+        else:
+            return None
+
+        if self.tile_cache is None or self.tile_cache.path != path:
+            self.tile_cache = TileCache(path, c_tiles['ttl'])
+        else:
+            self.tile_cache.ttl = c_tiles['ttl']
+        return self.tile_cache
+
+    def invalidate_tiles(self, layer, bounds):
+        """ Removes the cached tiles of a layer that cover an area
+
+        Called once the changes of its rows are committed, so tiles aren't
+        rendered again from the previous rows. See `db.on_change`
+
+        Args:
+            layer (str): See `tiles.LAYERS`
+            bounds ((float, float, float, float)): Min latitude, min longitude,
+                max latitude and max longitude
+        """
+        cache = self.get_tile_cache()
+        if cache is not None:
+            cache.invalidate(layer, bounds)
+
+    def get_tile(self, layer, z, x, y):
+        """ Gets a Mapbox Vector Tile of a layer
+
+        Args:
+            layer (str): See `tiles.LAYERS`
+            z (int): Zoom level
+            x (int)
+            y (int)
+        Returns:
+            str: Tile, empty if it doesn't have features or there isn't a
+                database. None if the layer or the tile don't exist
+        """
+        c_tiles = self.config['tiles']
+        if layer not in LAYERS or not is_valid_tile(z, x, y, c_tiles['max_zoom']):
+            return None
+
+        cache = self.get_tile_cache()
+        tile = cache.get(layer, z, x, y) if cache is not None else None
+        if tile is not None:
+            return tile
+
+        conn, cur = self.db_connect()
+        if not conn or not cur:
+            return ''
+        try:
+            tile = render_tile(cur, layer, z, x, y, c_tiles['extent'], c_tiles['buffer'])
+        except Exception:
+            self.db_dispose(conn, cur, rollback=True)
+            raise
+        self.db_dispose(conn, cur)
+        if cache is not None:
+            cache.put(layer, z, x, y, tile)
+        return tile
+
     def get_transportation_suggestions(self, points):
         segment = tt.Segment(points).compute_metrics()
         points = segment.points
         modes = classify(self.clf, points, self.config['transportation']['min_time'])
         return modes['classification']
 
+    def get_transportation_suggestions_batch(self, segments):
+        """ Classifies the transportation mode of many segments at once
+
+        See `transportation.classify_segments`
+
+        Args:
+            segments (:obj:`list` of :obj:`list` of :obj:`dict`): Points, in
+                their JSON representation, of each segment
+        Returns:
+            :obj:`list` of :obj:`dict`: Classification of each segment, like
+                `get_transportation_suggestions`
+        """
+        return classify_segments(self.clf, segments)
+
     def remove_day(self, day):
         if day in self.queue.keys():
             if day == self.current_day:
                 self.next_day()
             else:
                 del self.queue[day]
+                self.queue_version = self.queue_version + 1
+                self.prefetcher.discard()
+                if self.current_step == Step.annotate:
+                    self.prefetch()
 
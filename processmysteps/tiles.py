@@ -0,0 +1,280 @@
+"""
+Mapbox Vector Tiles of trips, canonical trips and locations
+
+Tiles are rendered by PostGIS, with `ST_AsMVT`, and follow the XYZ scheme
+of web maps. Geometries are simplified to the size of a pixel of the zoom
+level, and clipped to the tile. Rendered tiles are cached on disk, see
+`TileCache`.
+"""
+import math
+import time
+from os import listdir, makedirs, remove, rename
+from os.path import join, isdir, isfile, getmtime
+from uuid import uuid4
+
+# Half of the circumference of the earth, in web mercator meters
+MERCATOR_LIMIT = 20037508.342789244
+TILE_SIZE = 256
+
+# Layers, by name. Rows are filtered by the bounds of the tile, with the
+# filter, and rendered with the geometry and the attributes
+LAYERS = {
+    'trips': {
+        'table': 'trips',
+        'geometry': 'points',
+        'attributes': 'trip_id AS id, start_location, end_location, ' \
+            'start_date::text AS start_date, end_date::text AS end_date',
+        # trips bounds have the latitude as x, see db.gis_bounds
+        'filter': 'bounds && ST_MakeEnvelope(%(min_lat)s, %(min_lon)s, %(max_lat)s, %(max_lon)s, 4326)'
+    },
+    'canonical_trips': {
+        'table': 'canonical_trips',
+        'geometry': 'points',
+        'attributes': 'canonical_id AS id',
+        'filter': 'bounds && ST_MakeEnvelope(%(min_lat)s, %(min_lon)s, %(max_lat)s, %(max_lon)s, 4326)'
+    },
+    'locations': {
+        'table': 'locations',
+        'geometry': 'centroid',
+        'attributes': 'location_id AS id, label, ST_NPoints(point_cluster::geometry) AS samples',
+        'filter': 'centroid && ST_MakeEnvelope(%(min_lon)s, %(min_lat)s, %(max_lon)s, %(max_lat)s, 4326)'
+    }
+}
+
+def is_valid_tile(z, x, y, max_zoom):
+    """ Checks if tile coordinates exist
+
+    Args:
+        z (int): Zoom level
+        x (int)
+        y (int)
+        max_zoom (int): Max zoom level
+    Returns:
+        bool
+    """
+    return 0 <= z <= max_zoom and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+def tile_latlon(z, x, y):
+    """ Latitude and longitude of the top left corner of a tile
+
+    Args:
+        z (int)
+        x (int)
+        y (int)
+    Returns:
+        (float, float)
+    """
+    tiles = 2.0 ** z
+    lon = x / tiles * 360.0 - 180.0
+    lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / tiles))))
+    return lat, lon
+
+def tile_bounds(z, x, y, margin=0.0):
+    """ Bounds of a tile, in degrees
+
+    Args:
+        z (int)
+        x (int)
+        y (int)
+        margin (float, optional): Fraction of the tile to extend the bounds
+            by, on each side. Defaults to 0
+    Returns:
+        (float, float, float, float): Min latitude, min longitude, max latitude
+            and max longitude
+    """
+    max_lat, min_lon = tile_latlon(z, x - margin, max(y - margin, 0))
+    min_lat, max_lon = tile_latlon(z, x + 1 + margin, min(y + 1 + margin, 2 ** z))
+    return min_lat, min_lon, max_lat, max_lon
+
+def mercator_bounds(z, x, y):
+    """ Bounds of a tile, in web mercator meters
+
+    Args:
+        z (int)
+        x (int)
+        y (int)
+    Returns:
+        (float, float, float, float): Min x, min y, max x and max y
+    """
+    size = 2 * MERCATOR_LIMIT / 2 ** z
+    min_x = -MERCATOR_LIMIT + x * size
+    max_y = MERCATOR_LIMIT - y * size
+    return min_x, max_y - size, min_x + size, max_y
+
+def tile_range(bounds, z):
+    """ Tiles that cover an area
+
+    Args:
+        bounds ((float, float, float, float)): Min latitude, min longitude,
+            max latitude and max longitude
+        z (int)
+    Returns:
+        (int, int, int, int): Min x, min y, max x and max y, inclusive
+    """
+    tiles = 2 ** z
+    def to_x(lon):
+        return min(max(int((lon + 180.0) / 360.0 * tiles), 0), tiles - 1)
+    def to_y(lat):
+        lat = min(max(lat, -85.0511287798), 85.0511287798)
+        merc = math.log(math.tan(math.radians(lat)) + 1 / math.cos(math.radians(lat)))
+        return min(max(int((1 - merc / math.pi) / 2 * tiles), 0), tiles - 1)
+    return to_x(bounds[1]), to_y(bounds[2]), to_x(bounds[3]), to_y(bounds[0])
+
+def render_tile(cur, layer, z, x, y, extent=4096, buffer_size=64):
+    """ Renders a tile of a layer
+
+    Args:
+        cur (:obj:`psycopg2.cursor`)
+        layer (str): Name of the layer, see `LAYERS`
+        z (int)
+        x (int)
+        y (int)
+        extent (int, optional): Size of the tile, in its coordinates.
+            Defaults to 4096
+        buffer_size (int, optional): Size of the area outside the tile that's
+            kept when clipping, in tile coordinates. Defaults to 64
+    Returns:
+        str: Tile, as a Mapbox Vector Tile. Empty if it doesn't have features
+    """
+    definition = LAYERS[layer]
+    min_lat, min_lon, max_lat, max_lon = tile_bounds(z, x, y, float(buffer_size) / extent)
+    min_x, min_y, max_x, max_y = mercator_bounds(z, x, y)
+    params = {
+        'layer': layer,
+        'min_lat': min_lat,
+        'min_lon': min_lon,
+        'max_lat': max_lat,
+        'max_lon': max_lon,
+        'min_x': min_x,
+        'min_y': min_y,
+        'max_x': max_x,
+        'max_y': max_y,
+        'extent': extent,
+        'buffer': buffer_size,
+        # one pixel of the zoom level
+        'tolerance': 2 * MERCATOR_LIMIT / (TILE_SIZE * 2 ** z)
+    }
+    cur.execute("""
+        SELECT ST_AsMVT(tile, %%(layer)s, %%(extent)s, 'geom')
+        FROM (
+            SELECT %(attributes)s, ST_AsMVTGeom(
+                ST_Simplify(ST_Transform(ST_Force2D(%(geometry)s::geometry), 3857), %%(tolerance)s),
+                ST_MakeEnvelope(%%(min_x)s, %%(min_y)s, %%(max_x)s, %%(max_y)s, 3857),
+                %%(extent)s,
+                %%(buffer)s,
+                true
+            ) AS geom
+            FROM %(table)s
+            WHERE %(filter)s
+        ) AS tile
+        WHERE geom IS NOT NULL
+        """ % {
+            'attributes': definition['attributes'],
+            'geometry': definition['geometry'],
+            'table': definition['table'],
+            'filter': definition['filter'].replace('%(', '%%(')
+        }, params)
+    row = cur.fetchone()
+    return str(row[0]) if row is not None and row[0] is not None else ''
+
+class TileCache(object):
+    """ Cache of rendered tiles, in a directory
+
+    Tiles are stored as <layer>/<z>/<x>/<y>.mvt, and expire after some time
+
+    Attributes:
+        path (str): Directory of the cache
+        ttl (float): Time, in seconds, that tiles are kept
+    """
+    def __init__(self, path, ttl):
+        self.path = path
+        self.ttl = ttl
+
+    def tile_path(self, layer, z, x, y):
+        """ Path of a tile
+
+        Args:
+            layer (str)
+            z (int)
+            x (int)
+            y (int)
+        Returns:
+            str
+        """
+        return join(self.path, layer, str(z), str(x), '%d.mvt' % y)
+
+    def get(self, layer, z, x, y):
+        """ Gets a tile
+
+        Args:
+            layer (str)
+            z (int)
+            x (int)
+            y (int)
+        Returns:
+            str: None if it isn't cached, or it expired
+        """
+        path = self.tile_path(layer, z, x, y)
+        try:
+            if getmtime(path) + self.ttl < time.time():
+                return None
+            with open(path, 'rb') as tile_file:
+                return tile_file.read()
+        except (IOError, OSError):
+            return None
+
+    def put(self, layer, z, x, y, tile):
+        """ Stores a tile
+
+        It's written to a temporary file first, so readers never see a
+        partial tile
+
+        Args:
+            layer (str)
+            z (int)
+            x (int)
+            y (int)
+            tile (str)
+        """
+        path = self.tile_path(layer, z, x, y)
+        directory = join(self.path, layer, str(z), str(x))
+        if not isdir(directory):
+            try:
+                makedirs(directory)
+            except OSError:
+                if not isdir(directory):
+                    raise
+        temp_path = '%s.%s.tmp' % (path, uuid4().hex[:8])
+        with open(temp_path, 'wb') as tile_file:
+            tile_file.write(tile)
+        rename(temp_path, path)
+
+    def invalidate(self, layer, bounds):
+        """ Removes the cached tiles of a layer that cover an area
+
+        Only the cached tiles are visited, so it's cheap for large areas.
+        Neighbour tiles are also removed, as features are kept in their buffer
+
+        Args:
+            layer (str)
+            bounds ((float, float, float, float)): Min latitude, min longitude,
+                max latitude and max longitude
+        """
+        layer_path = join(self.path, layer)
+        if not isdir(layer_path):
+            return
+        for z in listdir(layer_path):
+            if not z.isdigit():
+                continue
+            min_x, min_y, max_x, max_y = tile_range(bounds, int(z))
+            for x in listdir(join(layer_path, z)):
+                if not x.isdigit() or not min_x - 1 <= int(x) <= max_x + 1:
+                    continue
+                for name in listdir(join(layer_path, z, x)):
+                    y = name.split('.')[0]
+                    path = join(layer_path, z, x, name)
+                    if y.isdigit() and min_y - 1 <= int(y) <= max_y + 1 and isfile(path):
+                        try:
+                            remove(path)
+                        except OSError:
+                            pass
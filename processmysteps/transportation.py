@@ -0,0 +1,119 @@
+"""
+Vectorized transportation mode classification of many segments
+
+Computes the same metrics and features as tracktotrip, see
+`tracktotrip.Point.compute_metrics` and
+`tracktotrip.transportation_mode.extract_features_2`, with numpy arrays
+instead of `tracktotrip.Point` instances
+"""
+import numpy as np
+
+# Meters in one degree, and earth radius in meters, as used by tracktotrip
+ONE_DEGREE = 1000. * 10000.8 / 90.
+EARTH_RADIUS = 6371 * 1000
+# Lat/lon difference, in degrees, from which the haversine distance is used
+HAVERSINE_THRESHOLD = .2
+STEPS = np.array([0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9])
+
+def parse_points(points):
+    """ Converts points, in their JSON representation, to arrays
+
+    Times are truncated to the second, like `tracktotrip.utils.isostr_to_datetime`
+
+    Args:
+        points (:obj:`list` of :obj:`dict`): See `tracktotrip.Point.from_json`
+    Returns:
+        (:obj:`numpy.ndarray`, :obj:`numpy.ndarray`, :obj:`numpy.ndarray`):
+            Latitudes, longitudes and times, as datetime64[s]
+    """
+    lats = np.array([point['lat'] for point in points], dtype=np.float64)
+    lons = np.array([point['lon'] for point in points], dtype=np.float64)
+    times = np.array([point['time'][:19] for point in points], dtype='datetime64[s]')
+    return lats, lons, times
+
+def compute_metrics(lats, lons, times):
+    """ Computes the time difference and velocity of each point
+
+    The first point has both set to 0
+
+    Args:
+        lats (:obj:`numpy.ndarray`)
+        lons (:obj:`numpy.ndarray`)
+        times (:obj:`numpy.ndarray`): As datetime64
+    Returns:
+        (:obj:`numpy.ndarray`, :obj:`numpy.ndarray`): Time differences, in
+            seconds, and velocities, in meters per second
+    """
+    d_t = np.zeros(len(lats))
+    vel = np.zeros(len(lats))
+    if len(lats) < 2:
+        return d_t, vel
+
+    d_t[1:] = np.abs((times[1:] - times[:-1]) / np.timedelta64(1, 's'))
+
+    d_lat = lats[1:] - lats[:-1]
+    d_lon = lons[1:] - lons[:-1]
+    d_x = np.sqrt(d_lat ** 2 + (d_lon * np.cos(lats[1:] / 180. * np.pi)) ** 2) * ONE_DEGREE
+
+    far = (np.abs(d_lat) > HAVERSINE_THRESHOLD) | (np.abs(d_lon) > HAVERSINE_THRESHOLD)
+    if far.any():
+        lat_1 = np.radians(lats[1:][far])
+        lat_2 = np.radians(lats[:-1][far])
+        a = np.sin(np.radians(d_lat[far]) / 2) ** 2 + \
+            np.sin(np.radians(d_lon[far]) / 2) ** 2 * np.cos(lat_1) * np.cos(lat_2)
+        d_x[far] = EARTH_RADIUS * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+    moving = d_t[1:] != 0
+    vel[1:][moving] = d_x[moving] / d_t[1:][moving]
+    return d_t, vel
+
+def extract_features(d_t, vel):
+    """ Velocities below which each decile of the time is spent
+
+    Velocities are rounded to integers, like in a histogram
+
+    Args:
+        d_t (:obj:`numpy.ndarray`): Time differences, in seconds
+        vel (:obj:`numpy.ndarray`): Velocities, in meters per second
+    Returns:
+        :obj:`numpy.ndarray`: Features, or None if the segment doesn't have any
+    """
+    if len(vel) == 0:
+        return None
+    # tracktotrip rounds half away from zero, and velocities aren't negative
+    bins = np.floor(vel + 0.5).astype(np.int64)
+    histogram = np.bincount(bins, weights=d_t)
+    total = float(sum(histogram.tolist()))
+    if total == 0:
+        return None
+
+    cumulative = np.cumsum(histogram / total)
+    indexes = np.searchsorted(cumulative, STEPS, side='right')
+    if indexes[-1] >= len(cumulative):
+        return None
+    return indexes.astype(np.float64)
+
+def classify_segments(clf, segments):
+    """ Classifies the transportation mode of many segments
+
+    Runs a single prediction for all segments
+
+    Args:
+        clf (:obj:`tracktotrip.classifier.Classifier`)
+        segments (:obj:`list` of :obj:`list` of :obj:`dict`): Points, in
+            their JSON representation, of each segment
+    Returns:
+        :obj:`list` of :obj:`dict`: Probability of each transportation mode,
+            for each segment. None for segments without features
+    """
+    features = [
+        extract_features(*compute_metrics(*parse_points(points)))
+        for points in segments
+    ]
+    valid = [i for i, feature in enumerate(features) if feature is not None]
+    result = [None] * len(segments)
+    if len(valid) > 0:
+        probs = clf.predict(np.vstack([features[i] for i in valid]), verbose=True)
+        for i, prob in zip(valid, probs):
+            result[i] = prob
+    return result
@@ -65,3 +65,34 @@ CREATE TABLE IF NOT EXISTS canonical_trips_relations (
   canonical_trip SERIAL REFERENCES canonical_trips(canonical_id),
   trip SERIAL REFERENCES trips(trip_id)
   );
+
+-- Simplified canonical trips, per zoom level. See db.LOD_ZOOMS
+CREATE TABLE IF NOT EXISTS canonical_trips_lod (
+  canonical_id INTEGER REFERENCES canonical_trips(canonical_id) ON DELETE CASCADE,
+  zoom SMALLINT NOT NULL,
+  points geography(LINESTRINGZ, 4326) NOT NULL,
+  PRIMARY KEY (canonical_id, zoom)
+);
+
+CREATE INDEX IF NOT EXISTS locations_centroid_idx ON locations USING GIST (centroid);
+CREATE INDEX IF NOT EXISTS locations_label_idx ON locations (label);
+CREATE INDEX IF NOT EXISTS trips_bounds_idx ON trips USING GIST (bounds);
+CREATE INDEX IF NOT EXISTS trips_start_date_idx ON trips (start_date);
+CREATE INDEX IF NOT EXISTS trips_transportation_modes_trip_id_idx ON trips_transportation_modes (trip_id);
+CREATE INDEX IF NOT EXISTS stays_start_date_idx ON stays (start_date);
+CREATE INDEX IF NOT EXISTS canonical_trips_bounds_idx ON canonical_trips USING GIST (bounds);
+CREATE INDEX IF NOT EXISTS canonical_trips_relations_canonical_trip_idx ON canonical_trips_relations (canonical_trip);
+CREATE INDEX IF NOT EXISTS canonical_trips_relations_trip_idx ON canonical_trips_relations (trip);
+
+-- Versions of processmysteps/migrations.py already in this schema
+CREATE TABLE IF NOT EXISTS schema_migrations (
+  version INTEGER PRIMARY KEY,
+  description TEXT NOT NULL,
+  applied_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now()
+);
+INSERT INTO schema_migrations (version, description)
+  SELECT 1, 'Spatial and temporal indexes'
+  WHERE NOT EXISTS (SELECT 1 FROM schema_migrations WHERE version = 1);
+INSERT INTO schema_migrations (version, description)
+  SELECT 2, 'Simplified canonical trips per zoom level'
+  WHERE NOT EXISTS (SELECT 1 FROM schema_migrations WHERE version = 2);
@@ -3,10 +3,13 @@
 Entry point
 Spawns a server that coodinates the operations
 """
+import json
 import argparse
-from flask import Flask, request, jsonify
+import threading
+from flask import Flask, Response, request, jsonify, abort
 from tracktotrip import Point
 from processmysteps.process_manager import ProcessingManager
+from processmysteps.edits import EditError
 
 parser = argparse.ArgumentParser(description='Starts the server to process tracks')
 parser.add_argument('-p', '--port', dest='port', metavar='p', type=int,
@@ -30,6 +33,10 @@ app = Flask(__name__)
 
 manager = ProcessingManager(args.config)
 
+# Last serialized state, see send_state
+STATE_CACHE = {'etag': None, 'body': None}
+STATE_LOCK = threading.Lock()
+
 def set_headers(response):
     """ Sets appropriate headers
 
@@ -41,15 +48,56 @@ def set_headers(response):
     response.headers['Access-Control-Allow-Origin'] = '*'
     return response
 
+def parse_bbox():
+    """ Gets the bbox parameter of the request
+
+    It's given as min_lon,min_lat,max_lon,max_lat. The request is aborted
+    with a 400 if it's malformed
+
+    Returns:
+        (float, float, float, float): Min latitude, min longitude, max
+            latitude and max longitude. None if it isn't given
+    """
+    if not request.args.get('bbox'):
+        return None
+    try:
+        min_lon, min_lat, max_lon, max_lat = [float(v) for v in request.args.get('bbox').split(',')]
+    except ValueError:
+        response = jsonify({'error': 'bbox must be min_lon,min_lat,max_lon,max_lat'})
+        response.status_code = 400
+        abort(set_headers(response))
+    return (min_lat, min_lon, max_lat, max_lon)
+
 def send_state():
     """ Helper function to send state
 
-    Creates a response with the current state, converts it to JSON and sets its headers
+    Creates a response with the current state, converts it to JSON and sets its headers.
+    The serialized state is reused while the state's ETag is the same, and clients
+    that send it in the If-None-Match header of a GET or HEAD request get an empty
+    304 response. Other methods always get the state, since they change it.
+    See `ProcessingManager.state_etag`
 
     Returns:
         :obj:`flask.response`
     """
-    response = jsonify(manager.current_state())
+    etag = manager.state_etag()
+    if request.method in ('GET', 'HEAD') and etag in request.if_none_match:
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        return set_headers(response)
+
+    with STATE_LOCK:
+        if STATE_CACHE['etag'] == etag:
+            body = STATE_CACHE['body']
+        else:
+            body = jsonify(manager.current_state()).get_data()
+            # the state may have changed while serializing it
+            if manager.state_etag() == etag:
+                STATE_CACHE['etag'] = etag
+                STATE_CACHE['body'] = body
+
+    response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
     return set_headers(response)
 
 def undo_step():
@@ -71,11 +119,20 @@ def previous():
 def next():
     """Advances the progress
 
+    The payload can have a list of edits to apply to the current track,
+    see `processmysteps.edits`, instead of the whole track. Invalid edits
+    are rejected with a 400, before the state is changed
+
     Returns:
         :obj:`flask.response`
     """
     payload = request.get_json(force=True)
-    manager.process(payload)
+    try:
+        manager.process(payload)
+    except EditError as error:
+        response = jsonify({'error': str(error)})
+        response.status_code = 400
+        return set_headers(response)
     return send_state()
 
 @app.route('/current', methods=['GET'])
@@ -175,14 +232,70 @@ def location_suggestion():
 
 @app.route('/canonicalTrips', methods=['GET'])
 def get_canonical_trips():
-    response = jsonify(manager.get_canonical_trips())
+    """ Gets canonical trips
+
+    Without parameters, all canonical trips are returned as a list. With any
+    of the following parameters, a page of canonical trips is returned as
+    `{'trips': [...], 'next': <cursor of the next page, or null>}`:
+
+        + bbox: viewport, as min_lon,min_lat,max_lon,max_lat
+        + zoom: map zoom level, the geometries are simplified for it
+        + cursor: next of the previous page
+        + limit: max number of canonical trips
+    """
+    if not any([key in request.args for key in ['bbox', 'zoom', 'cursor', 'limit']]):
+        return set_headers(jsonify(manager.get_canonical_trips()))
+
+    response = jsonify(manager.get_canonical_trips_page(
+        parse_bbox(),
+        request.args.get('zoom', None, type=int),
+        request.args.get('cursor', None, type=int),
+        request.args.get('limit', None, type=int)
+    ))
     return set_headers(response)
 
 @app.route('/canonicalLocations', methods=['GET'])
 def get_canonical_locations():
-    response = jsonify(manager.get_canonical_locations())
+    """ Gets canonical locations
+
+    Without parameters, all locations are returned with their point clusters.
+    With centroids, or bbox (as min_lon,min_lat,max_lon,max_lat), a list of
+    summaries, see `ProcessingManager.iter_location_summaries`, is streamed.
+    The point cluster of a location is at /canonicalLocations/<id>
+    """
+    if 'centroids' not in request.args and 'bbox' not in request.args:
+        return set_headers(jsonify(manager.get_canonical_locations()))
+
+    summaries = manager.iter_location_summaries(parse_bbox())
+    def generate():
+        # closed when the response is, even if the client disconnects
+        try:
+            yield '['
+            for i, summary in enumerate(summaries):
+                yield (',' if i > 0 else '') + json.dumps(summary)
+            yield ']'
+        finally:
+            summaries.close()
+    return set_headers(Response(generate(), mimetype='application/json'))
+
+@app.route('/canonicalLocations/<int:location_id>', methods=['GET'])
+def get_canonical_location(location_id):
+    location = manager.get_canonical_location(location_id)
+    response = jsonify(location)
+    if location is None:
+        response.status_code = 404
     return set_headers(response)
 
+@app.route('/tiles/<layer>/<int:z>/<int:x>/<int:y>', methods=['GET'])
+@app.route('/tiles/<layer>/<int:z>/<int:x>/<int:y>.mvt', methods=['GET'])
+def get_tile(layer, z, x, y):
+    """ Gets a Mapbox Vector Tile of trips, canonical_trips or locations
+    """
+    tile = manager.get_tile(layer, z, x, y)
+    if tile is None:
+        return set_headers(Response('', status=404))
+    return set_headers(Response(tile, mimetype='application/vnd.mapbox-vector-tile'))
+
 @app.route('/transportation', methods=['POST'])
 def get_transportation_suggestions():
     payload = request.get_json(force=True)
@@ -190,6 +303,21 @@ def get_transportation_suggestions():
     response = jsonify(manager.get_transportation_suggestions(points))
     return set_headers(response)
 
+@app.route('/transportationBatch', methods=['POST'])
+def get_transportation_suggestions_batch():
+    """Classifies the transportation mode of many segments
+
+    The payload has a list of segments, each with its points, like in
+    /transportation
+
+    Returns:
+        :obj:`flask.response`: List with the classification of each segment
+    """
+    payload = request.get_json(force=True)
+    segments = [segment['points'] for segment in payload['segments']]
+    response = jsonify(manager.get_transportation_suggestions_batch(segments))
+    return set_headers(response)
+
 @app.route('/removeDay', methods=['POST'])
 def remove_day():
     payload = request.get_json(force=True)
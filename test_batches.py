@@ -0,0 +1,261 @@
+import re
+import unittest
+from tracktotrip import Segment, Point
+from processmysteps import db, ewkb
+
+class FakeCursor(object):
+    """ Records the statements, and returns the ids given to RETURNING
+    """
+    def __init__(self, returned=None):
+        self.connection = object()
+        self.statements = []
+        self.returned = list(returned or [])
+        self.last = None
+
+    def mogrify(self, template, row):
+        # only ids are kept, other values are replaced by their type
+        return template % tuple([
+            str(value) if isinstance(value, (int, long)) else type(value).__name__
+            for value in row
+        ])
+
+    def execute(self, query, params=None):
+        self.last = ' '.join(query.split())
+        self.statements.append(self.last)
+
+    def fetchall(self):
+        if 'RETURNING' in self.last:
+            count = self.last.count('(str, Segment)')
+            ids, self.returned = self.returned[:count], self.returned[count:]
+            return [(canonical_id, ) for canonical_id in ids]
+        return []
+
+    def find(self, prefix):
+        return [statement for statement in self.statements if statement.startswith(prefix)]
+
+def build_trip(lat, lon):
+    return Segment([Point(lat + i * 0.01, lon + i * 0.01, None) for i in range(3)])
+
+class TestInsertRows(unittest.TestCase):
+    def test_single_statement(self):
+        cur = FakeCursor()
+        rows = db.insert_rows(cur, 'INSERT INTO t (a, b)', '(%s, %s)', [(1, 2), (3, 4)])
+        self.assertEqual(cur.statements, ['INSERT INTO t (a, b) VALUES (1, 2),(3, 4)'])
+        # without RETURNING, nothing is fetched
+        self.assertEqual(rows, [])
+
+    def test_returning_order(self):
+        cur = FakeCursor([7, 8, 9])
+        rows = db.insert_rows(
+            cur, 'INSERT INTO t (a, b)', '(%s, %s)',
+            [('x', build_trip(0, 0))] * 3, 'RETURNING id'
+        )
+        self.assertEqual(rows, [(7, ), (8, ), (9, )])
+
+    def test_empty(self):
+        cur = FakeCursor()
+        self.assertEqual(db.insert_rows(cur, 'INSERT INTO t (a)', '(%s)', [], 'RETURNING a'), [])
+        self.assertEqual(cur.statements, [])
+
+class TestCanonicalTripsBatch(unittest.TestCase):
+    def setUp(self):
+        self.listeners = dict(db.LISTENERS)
+        db.LISTENERS.clear()
+
+    def tearDown(self):
+        db.LISTENERS.clear()
+        db.LISTENERS.update(self.listeners)
+
+    def batch(self, cur, trips=None):
+        batch = db.CanonicalTripsBatch(cur, [], 0.001)
+        for canonical_id, trip in (trips or {}).items():
+            batch.trips[canonical_id] = trip
+            batch.previous_bounds[canonical_id] = db.points_bounds(trip.points)
+        return batch
+
+    def test_empty_batch(self):
+        cur = FakeCursor()
+        batch = self.batch(cur)
+        self.assertEqual(cur.statements, [])
+        batch.flush()
+        self.assertEqual(cur.statements, [])
+        self.assertEqual(batch.trips, {})
+
+    def test_inserted_ids_are_remapped(self):
+        cur = FakeCursor([101, 102])
+        batch = self.batch(cur)
+        batch.insert(build_trip(38.7, -9.2), 1)
+        batch.insert(build_trip(40.0, -8.0), 2)
+        self.assertEqual(sorted(batch.trips.keys()), [-2, -1])
+        first = batch.trips[-1]
+        batch.flush()
+
+        # returned ids follow the order of the inserted rows
+        self.assertEqual(sorted(batch.trips.keys()), [101, 102])
+        self.assertIs(batch.trips[101], first)
+        self.assertEqual(
+            cur.find('INSERT INTO canonical_trips_relations'),
+            ['INSERT INTO canonical_trips_relations (canonical_trip, trip) VALUES (101, 1),(102, 2)']
+        )
+        self.assertEqual(cur.find('UPDATE'), [])
+        self.assertEqual(batch.inserted, [])
+        self.assertEqual(batch.relations, [])
+
+    def test_inserted_then_updated(self):
+        cur = FakeCursor([101])
+        batch = self.batch(cur)
+        batch.insert(build_trip(38.7, -9.2), 1)
+        updated = build_trip(38.8, -9.1)
+        batch.update(-1, updated, 2)
+        batch.flush()
+
+        # it's only inserted, with the updated points
+        self.assertEqual(len(cur.find('INSERT INTO canonical_trips (')), 1)
+        self.assertEqual(cur.find('UPDATE'), [])
+        self.assertIs(batch.trips[101], updated)
+        self.assertEqual(
+            cur.find('INSERT INTO canonical_trips_relations'),
+            ['INSERT INTO canonical_trips_relations (canonical_trip, trip) VALUES (101, 1),(101, 2)']
+        )
+
+    def test_updated_and_inserted(self):
+        existing = build_trip(38.7, -9.2)
+        cur = FakeCursor([101])
+        batch = self.batch(cur, {5: existing})
+        notified = []
+        db.on_change('canonical_trips', notified.append)
+        batch.update(5, build_trip(38.75, -9.15), 1)
+        batch.insert(build_trip(40.0, -8.0), 1)
+        batch.flush()
+
+        self.assertEqual(len(cur.find('UPDATE canonical_trips SET')), 1)
+        self.assertIn('(5, str, Segment)', cur.find('UPDATE canonical_trips SET')[0])
+        self.assertEqual(
+            cur.find('INSERT INTO canonical_trips_relations'),
+            ['INSERT INTO canonical_trips_relations (canonical_trip, trip) VALUES (5, 1),(101, 1)']
+        )
+        self.assertEqual(sorted(batch.trips.keys()), [5, 101])
+        # notified on commit, with the previous and new bounds of 5
+        db.notify_changes(db.take_changes(cur.connection))
+        self.assertEqual(len(notified), 3)
+        self.assertIn(db.points_bounds(existing.points), notified)
+
+    def test_new_ids_after_flush(self):
+        cur = FakeCursor([101, 102])
+        batch = self.batch(cur)
+        batch.insert(build_trip(38.7, -9.2), 1)
+        batch.flush()
+        batch.insert(build_trip(40.0, -8.0), 2)
+        batch.flush()
+        self.assertEqual(sorted(batch.trips.keys()), [101, 102])
+class LocationsCursor(object):
+    """ Keeps a locations table in memory, for the statements of
+    `db.insert_location` and `db.LocationBatch`
+    """
+    def __init__(self, locations):
+        self.connection = object()
+        # location id: (label, centroid, cluster)
+        self.table = dict(enumerate(locations, 1))
+        self.mogrified = []
+        self.result = []
+        self.rowcount = 0
+
+    def row(self, location_id):
+        label, centroid, cluster = self.table[location_id]
+        return (
+            location_id,
+            label,
+            ewkb.write_point(centroid.lat, centroid.lon),
+            ewkb.write_linestring(cluster)
+        )
+
+    def mogrify(self, template, row):
+        self.mogrified.append(row)
+        return '<%d>' % (len(self.mogrified) - 1)
+
+    def execute(self, query, params=None):
+        query = ' '.join(query.split())
+        rows = [self.mogrified[int(i)] for i in re.findall(r'<(\d+)>', query)]
+        if query.startswith('SELECT') and 'ANY' in query:
+            self.result = [
+                self.row(location_id) for location_id, (label, _, _) in sorted(self.table.items())
+                if label in params[0]
+            ]
+        elif query.startswith('SELECT'):
+            label, point = params
+            ids = [location_id for location_id, row in self.table.items() if row[0] == label]
+            ids.sort(key=lambda location_id: self.table[location_id][1].distance(point))
+            self.result = [self.row(location_id) for location_id in ids]
+        elif query.startswith('UPDATE') and len(rows) > 0:
+            for location_id, centroid, cluster in rows:
+                self.table[location_id] = (self.table[location_id][0], centroid, cluster.points)
+        elif query.startswith('UPDATE'):
+            centroid, cluster, location_id = params
+            self.table[location_id] = (self.table[location_id][0], centroid, cluster.points)
+        elif query.startswith('INSERT'):
+            for label, centroid, cluster in rows or [params]:
+                self.table[len(self.table) + 1] = (label, centroid, cluster.points)
+        self.rowcount = len(self.result)
+
+    def fetchone(self):
+        return self.result[0]
+
+    def fetchall(self):
+        return self.result
+
+    def locations(self):
+        return sorted([
+            (label, round(centroid.lat, 9), round(centroid.lon, 9), len(cluster))
+            for label, centroid, cluster in self.table.values()
+        ])
+
+class TestLocationBatch(unittest.TestCase):
+    def setUp(self):
+        self.listeners = dict(db.LISTENERS)
+        db.LISTENERS.clear()
+        home = [Point(38.7 + i * 1e-5, -9.1, None) for i in range(3)]
+        self.existing = [(u'Home', home[1], home), (u'Home', Point(40.0, -8.0, None), [Point(40.0, -8.0, None)])]
+        # labels are utf-8, like the ones read from LIFE files
+        self.observations = [
+            ('Home', Point(38.70002, -9.10001, None)),
+            ('Work', Point(38.75, -9.15, None)),
+            ('Home', Point(40.00001, -8.00001, None)),
+            # merged into Work, inserted by this batch
+            ('Work', Point(38.75001, -9.15001, None)),
+            ('Caf\xc3\xa9', Point(38.76, -9.16, None)),
+            ('Work', Point(38.75002, -9.15, None))
+        ]
+
+    def tearDown(self):
+        db.LISTENERS.clear()
+        db.LISTENERS.update(self.listeners)
+
+    def copy_existing(self):
+        return [(label, centroid, list(cluster)) for label, centroid, cluster in self.existing]
+
+    def test_same_as_insert_location(self):
+        single = LocationsCursor(self.copy_existing())
+        for label, point in self.observations:
+            db.insert_location(single, label, point, 20, 2)
+
+        batched = LocationsCursor(self.copy_existing())
+        batch = db.LocationBatch(batched, 20, 2)
+        for label, point in self.observations:
+            batch.add(label, point)
+        batch.flush()
+
+        self.assertEqual(batched.locations(), single.locations())
+        labels = [location[0] for location in batched.locations()]
+        self.assertEqual(labels, [u'Caf\xe9', u'Home', u'Home', u'Work'])
+        work = [location for location in batched.locations() if location[0] == u'Work'][0]
+        self.assertEqual(work[3], 3)
+        self.assertEqual(batch.observations, [])
+
+    def test_empty(self):
+        cur = LocationsCursor(self.copy_existing())
+        db.LocationBatch(cur, 20, 2).flush()
+        self.assertEqual(cur.rowcount, 0)
+        self.assertEqual(cur.mogrified, [])
+
+if __name__ == '__main__':
+    unittest.main()
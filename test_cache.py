@@ -0,0 +1,58 @@
+import unittest
+from processmysteps.cache import LRUCache
+
+class TestLRUCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = LRUCache(10, len)
+
+    def test_evicts_least_recently_used(self):
+        self.cache.put('a', 'aaaa')
+        self.cache.put('b', 'bbbb')
+        self.cache.get('a')
+        self.cache.put('c', 'cccc')
+        self.assertEqual(self.cache.keys(), ['a', 'c'])
+        self.assertEqual(self.cache.size, 8)
+
+    def test_evicts_by_size(self):
+        self.cache.put('a', 'aa')
+        self.cache.put('b', 'bb')
+        self.cache.put('c', 'cccccccc')
+        self.assertEqual(self.cache.keys(), ['b', 'c'])
+        self.assertEqual(self.cache.size, 10)
+
+    def test_replace_updates_size(self):
+        self.cache.put('a', 'aaaa')
+        self.cache.put('a', 'aa')
+        self.assertEqual(self.cache.size, 2)
+        self.assertEqual(self.cache.get('a'), 'aa')
+
+    def test_too_big_is_not_cached(self):
+        self.cache.put('a', 'aa')
+        self.cache.put('b', 'b' * 11)
+        self.assertNotIn('b', self.cache)
+        self.assertEqual(self.cache.keys(), ['a'])
+
+    def test_shrink_max_size(self):
+        for key in 'abcde':
+            self.cache.put(key, key * 2)
+        self.cache.get('a')
+        self.cache.max_size = 5
+        self.assertEqual(self.cache.keys(), ['e', 'a'])
+        self.assertEqual(self.cache.size, 4)
+
+        self.cache.max_size = 0
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(self.cache.size, 0)
+
+    def test_remove_and_clear(self):
+        self.cache.put('a', 'aa')
+        self.cache.put('b', 'bbb')
+        self.cache.remove('a')
+        self.cache.remove('missing')
+        self.assertEqual(self.cache.size, 3)
+        self.cache.clear()
+        self.assertEqual(self.cache.size, 0)
+        self.assertIsNone(self.cache.get('b'))
+
+if __name__ == '__main__':
+    unittest.main()
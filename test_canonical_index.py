@@ -0,0 +1,81 @@
+import unittest
+from tracktotrip import Segment, Point
+from processmysteps.canonical_index import CanonicalTripsIndex
+
+class FakeCursor(object):
+    """ Returns the bounds of canonical trips, and fails other queries
+    """
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = 0
+
+    def execute(self, query, params=None):
+        self.queries += 1
+        if 'ST_XMin' not in query:
+            raise AssertionError('Unexpected query: %s' % query)
+
+    def fetchall(self):
+        return self.rows
+
+def build_trip(lat, lon):
+    # tracktotrip.Segment.bounds leaves the last point out
+    return Segment([Point(lat + i * 0.01, lon + i * 0.01, None) for i in range(3)])
+
+class TestCanonicalTripsIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = CanonicalTripsIndex(100)
+        self.cur = FakeCursor([(1, 38.7, -9.2, 38.71, -9.19)])
+        self.index.load(self.cur)
+
+    def test_load_once(self):
+        self.assertTrue(self.index.loaded)
+        self.index.load(self.cur)
+        self.assertEqual(self.cur.queries, 1)
+        self.assertEqual(len(self.index), 1)
+        self.assertEqual(self.index.candidates(self.cur, (38.705, -9.195, 38.8, -9.1)), [1])
+
+    def test_put_replaces_bounds(self):
+        self.index.put(1, build_trip(40.0, -8.0))
+        self.assertEqual(len(self.index), 1)
+        self.assertEqual(self.index.candidates(self.cur, (38.705, -9.195, 38.8, -9.1)), [])
+        self.assertEqual(self.index.candidates(self.cur, (40.005, -7.995, 40.1, -7.9)), [1])
+
+    def test_put_adds(self):
+        self.index.put(2, build_trip(38.7, -9.2))
+        self.assertEqual(len(self.index), 2)
+        self.assertEqual(self.index.candidates(self.cur, (38.705, -9.195, 38.8, -9.1)), [1, 2])
+
+    def test_put_before_load(self):
+        index = CanonicalTripsIndex(100)
+        index.put(2, build_trip(38.7, -9.2))
+        self.assertFalse(index.loaded)
+        self.assertEqual(len(index), 0)
+        self.assertNotIn(2, index.geometries)
+
+    def test_clear(self):
+        self.index.put(2, build_trip(38.7, -9.2))
+        self.index.clear()
+        self.assertFalse(self.index.loaded)
+        self.assertEqual(len(self.index), 0)
+        self.assertEqual(len(self.index.geometries), 0)
+        # it's loaded again when needed
+        self.assertEqual(self.index.candidates(self.cur, (38.705, -9.195, 38.8, -9.1)), [1])
+        self.assertEqual(self.cur.queries, 2)
+
+    def test_get_returns_copies(self):
+        trip = build_trip(38.7, -9.2)
+        self.index.put(2, trip)
+        trip.points.append(Point(38.73, -9.17, None))
+
+        result = self.index.get(self.cur, [2])
+        self.assertEqual(len(result[2].points), 3)
+        result[2].points.pop()
+        result[2].points[0] = Point(0, 0, None)
+        again = self.index.get(self.cur, [2])
+        self.assertEqual(len(again[2].points), 3)
+        self.assertEqual(again[2].points[0].lat, 38.7)
+        # cached trips are used, without querying
+        self.assertEqual(self.cur.queries, 1)
+
+if __name__ == '__main__':
+    unittest.main()
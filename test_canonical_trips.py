@@ -0,0 +1,122 @@
+import unittest
+from processmysteps import db
+from processmysteps.process_manager import ProcessingManager
+from test_ewkb import line_ewkb
+
+class PageCursor(object):
+    """ Returns canonical trips ordered by id, after the cursor and up to the limit
+    """
+    def __init__(self, ids):
+        self.rows = [(i, line_ewkb([(38.7, -9.1 - i * 0.01), (38.71, -9.1)])) for i in ids]
+        self.queries = []
+        self.result = []
+
+    def execute(self, query, params=None):
+        self.queries.append((query, params))
+        rows = self.rows
+        if 'canonical_id >' in query:
+            rows = [row for row in rows if row[0] > params[-2]]
+        self.result = rows[:params[-1]]
+
+    def fetchall(self):
+        return self.result
+
+    def close(self):
+        pass
+
+class TestLodZoom(unittest.TestCase):
+    def test_levels(self):
+        self.assertEqual(db.lod_zoom(0), 4)
+        self.assertEqual(db.lod_zoom(4), 4)
+        self.assertEqual(db.lod_zoom(5), 4)
+        self.assertEqual(db.lod_zoom(9), 8)
+        self.assertEqual(db.lod_zoom(16), 16)
+
+    def test_full_geometries(self):
+        self.assertIsNone(db.lod_zoom(None))
+        self.assertIsNone(db.lod_zoom(17))
+        self.assertIsNone(db.lod_zoom(22))
+
+class TestCanonicalTripsPage(unittest.TestCase):
+    def setUp(self):
+        self.cur = PageCursor([3, 5, 8, 13, 21])
+
+    def ids(self, trips):
+        return [trip['id'] for trip in trips]
+
+    def test_pages(self):
+        trips, cursor = db.get_canonical_trips_page(self.cur, limit=2)
+        self.assertEqual(self.ids(trips), [3, 5])
+        self.assertEqual(cursor, 5)
+        self.assertEqual(self.cur.queries[-1][1], [3])
+
+        trips, cursor = db.get_canonical_trips_page(self.cur, cursor=cursor, limit=2)
+        self.assertEqual(self.ids(trips), [8, 13])
+        self.assertEqual(cursor, 13)
+        self.assertEqual(self.cur.queries[-1][1], [5, 3])
+
+        trips, cursor = db.get_canonical_trips_page(self.cur, cursor=cursor, limit=2)
+        self.assertEqual(self.ids(trips), [21])
+        self.assertIsNone(cursor)
+
+    def test_last_page_is_full(self):
+        trips, cursor = db.get_canonical_trips_page(self.cur, cursor=5, limit=3)
+        self.assertEqual(self.ids(trips), [8, 13, 21])
+        self.assertIsNone(cursor)
+
+    def test_points(self):
+        trips, _ = db.get_canonical_trips_page(self.cur, limit=1)
+        points = trips[0]['points']['points']
+        self.assertEqual(
+            [(p['lat'], p['lon']) for p in points],
+            [(38.7, -9.1 - 3 * 0.01), (38.71, -9.1)]
+        )
+
+    def test_zoom(self):
+        db.get_canonical_trips_page(self.cur, zoom=9, limit=2)
+        query, params = self.cur.queries[-1]
+        self.assertIn('canonical_trips_lod', query)
+        self.assertEqual(params, [8, 3])
+
+        db.get_canonical_trips_page(self.cur, zoom=17, limit=2)
+        query, params = self.cur.queries[-1]
+        self.assertNotIn('canonical_trips_lod', query)
+        self.assertEqual(params, [3])
+
+    def test_bbox(self):
+        db.get_canonical_trips_page(self.cur, (38.6, -9.2, 38.8, -9.0), 5, 8, 2)
+        query, params = self.cur.queries[-1]
+        self.assertIn('ST_MakeEnvelope', query)
+        # canonical trips bounds have the latitude as x, see db.gis_bounds
+        self.assertEqual(params, [4, 38.6, -9.2, 38.8, -9.0, 8, 3])
+
+class TestLimit(unittest.TestCase):
+    def setUp(self):
+        self.manager = ProcessingManager(None, load=False)
+        self.cur = PageCursor(range(1, 30))
+        self.manager.db_connect = lambda: (object(), self.cur)
+        self.manager.config['canonical_trips']['page_size'] = 5
+        self.manager.config['canonical_trips']['max_page_size'] = 10
+
+    def tearDown(self):
+        self.manager.close()
+
+    def limit(self, limit):
+        page = self.manager.get_canonical_trips_page(limit=limit)
+        self.assertEqual(self.cur.queries[-1][1][-1], len(page['trips']) + 1)
+        self.assertEqual(page['next'], page['trips'][-1]['id'])
+        return len(page['trips'])
+
+    def test_clamping(self):
+        self.assertEqual(self.limit(None), 5)
+        self.assertEqual(self.limit(7), 7)
+        self.assertEqual(self.limit(100), 10)
+        self.assertEqual(self.limit(-3), 1)
+
+    def test_ids(self):
+        page = self.manager.get_canonical_trips_page(cursor=26)
+        self.assertEqual([trip['id'] for trip in page['trips']], [27, 28, 29])
+        self.assertIsNone(page['next'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import shutil
+import unittest
+from os.path import join
+from tempfile import mkdtemp
+import numpy as np
+from tracktotrip.classifier import Classifier
+from processmysteps.classifier_store import LazyClassifier, save_classifier, \
+        load_classifier, is_array_format
+
+def train_classifier():
+    rand = np.random.RandomState(0)
+    walk = rand.uniform(0, 0.05, (40, 9))
+    car = rand.uniform(0.1, 0.5, (40, 9))
+    train = rand.uniform(0.4, 1, (40, 9))
+    clf = Classifier()
+    clf.clf.set_params(n_iter=20, random_state=0)
+    clf.learn(
+        np.vstack([walk, car, train]).tolist(),
+        ['walk'] * 40 + ['car'] * 40 + ['train'] * 40
+    )
+    return clf
+
+class TestClassifierStore(unittest.TestCase):
+    def setUp(self):
+        self.folder = mkdtemp()
+        self.clf = train_classifier()
+        self.features = np.random.RandomState(1).uniform(0, 1, (25, 9)).tolist()
+        self.pickle_path = join(self.folder, 'classifier.data')
+        with open(self.pickle_path, 'wb') as clf_file:
+            self.clf.save_to_file(clf_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def assert_same_predictions(self, clf):
+        expected = self.clf.predict(self.features, verbose=True)
+        result = clf.predict(self.features, verbose=True)
+        self.assertEqual(len(result), len(expected))
+        for before, after in zip(expected, result):
+            self.assertEqual(sorted(after.keys()), ['car', 'train', 'walk'])
+            for label in before.keys():
+                self.assertAlmostEqual(after[label], before[label], places=12)
+
+    def test_lazy_pickle(self):
+        lazy = LazyClassifier(self.pickle_path)
+        self.assert_same_predictions(lazy.get())
+
+    def test_lazy_arrays(self):
+        path = join(self.folder, 'arrays')
+        save_classifier(LazyClassifier(self.pickle_path).get(), path)
+        self.assertTrue(is_array_format(path))
+
+        clf = LazyClassifier(path).get()
+        self.assertIsInstance(clf.clf.coef_, np.memmap)
+        self.assertEqual(clf.feature_length, 9)
+        self.assert_same_predictions(clf)
+        self.assert_same_predictions(load_classifier(path, mmap=False))
+
+    def test_load_error(self):
+        lazy = LazyClassifier(join(self.folder, 'missing.data'))
+        self.assertRaises(IOError, lazy.get)
+
+    def test_empty(self):
+        clf = LazyClassifier(None).get()
+        self.assertEqual(clf.feature_length, -1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+from datetime import datetime, timedelta, tzinfo
+import tracktotrip as tt
+from processmysteps.compact import CompactTrack
+
+class UTC(tzinfo):
+    def utcoffset(self, _):
+        return timedelta(0)
+
+    def dst(self, _):
+        return timedelta(0)
+
+UTC = UTC()
+
+def build_track(n_points, timezone=None):
+    start = datetime(2016, 7, 25, 8, 0, 0, tzinfo=timezone)
+    points = [
+        tt.Point(38.7 + i * 1e-4, -9.1 - i * 1e-4, start + timedelta(seconds=i * 10))
+        for i in range(n_points)
+    ]
+    segment = tt.Segment(points)
+    segment.compute_metrics()
+    segment.transportation_modes = [{'label': 'walk', 'from': 0, 'to': n_points - 1}]
+    track = tt.Track('test', [segment])
+    track.meta = [{'source': 'test'}]
+    return track
+
+class TestCompactTrack(unittest.TestCase):
+    def assert_round_trip(self, track):
+        compact = CompactTrack.from_track(track)
+        restored = compact.to_track()
+
+        self.assertEqual(len(compact), 20)
+        self.assertEqual(restored.name, track.name)
+        self.assertEqual(restored.meta, track.meta)
+        self.assertEqual(len(restored.segments), 1)
+        original = track.segments[0]
+        segment = restored.segments[0]
+        self.assertEqual(segment.transportation_modes, original.transportation_modes)
+        self.assertIsNot(segment.transportation_modes, original.transportation_modes)
+        for before, after in zip(original.points, segment.points):
+            self.assertEqual(after.lat, before.lat)
+            self.assertEqual(after.lon, before.lon)
+            self.assertEqual(after.time, before.time)
+            self.assertEqual(after.dt, before.dt)
+            self.assertEqual(after.dx, before.dx)
+            self.assertEqual(after.vel, before.vel)
+            self.assertEqual(after.acc, before.acc)
+        return segment
+
+    def test_round_trip(self):
+        segment = self.assert_round_trip(build_track(20))
+        self.assertIsNone(segment.points[0].time.tzinfo)
+
+    def test_round_trip_keeps_timezone(self):
+        segment = self.assert_round_trip(build_track(20, UTC))
+        self.assertEqual(segment.points[5].time.tzinfo, UTC)
+
+    def test_metrics_are_exact(self):
+        track = build_track(20)
+        points = track.segments[0].points
+        points[3].vel = 15.9076941
+        points[4].acc = 1e-300
+        points[5].dx = 123456789.123456789
+        restored = CompactTrack.from_track(track).to_track().segments[0].points
+        self.assertEqual(restored[3].vel, 15.9076941)
+        self.assertEqual(restored[4].acc, 1e-300)
+        self.assertEqual(restored[5].dx, 123456789.123456789)
+
+    def test_nbytes(self):
+        compact = CompactTrack.from_track(build_track(20))
+        # lat, lon, time and the 4 metrics as 8 bytes
+        self.assertEqual(compact.nbytes, 20 * (8 + 8 + 8 + 4 * 8))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,217 @@
+import time
+import unittest
+import threading
+import psycopg2
+from processmysteps import db
+
+class FakeConnection(object):
+    def __init__(self):
+        self.closed = 0
+        self.commits = 0
+        self.rollbacks = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = 1
+
+class FakeCursor(object):
+    def __init__(self, connection):
+        self.connection = connection
+
+    def execute(self, query, params=None):
+        pass
+
+    def close(self):
+        pass
+
+class FakePool(object):
+    """ Stands for `psycopg2.pool.ThreadedConnectionPool`
+    """
+    def __init__(self, min_size, max_size, **params):
+        self.idle = []
+        self.opened = 0
+        self.closed = False
+
+    def getconn(self):
+        if len(self.idle) > 0:
+            return self.idle.pop()
+        self.opened += 1
+        return FakeConnection()
+
+    def putconn(self, conn, close=False):
+        if close:
+            conn.close()
+        else:
+            self.idle.append(conn)
+
+    def closeall(self):
+        for conn in self.idle:
+            conn.close()
+        self.idle = []
+        self.closed = True
+
+class PoolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.threaded_pool = db.ThreadedConnectionPool
+        db.ThreadedConnectionPool = FakePool
+        self.pool = db.ConnectionPool(1, 2)
+
+    def tearDown(self):
+        db.ThreadedConnectionPool = self.threaded_pool
+        self.pool.close()
+
+def in_thread(target):
+    thread = threading.Thread(target=target)
+    thread.start()
+    thread.join()
+
+class TestConnectionPool(PoolTestCase):
+    def test_same_connection_per_thread(self):
+        conn = self.pool.connect()
+        self.assertIs(self.pool.connect(), conn)
+        others = []
+        in_thread(lambda: others.append(self.pool.connect()))
+        self.assertIsNot(others[0], conn)
+
+    def test_commit_on_last_release(self):
+        conn = self.pool.connect()
+        self.pool.connect()
+        self.assertFalse(self.pool.release(conn))
+        self.assertEqual(conn.commits, 0)
+        self.assertTrue(self.pool.release(conn))
+        self.assertEqual(conn.commits, 1)
+        # released connections are reused
+        self.assertIs(self.pool.connect(), conn)
+
+    def test_release_of_other_connection(self):
+        conn = self.pool.connect()
+        self.assertFalse(self.pool.release(FakeConnection()))
+        self.assertEqual(conn.commits, 0)
+        self.assertTrue(self.pool.release(conn))
+
+    def test_reclaims_connections_of_ended_threads(self):
+        held = []
+        in_thread(lambda: held.append(self.pool.connect()))
+        conn = self.pool.connect()
+        other = self.pool.connect()
+        self.assertIs(other, conn)
+        # the connection left by the thread that ended is rolled back and reused
+        self.assertIs(conn, held[0])
+        self.assertEqual(conn.rollbacks, 1)
+        self.assertEqual(conn.commits, 0)
+        self.assertEqual(self.pool.pool.opened, 1)
+
+    def test_waits_for_a_connection(self):
+        conn = self.pool.connect()
+        connected = threading.Event()
+        done = threading.Event()
+        def holding():
+            held = self.pool.connect()
+            connected.set()
+            done.wait()
+            self.pool.release(held)
+        holder = threading.Thread(target=holding)
+        holder.start()
+        connected.wait()
+
+        got = []
+        waiter = threading.Thread(target=lambda: got.append(self.pool.connect()))
+        waiter.start()
+        waiter.join(0.2)
+        # max_size connections are in use
+        self.assertTrue(waiter.is_alive())
+
+        self.pool.release(conn)
+        waiter.join(1.0)
+        self.assertFalse(waiter.is_alive())
+        self.assertEqual(got, [conn])
+        self.assertEqual(self.pool.pool.opened, 2)
+        done.set()
+        holder.join()
+
+    def test_close_while_in_use(self):
+        conn = self.pool.connect()
+        pool = self.pool.pool
+        self.pool.close()
+        self.assertFalse(conn.closed)
+        self.assertRaises(psycopg2.InterfaceError, self.pool.connect)
+
+        # the transaction can still be committed
+        self.assertTrue(self.pool.release(conn))
+        self.assertEqual(conn.commits, 1)
+        self.assertTrue(conn.closed)
+        self.assertTrue(pool.closed)
+
+class TestChanges(PoolTestCase):
+    def setUp(self):
+        super(TestChanges, self).setUp()
+        self.notified = []
+        self.listeners = dict(db.LISTENERS)
+        db.LISTENERS.clear()
+        db.on_change('trips', self.notified.append)
+
+    def tearDown(self):
+        db.LISTENERS.clear()
+        db.LISTENERS.update(self.listeners)
+        super(TestChanges, self).tearDown()
+
+    def test_notified_after_commit(self):
+        conn = self.pool.connect()
+        db.changed(conn.cursor(), 'trips', (1, 2, 3, 4))
+        db.changed(conn.cursor(), 'locations', (1, 2, 3, 4))
+        self.assertEqual(self.notified, [])
+
+        self.pool.release(conn)
+        self.assertEqual(conn.commits, 1)
+        self.assertEqual(self.notified, [(1, 2, 3, 4)])
+        self.assertEqual(db.take_changes(conn), [])
+
+    def test_notified_on_last_release(self):
+        conn = self.pool.connect()
+        self.pool.connect()
+        db.changed(conn.cursor(), 'trips', (1, 2, 3, 4))
+        self.pool.release(conn)
+        self.assertEqual(self.notified, [])
+        self.pool.release(conn)
+        self.assertEqual(self.notified, [(1, 2, 3, 4)])
+
+    def test_discarded_on_rollback(self):
+        conn = self.pool.connect()
+        db.changed(conn.cursor(), 'trips', (1, 2, 3, 4))
+        self.pool.release(conn, rollback=True)
+        self.assertEqual(conn.rollbacks, 1)
+        self.assertEqual(self.notified, [])
+
+        # the next transaction of the connection starts without changes
+        conn = self.pool.connect()
+        self.pool.release(conn)
+        self.assertEqual(self.notified, [])
+
+    def test_remove_listener(self):
+        removed = []
+        remove = db.on_change('trips', removed.append)
+        remove()
+        remove()
+        conn = self.pool.connect()
+        db.changed(conn.cursor(), 'trips', (1, 2, 3, 4))
+        self.pool.release(conn)
+        self.assertEqual(removed, [])
+        self.assertEqual(self.notified, [(1, 2, 3, 4)])
+
+    def test_dispose(self):
+        conn = FakeConnection()
+        db.changed(conn.cursor(), 'trips', (1, 2, 3, 4))
+        db.dispose(conn, None)
+        self.assertEqual(self.notified, [(1, 2, 3, 4)])
+        self.assertTrue(conn.closed)
+
+if __name__ == '__main__':
+    unittest.main()
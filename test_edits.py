@@ -0,0 +1,109 @@
+import unittest
+from datetime import datetime, timedelta
+import tracktotrip as tt
+from processmysteps.edits import apply_edits, EditError
+
+def build_track(n_points):
+    start = datetime(2016, 7, 25, 8, 0, 0)
+    points = [
+        tt.Point(38.7 + i * 1e-4, -9.1, start + timedelta(seconds=i * 10))
+        for i in range(n_points)
+    ]
+    segment = tt.Segment(points)
+    segment.compute_metrics()
+    segment.transportation_modes = [
+        {'label': 'walk', 'from': 0, 'to': 4},
+        {'label': 'car', 'from': 5, 'to': n_points - 1}
+    ]
+    return tt.Track('test', [segment])
+
+class TestEdits(unittest.TestCase):
+    def setUp(self):
+        self.track = build_track(10)
+
+    def test_original_is_unchanged(self):
+        points = self.track.segments[0].points
+        apply_edits(self.track, [
+            {'type': 'move', 'segment': 0, 'point': 3, 'lat': 38.8, 'lon': -9.1},
+            {'type': 'split', 'segment': 0, 'point': 3}
+        ])
+        self.assertIs(self.track.segments[0].points, points)
+        self.assertEqual(len(self.track.segments), 1)
+        self.assertAlmostEqual(points[3].lat, 38.7003)
+
+    def test_delete_shifts_modes(self):
+        result = apply_edits(self.track, [{'type': 'delete', 'segment': 0, 'from': 1, 'to': 2}])
+        segment = result.segments[0]
+        self.assertEqual(len(segment.points), 8)
+        self.assertEqual(
+            [(mode['label'], mode['from'], mode['to']) for mode in segment.transportation_modes],
+            [('walk', 0, 2), ('car', 3, 7)]
+        )
+        self.assertEqual(segment.points[1].dt, 30)
+
+    def test_split_and_merge(self):
+        result = apply_edits(self.track, [{'type': 'split', 'segment': 0, 'point': 6}])
+        self.assertEqual([len(s.points) for s in result.segments], [7, 3])
+        self.assertEqual(result.segments[1].points[0].dt, 0)
+        self.assertEqual(result.segments[1].transportation_modes[0]['from'], 0)
+
+        result = apply_edits(result, [{'type': 'merge', 'segment': 0}])
+        self.assertEqual(len(result.segments), 1)
+        self.assertEqual(
+            [(mode['label'], mode['from'], mode['to']) for mode in result.segments[0].transportation_modes],
+            [('walk', 0, 4), ('car', 5, 9)]
+        )
+
+    def test_unknown_edit(self):
+        self.assertRaises(EditError, apply_edits, self.track, [{'type': 'rotate'}])
+
+    def assert_invalid(self, *edits):
+        points = self.track.segments[0].points
+        self.assertRaises(EditError, apply_edits, self.track, list(edits))
+        self.assertIs(self.track.segments[0].points, points)
+        self.assertEqual(len(points), 10)
+
+    def test_invalid_indexes(self):
+        self.assert_invalid({'type': 'move', 'segment': 1, 'point': 0, 'lat': 38.7, 'lon': -9.1})
+        self.assert_invalid({'type': 'move', 'segment': -1, 'point': 0, 'lat': 38.7, 'lon': -9.1})
+        self.assert_invalid({'type': 'move', 'segment': 0, 'point': 10, 'lat': 38.7, 'lon': -9.1})
+        self.assert_invalid({'type': 'move', 'segment': 0, 'point': -1, 'lat': 38.7, 'lon': -9.1})
+        self.assert_invalid({'type': 'move', 'segment': 0, 'point': '1', 'lat': 38.7, 'lon': -9.1})
+        self.assert_invalid({'type': 'move', 'segment': 0, 'point': 1, 'lat': None, 'lon': -9.1})
+        self.assert_invalid({'type': 'split', 'segment': 0, 'point': 10})
+        self.assert_invalid({'type': 'split', 'segment': 0})
+        self.assert_invalid({'type': 'relabel', 'segment': 0, 'mode': 2, 'label': 'bus'})
+        self.assert_invalid({'type': 'relabel', 'segment': 0, 'mode': -1, 'label': 'bus'})
+        self.assert_invalid({'type': 'relabel', 'segment': 0, 'location': 'middle', 'label': 'Home'})
+
+    def test_edits_must_be_a_list(self):
+        self.assertRaises(EditError, apply_edits, self.track, {'type': 'merge', 'segment': 0})
+
+    def test_invalid_delete(self):
+        self.assert_invalid({'type': 'delete', 'segment': 0, 'from': -1, 'to': 2})
+        self.assert_invalid({'type': 'delete', 'segment': 0, 'from': 3, 'to': 10})
+        self.assert_invalid({'type': 'delete', 'segment': 0, 'from': 5, 'to': 4})
+        self.assert_invalid({'type': 'delete', 'segment': 0, 'from': 1.5, 'to': 4})
+
+    def test_merge_last_segment(self):
+        self.assert_invalid({'type': 'merge', 'segment': 0})
+        self.assert_invalid(
+            {'type': 'split', 'segment': 0, 'point': 4},
+            {'type': 'merge', 'segment': 1}
+        )
+
+    def test_validated_after_previous_edits(self):
+        # the second segment only exists after the split
+        result = apply_edits(self.track, [
+            {'type': 'split', 'segment': 0, 'point': 4},
+            {'type': 'delete', 'segment': 1, 'from': 0, 'to': 4}
+        ])
+        self.assertEqual([len(s.points) for s in result.segments], [5])
+        # and the point doesn't exist after the delete
+        self.assert_invalid(
+            {'type': 'delete', 'segment': 0, 'from': 0, 'to': 4},
+            {'type': 'move', 'segment': 0, 'point': 5, 'lat': 38.7, 'lon': -9.1}
+        )
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import datetime
+import unittest
+import binascii
+import ppygis
+from tracktotrip import Point, Segment
+from processmysteps import db
+from processmysteps.ewkb import read_coordinates, write_point, write_linestring
+
+def line_ewkb(coordinates):
+    return ppygis.LineString(
+        [ppygis.Point(lon, lat, 0, srid=4326) for lat, lon in coordinates], srid=4326
+    ).write_ewkb()
+
+class TestEWKB(unittest.TestCase):
+    def setUp(self):
+        self.coordinates = [(38.7, -9.1), (38.71, -9.12), (38.72, -9.15)]
+
+    def test_linestring(self):
+        lats, lons = read_coordinates(line_ewkb(self.coordinates))
+        self.assertEqual(zip(lats.tolist(), lons.tolist()), self.coordinates)
+
+        value = line_ewkb(self.coordinates)
+        self.assertEqual(
+            zip(*[array.tolist() for array in read_coordinates(binascii.a2b_hex(value))]),
+            self.coordinates
+        )
+
+    def test_point(self):
+        point = db.to_point(ppygis.Point(-9.1, 38.7, 0, srid=4326).write_ewkb())
+        self.assertEqual((point.lat, point.lon), (38.7, -9.1))
+
+    def test_big_endian(self):
+        value = '00' + '80000002' + '00000001' + binascii.b2a_hex('\x40\x43\x59\x99\x99\x99\x99\x9a' * 3)
+        lats, lons = read_coordinates(value)
+        self.assertEqual((lats.tolist(), lons.tolist()), ([38.7], [38.7]))
+
+    def test_segment_json(self):
+        start = datetime.datetime(2016, 7, 25, 8, 0, 0)
+        times = [start + datetime.timedelta(seconds=i) for i in range(len(self.coordinates))]
+        value = line_ewkb(self.coordinates)
+        self.assertEqual(db.to_segment_json(value, times), db.to_segment(value, times).to_json())
+        self.assertEqual(db.to_segment_json(value), db.to_segment(value).to_json())
+
+    def test_write(self):
+        points = [Point(lat, lon, None) for lat, lon in self.coordinates]
+        line = ppygis.Geometry.read_ewkb(binascii.b2a_hex(write_linestring(points)))
+        self.assertEqual([(p.y, p.x, p.z) for p in line.points], [c + (0, ) for c in self.coordinates])
+        self.assertEqual(line.srid, 4326)
+
+        point = ppygis.Geometry.read_ewkb(binascii.b2a_hex(write_point(38.7, -9.1)))
+        self.assertEqual((point.y, point.x, point.z, point.srid), (38.7, -9.1, 0, 4326))
+
+    def test_adapt(self):
+        quoted = db.adapt_segment(Segment([Point(38.7, -9.1, None)])).getquoted()
+        self.assertTrue(quoted.startswith('ST_GeogFromWKB('))
+        self.assertTrue(quoted.endswith('::bytea)'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import json
+import shutil
+import unittest
+from os import utime, remove, stat
+from os.path import join
+from datetime import datetime
+from tempfile import mkdtemp
+from processmysteps.gpx_index import GPXIndex
+from processmysteps.process_manager import file_details
+from test_process_manager import gpx_content
+
+TIMES = ['2016-07-25T07:40:52Z', '2016-07-25T07:43:52Z']
+
+class TestGPXIndex(unittest.TestCase):
+    def setUp(self):
+        self.folder = mkdtemp()
+        self.index_path = join(self.folder, '.gpxindex.json')
+        self.computed = []
+        self.write('a.gpx', TIMES)
+        self.write('b.gpx', TIMES)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def write(self, filename, times, mtime=None):
+        path = join(self.folder, filename)
+        with open(path, 'w') as gpx_file:
+            gpx_file.write(gpx_content(times))
+        if mtime is not None:
+            utime(path, (mtime, mtime))
+
+    def compute(self, base_path, filename):
+        self.computed.append(filename)
+        return file_details(base_path, filename)
+
+    def details(self, filenames=('a.gpx', 'b.gpx')):
+        self.computed = []
+        files = GPXIndex(self.index_path).details(self.folder, list(filenames), self.compute)
+        return dict([(details['name'], details) for details in files])
+
+    def test_reuses_entries(self):
+        first = self.details()
+        self.assertEqual(sorted(self.computed), ['a.gpx', 'b.gpx'])
+        self.assertEqual(first['a.gpx']['start'], datetime(2016, 7, 25, 7, 40, 52))
+        self.assertEqual(first['a.gpx']['points'], 2)
+
+        second = self.details()
+        self.assertEqual(self.computed, [])
+        self.assertEqual(second, first)
+
+    def test_mtime_change(self):
+        self.details()
+        path = join(self.folder, 'a.gpx')
+        mtime = int(stat(path).st_mtime) + 10
+        utime(path, (mtime, mtime))
+
+        files = self.details()
+        self.assertEqual(self.computed, ['a.gpx'])
+        self.assertEqual(files['a.gpx']['mtime'], mtime)
+
+    def test_size_change(self):
+        self.details()
+        path = join(self.folder, 'b.gpx')
+        mtime = stat(path).st_mtime
+        self.write('b.gpx', TIMES + ['2016-07-25T07:44:52Z'], mtime)
+
+        files = self.details()
+        self.assertEqual(self.computed, ['b.gpx'])
+        self.assertEqual(files['b.gpx']['points'], 3)
+        self.assertEqual(files['b.gpx']['end'], datetime(2016, 7, 25, 7, 44, 52))
+
+    def test_drops_removed_files(self):
+        self.details()
+        remove(join(self.folder, 'b.gpx'))
+        files = self.details(['a.gpx'])
+        self.assertEqual(self.computed, [])
+        self.assertEqual(list(files.keys()), ['a.gpx'])
+        with open(self.index_path, 'r') as index_file:
+            self.assertEqual(list(json.loads(index_file.read()).keys()), [join(self.folder, 'a.gpx')])
+
+    def test_rebuilds_corrupt_index(self):
+        self.details()
+        with open(self.index_path, 'w') as index_file:
+            index_file.write('{"truncated": ')
+
+        files = self.details()
+        self.assertEqual(sorted(self.computed), ['a.gpx', 'b.gpx'])
+        self.assertEqual(files['a.gpx']['points'], 2)
+        with open(self.index_path, 'r') as index_file:
+            self.assertEqual(len(json.loads(index_file.read())), 2)
+
+        self.details()
+        self.assertEqual(self.computed, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+import tracktotrip as tt
+from processmysteps.history import History, copy_points, copy_segments, shares_points
+from processmysteps.compact import CompactTrack
+from processmysteps.process_manager import ProcessingManager, Step
+from test_edits import build_track
+
+def snapshot(track):
+    return [
+        (
+            [(p.lat, p.lon, p.time, p.dt, p.dx, p.vel, p.acc) for p in segment.points],
+            [dict(mode) for mode in segment.transportation_modes]
+        )
+        for segment in track.segments
+    ]
+
+def move_points(track):
+    for segment in track.segments:
+        for point in segment.points:
+            point.lat = point.lat + 1
+        segment.compute_metrics()
+    return track
+
+def label_modes(track):
+    for segment in track.segments:
+        segment.points = segment.points[:-1]
+        segment.transportation_modes = [{'label': 'bus', 'from': 0, 'to': len(segment.points) - 1}]
+    return track
+
+class TestHistory(unittest.TestCase):
+    def test_shares_points(self):
+        track = build_track(10)
+        self.assertTrue(shares_points(track, copy_segments(track)))
+        self.assertFalse(shares_points(track, copy_points(track)))
+
+    def test_compacts_states_not_shared(self):
+        history = History()
+        track = build_track(10)
+        history.reset(track)
+        history.push(copy_segments(track))
+        self.assertIs(history.states[0], track)
+
+        history.push(copy_points(history.current()))
+        self.assertIs(history.states[0], track)
+        self.assertIsInstance(history.states[1], CompactTrack)
+
+    def test_pop_restores_compacted_state(self):
+        history = History()
+        track = build_track(10)
+        before = snapshot(track)
+        history.reset(track)
+        history.push(move_points(copy_points(track)))
+        self.assertIsInstance(history.states[0], CompactTrack)
+
+        history.pop()
+        restored = history.current()
+        self.assertIsInstance(restored, tt.Track)
+        self.assertEqual(snapshot(restored), before)
+
+class TestRestore(unittest.TestCase):
+    def setUp(self):
+        self.manager = ProcessingManager(None, load=False)
+        self.manager.preview_to_adjust = move_points
+        self.manager.adjust_to_annotate = label_modes
+        self.manager.prefetch = lambda: None
+        self.track = build_track(10)
+        self.manager.history.reset(self.track)
+        self.manager.current_step = Step.preview
+
+    def tearDown(self):
+        self.manager.close()
+
+    def test_restore_after_compaction(self):
+        preview = snapshot(self.track)
+        self.manager.process({})
+        adjust = snapshot(self.manager.current_track())
+        self.manager.process({})
+        self.assertEqual(self.manager.current_step, Step.annotate)
+        self.assertIsInstance(self.manager.history.states[0], CompactTrack)
+
+        self.manager.restore()
+        self.assertEqual(self.manager.current_step, Step.adjust)
+        self.assertEqual(snapshot(self.manager.current_track()), adjust)
+        self.manager.restore()
+        self.assertEqual(self.manager.current_step, Step.preview)
+        self.assertEqual(snapshot(self.manager.current_track()), preview)
+
+    def test_later_steps_dont_change_shared_states(self):
+        points = self.track.segments[0].points
+        preview = snapshot(self.track)
+        self.manager.process({})
+        adjust_track = self.manager.current_track()
+        adjust = snapshot(adjust_track)
+        self.manager.process({})
+
+        annotate_track = self.manager.current_track()
+        shared = set([id(point) for point in adjust_track.segments[0].points])
+        self.assertTrue(all([id(point) in shared for point in annotate_track.segments[0].points]))
+        self.assertEqual(len(points), 10)
+        self.assertEqual(snapshot(adjust_track), adjust)
+        self.assertEqual(snapshot(self.manager.history.states[0].to_track()), preview)
+
+if __name__ == '__main__':
+    unittest.main()
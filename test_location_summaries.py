@@ -0,0 +1,173 @@
+import sys
+import json
+import unittest
+from processmysteps import db
+from test_connection_pool import FakeConnection, FakePool, PoolTestCase
+
+sys.argv = ['server.py']
+import server
+
+ROWS = [(i, 'Place %d' % i, 38.7 + i * 0.01, -9.1, i * 2, 10.5) for i in range(1, 6)]
+
+class SummariesCursor(object):
+    """ Server side cursor over the summaries of the locations
+    """
+    def __init__(self, connection, name):
+        self.connection = connection
+        self.name = name
+        self.itersize = 2000
+        self.query = None
+        self.params = None
+
+    def execute(self, query, params=None):
+        self.query = query
+        self.params = params
+
+    def __iter__(self):
+        return iter(ROWS)
+
+    def close(self):
+        self.connection.events.append('close %s' % self.name)
+
+class SummariesConnection(FakeConnection):
+    def __init__(self):
+        FakeConnection.__init__(self)
+        self.events = []
+        self.named = []
+
+    def cursor(self, name=None):
+        if name is None:
+            return FakeConnection.cursor(self)
+        cur = SummariesCursor(self, name)
+        self.named.append(cur)
+        return cur
+
+    def commit(self):
+        FakeConnection.commit(self)
+        self.events.append('commit')
+
+class SummariesPool(FakePool):
+    def getconn(self):
+        if len(self.idle) > 0:
+            return self.idle.pop()
+        self.opened += 1
+        return SummariesConnection()
+
+class TestIterLocationSummaries(unittest.TestCase):
+    def setUp(self):
+        self.conn = SummariesConnection()
+
+    def test_summaries(self):
+        summaries = list(db.iter_location_summaries(self.conn, batch_size=2))
+        self.assertEqual([summary['id'] for summary in summaries], [1, 2, 3, 4, 5])
+        self.assertEqual(summaries[1], {
+            'id': 2, 'label': 'Place 2', 'lat': ROWS[1][2], 'lon': -9.1, 'samples': 4, 'radius': 10.5
+        })
+        cur = self.conn.named[0]
+        self.assertEqual(cur.itersize, 2)
+        self.assertNotIn('point_cluster,', cur.query)
+        self.assertEqual(self.conn.events, ['close location_summaries'])
+
+    def test_bbox(self):
+        list(db.iter_location_summaries(self.conn, (38.6, -9.2, 38.8, -9.0)))
+        # centroids have the longitude as x
+        self.assertEqual(self.conn.named[0].params, [-9.2, 38.6, -9.0, 38.8])
+
+    def test_close(self):
+        summaries = db.iter_location_summaries(self.conn)
+        next(summaries)
+        self.assertEqual(self.conn.events, [])
+        summaries.close()
+        self.assertEqual(self.conn.events, ['close location_summaries'])
+
+class ManagerTestCase(PoolTestCase):
+    def setUp(self):
+        PoolTestCase.setUp(self)
+        db.ThreadedConnectionPool = SummariesPool
+        self.manager = server.manager
+        self.db_config = dict(self.manager.config['db'])
+        self.manager.config['db'].update({'host': 'h', 'name': 'n', 'user': 'u', 'pass': 'p'})
+        # keeps the generators referenced, so they aren't closed by the garbage collector
+        self.generators = []
+        self.iter_location_summaries = db.iter_location_summaries
+        def iter_location_summaries(*args):
+            generator = self.iter_location_summaries(*args)
+            self.generators.append(generator)
+            return generator
+        db.iter_location_summaries = iter_location_summaries
+
+    def tearDown(self):
+        db.iter_location_summaries = self.iter_location_summaries
+        if self.manager.db_pool is not None:
+            self.manager.db_pool.close()
+            self.manager.db_pool = None
+        self.manager.config['db'] = self.db_config
+        PoolTestCase.tearDown(self)
+
+    def released(self):
+        pool = self.manager.db_pool.pool
+        self.assertEqual(len(pool.idle), 1)
+        self.assertEqual(self.manager.db_pools, {})
+        return pool.idle[0]
+
+class TestManagerSummaries(ManagerTestCase):
+    def test_all(self):
+        summaries = list(self.manager.iter_location_summaries())
+        self.assertEqual(len(summaries), 5)
+        conn = self.released()
+        self.assertEqual(conn.events, ['close location_summaries', 'commit'])
+
+    def test_closed_early(self):
+        summaries = self.manager.iter_location_summaries((38.6, -9.2, 38.8, -9.0))
+        self.assertEqual(next(summaries)['id'], 1)
+        self.assertEqual(len(self.manager.db_pools), 1)
+        summaries.close()
+        conn = self.released()
+        self.assertEqual(conn.events, ['close location_summaries', 'commit'])
+
+    def test_without_database(self):
+        self.manager.config['db']['host'] = None
+        self.assertEqual(list(self.manager.iter_location_summaries()), [])
+
+class TestStreaming(ManagerTestCase):
+    def setUp(self):
+        ManagerTestCase.setUp(self)
+        self.client = server.app.test_client()
+        iter_location_summaries = self.manager.iter_location_summaries
+        def keep_reference(*args):
+            generator = iter_location_summaries(*args)
+            self.generators.append(generator)
+            return generator
+        self.manager.iter_location_summaries = keep_reference
+
+    def tearDown(self):
+        del self.manager.iter_location_summaries
+        ManagerTestCase.tearDown(self)
+
+    def test_stream(self):
+        response = self.client.get('/canonicalLocations?bbox=-9.2,38.6,-9.0,38.8')
+        self.assertEqual(response.status_code, 200)
+        summaries = json.loads(response.data)
+        self.assertEqual([summary['label'] for summary in summaries], [row[1] for row in ROWS])
+        conn = self.released()
+        self.assertEqual(conn.named[0].params, [-9.2, 38.6, -9.0, 38.8])
+        self.assertEqual(conn.events, ['close location_summaries', 'commit'])
+
+    def test_client_disconnects(self):
+        response = self.client.get('/canonicalLocations?centroids', buffered=False)
+        chunks = iter(response.response)
+        self.assertEqual(next(chunks), '[')
+        self.assertEqual(json.loads(next(chunks))['id'], 1)
+        self.assertEqual(len(self.manager.db_pools), 1)
+
+        response.close()
+        conn = self.released()
+        self.assertEqual(conn.events, ['close location_summaries', 'commit'])
+
+    def test_invalid_bbox(self):
+        response = self.client.get('/canonicalLocations?bbox=1,2,3')
+        self.assertEqual(response.status_code, 400)
+        self.assertIsNone(self.manager.db_pool)
+
+if __name__ == '__main__':
+    unittest.main()
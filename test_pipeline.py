@@ -0,0 +1,80 @@
+import time
+import threading
+import unittest
+from multiprocessing.pool import ThreadPool
+from processmysteps.pipeline import Pipeline, bounded_imap
+
+class TestPipeline(unittest.TestCase):
+    def test_order(self):
+        def slow(item):
+            time.sleep(0.001 * (item % 3))
+            return item + 1
+        results = Pipeline([slow, lambda item: item * 2, slow], maxsize=2).run(range(50))
+        self.assertEqual(results, [(i + 1) * 2 + 1 for i in range(50)])
+
+    def test_stage_error(self):
+        def fail(item):
+            if item == 3:
+                raise ValueError('bad item')
+            return item
+        with self.assertRaises(ValueError) as context:
+            Pipeline([fail, lambda item: item], maxsize=2).run(range(10))
+        self.assertEqual(str(context.exception), 'bad item')
+
+    def test_items_error(self):
+        def items():
+            yield 1
+            raise KeyError('bad items')
+        with self.assertRaises(KeyError):
+            Pipeline([lambda item: item]).run(items())
+
+    def test_shutdown_on_error(self):
+        consumed = []
+        def items():
+            for i in xrange(10000):
+                consumed.append(i)
+                yield i
+        def fail(item):
+            if item == 3:
+                raise ValueError('bad item')
+            return item
+        threads = threading.active_count()
+        processed = []
+        with self.assertRaises(ValueError):
+            Pipeline([fail, processed.append], maxsize=2).run(items())
+        # the remaining items are skipped, and all threads stop
+        self.assertTrue(len(consumed) < 20)
+        self.assertEqual(processed, [0, 1, 2][:len(processed)])
+        self.assertEqual(threading.active_count(), threads)
+
+class TestBoundedImap(unittest.TestCase):
+    def setUp(self):
+        self.pool = ThreadPool(4)
+        self.started = []
+        self.lock = threading.Lock()
+
+    def tearDown(self):
+        self.pool.close()
+        self.pool.join()
+
+    def square(self, item):
+        with self.lock:
+            self.started.append(item)
+        time.sleep(0.001 * (item % 3))
+        return item * item
+
+    def test_order(self):
+        results = list(bounded_imap(self.pool, self.square, range(20), 3))
+        self.assertEqual(results, [i * i for i in range(20)])
+
+    def test_window(self):
+        results = bounded_imap(self.pool, self.square, range(20), 3)
+        for read in range(20):
+            next(results)
+            time.sleep(0.005)
+            # items are only handed to the pool as results are read
+            self.assertTrue(len(self.started) <= read + 1 + 3)
+        self.assertEqual(len(self.started), 20)
+
+if __name__ == '__main__':
+    unittest.main()
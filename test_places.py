@@ -0,0 +1,58 @@
+import time
+import unittest
+from tempfile import NamedTemporaryFile
+from tracktotrip import Point
+from processmysteps.places import PlacesCache, infer_location
+
+class StubProvider(object):
+    def __init__(self, places):
+        self.places = places
+        self.calls = 0
+
+    def __call__(self, point, radius):
+        self.calls = self.calls + 1
+        return self.places
+
+class TestPlacesCache(unittest.TestCase):
+    def setUp(self):
+        self.file = NamedTemporaryFile(suffix='.sqlite')
+        self.cache = PlacesCache(self.file.name, 60, 10, 4)
+        self.provider = StubProvider([
+            {'label': u'Caf\xe9', 'distance': 12, 'types': [], 'suggestion_type': 'STUB'}
+        ])
+
+    def tearDown(self):
+        self.file.close()
+
+    def test_repeated_lookups(self):
+        providers = [self.cache.cached('stub', self.provider)]
+        for lat in [38.70001, 38.70002, 38.70001]:
+            location = infer_location(Point(lat, -9.1, None), None, 20, providers, 5)
+            self.assertEqual(location.label, u'Caf\xe9')
+        self.assertEqual(self.provider.calls, 1)
+
+        reopened = PlacesCache(self.file.name, 60, 10, 4)
+        reopened.cached('stub', self.provider)(Point(38.7, -9.1, None), 20)
+        self.assertEqual(self.provider.calls, 1)
+        # other radius
+        reopened.cached('stub', self.provider)(Point(38.7, -9.1, None), 40)
+        self.assertEqual(self.provider.calls, 2)
+
+    def test_expiration(self):
+        self.cache.ttl = -1
+        query = self.cache.cached('stub', self.provider)
+        query(Point(38.7, -9.1, None), 20)
+        query(Point(38.7, -9.1, None), 20)
+        self.assertEqual(self.provider.calls, 2)
+
+    def test_eviction(self):
+        query = self.cache.cached('stub', self.provider)
+        for i in range(15):
+            query(Point(38.7 + i, -9.1, None), 20)
+            time.sleep(0.001)
+        self.assertEqual(len(self.cache), 10)
+        self.assertIsNone(self.cache.get('stub', Point(38.7, -9.1, None), 20))
+        self.assertIsNotNone(self.cache.get('stub', Point(52.7, -9.1, None), 20))
+
+if __name__ == '__main__':
+    unittest.main()
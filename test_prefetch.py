@@ -0,0 +1,102 @@
+import time
+import unittest
+import threading
+from collections import OrderedDict
+from processmysteps.prefetch import Prefetcher
+from processmysteps.process_manager import ProcessingManager
+
+class TestPrefetcher(unittest.TestCase):
+    def setUp(self):
+        self.prefetcher = Prefetcher()
+
+    def run_request(self, key, work):
+        # runs in the current thread, like the background one does
+        with self.prefetcher.lock:
+            self.prefetcher.key = key
+            self.prefetcher.result = None
+        self.prefetcher.run(key, work)
+
+    def test_take_once(self):
+        self.run_request('a', lambda: 42)
+        self.assertIsNone(self.prefetcher.take('b'))
+        self.assertEqual(self.prefetcher.take('a'), 42)
+        self.assertIsNone(self.prefetcher.take('a'))
+
+    def test_older_results_are_dropped(self):
+        started = threading.Event()
+        finish = threading.Event()
+        def slow():
+            started.set()
+            finish.wait()
+            return 'old'
+        self.prefetcher.start('a', slow)
+        started.wait()
+        self.run_request('b', lambda: 'new')
+        finish.set()
+        self.assertEqual(self.prefetcher.take('b'), 'new')
+        self.assertIsNone(self.prefetcher.take('a'))
+
+    def test_same_key_starts_once(self):
+        calls = []
+        started = threading.Event()
+        self.prefetcher.start('a', lambda: calls.append('first') or started.set())
+        self.prefetcher.start('a', lambda: calls.append('second'))
+        started.wait(1.0)
+        time.sleep(0.05)
+        self.assertEqual(calls, ['first'])
+
+    def test_failed_request_is_retried(self):
+        def failing():
+            raise IOError('unreadable')
+        self.run_request('a', failing)
+        self.assertIsNone(self.prefetcher.key)
+        self.assertIsNone(self.prefetcher.take('a'))
+
+        done = threading.Event()
+        self.prefetcher.start('a', lambda: done.set() or 'retried')
+        done.wait(1.0)
+        self.assertTrue(done.is_set())
+
+    def test_discard(self):
+        self.run_request('a', lambda: 42)
+        self.prefetcher.discard()
+        self.assertIsNone(self.prefetcher.take('a'))
+
+class TestFollowingDay(unittest.TestCase):
+    def setUp(self):
+        self.manager = ProcessingManager(None, load=False)
+        self.manager.queue = OrderedDict([(day, []) for day in ['01', '02', '03']])
+        self.changed_to = []
+        self.manager.change_day = self.changed_to.append
+        self.manager.reset = lambda: self.changed_to.append(None)
+
+    def tearDown(self):
+        self.manager.close()
+
+    def assert_next_day(self, current, delete, expected):
+        self.manager.current_day = current
+        self.assertEqual(self.manager.following_day(delete), expected)
+        self.manager.next_day(delete)
+        self.assertEqual(self.changed_to, [expected])
+
+    def test_after_storing(self):
+        # the oldest day left, not the one after the stored day
+        self.assert_next_day('02', True, '01')
+        self.assertEqual(list(self.manager.queue.keys()), ['01', '03'])
+
+    def test_after_skipping(self):
+        self.assert_next_day('02', False, '03')
+
+    def test_after_skipping_the_last_day(self):
+        self.assert_next_day('03', False, '01')
+
+    def test_last_day(self):
+        self.manager.queue = OrderedDict([('01', [])])
+        self.assert_next_day('01', True, None)
+
+    def test_without_current_day(self):
+        self.manager.current_day = None
+        self.assertEqual(self.manager.following_day(), '01')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import unittest
+from datetime import datetime, timedelta
+from tempfile import NamedTemporaryFile
+import psycopg2
+from processmysteps import db
+from processmysteps.process_manager import TIME_RX, search_forward, search_backward, \
+        count_points, predict_time_span, TimeIndex, ProcessingManager
+from test_canonical_index import FakeCursor
+import tracktotrip as tt
+
+def gpx_content(times):
+    points = ['<trkpt lat="1.0" lon="2.0"><time>%s</time></trkpt>' % t for t in times]
+    return '<gpx><trk><trkseg>%s</trkseg></trk></gpx>' % '\n'.join(points)
+
+class TestTimeSpan(unittest.TestCase):
+    def setUp(self):
+        self.times = [
+            '2016-07-25T07:40:52Z',
+            '2016-07-25T07:41:52Z',
+            '2016-07-25T07:42:52Z',
+            '2016-07-25T07:43:52Z'
+        ]
+        self.gpx = NamedTemporaryFile(suffix='.gpx')
+        self.gpx.write(gpx_content(self.times))
+        self.gpx.flush()
+
+    def tearDown(self):
+        self.gpx.close()
+
+    def test_search_across_chunk_boundaries(self):
+        with open(self.gpx.name, 'r') as opened_file:
+            for chunk_size in range(1, 60):
+                first = search_forward(opened_file, TIME_RX, chunk_size)
+                last = search_backward(opened_file, TIME_RX, chunk_size)
+                self.assertEqual(first.group(1), self.times[0])
+                self.assertEqual(last.group(1), self.times[-1])
+                self.assertEqual(count_points(opened_file, chunk_size), len(self.times))
+
+    def test_predict_time_span(self):
+        start, end, points = predict_time_span(self.gpx.name)
+        self.assertEqual(start, datetime(2016, 7, 25, 7, 40, 52))
+        self.assertEqual(end, datetime(2016, 7, 25, 7, 43, 52))
+        self.assertEqual(points, 4)
+
+    def test_no_time(self):
+        with NamedTemporaryFile(suffix='.gpx') as empty:
+            empty.write('<gpx></gpx>')
+            empty.flush()
+            with open(empty.name, 'r') as opened_file:
+                self.assertIsNone(search_forward(opened_file, TIME_RX, 4))
+                self.assertIsNone(search_backward(opened_file, TIME_RX, 4))
+
+class TestTimeIndex(unittest.TestCase):
+    def setUp(self):
+        start = datetime(2016, 7, 25, 23, 50, 0)
+        times = [start + timedelta(minutes=i * 5) for i in range(6)]
+        self.track = tt.Track('test', [
+            tt.Segment([tt.Point(0, 0, time) for time in times[:3]]),
+            tt.Segment([tt.Point(0, 0, time) for time in times[3:]])
+        ])
+        self.index = TimeIndex(self.track)
+
+    def test_find(self):
+        self.assertEqual(self.index.find(datetime(2016, 7, 25, 23, 50)), (0, 0))
+        self.assertEqual(self.index.find(datetime(2016, 7, 25, 23, 57)), (0, 1))
+        self.assertEqual(self.index.find(datetime(2016, 7, 26, 0, 0)), (0, 1))
+        self.assertEqual(self.index.find(datetime(2016, 7, 26, 0, 12)), (1, 1))
+
+    def test_find_across_days(self):
+        self.assertEqual(self.index.find(datetime(2016, 7, 26, 0, 2)), (None, None))
+        self.assertEqual(self.index.find(datetime(2016, 7, 25, 0, 17)), (None, None))
+        self.assertEqual(self.index.find(datetime(2016, 7, 27, 23, 55)), (None, None))
+
+class TestStoreDay(unittest.TestCase):
+    def setUp(self):
+        self.manager = ProcessingManager(None, load=False)
+        self.manager.canonical_index.load(FakeCursor([(1, 38.7, -9.2, 38.71, -9.19)]))
+        self.manager.db_connect = lambda: (object(), object())
+        self.functions = (db.load_from_segments_annotated, db.insert_segments)
+        db.load_from_segments_annotated = lambda *args: None
+        db.insert_segments = lambda cur, segments: []
+
+    def tearDown(self):
+        db.load_from_segments_annotated, db.insert_segments = self.functions
+        self.manager.close()
+
+    def test_failed_commit_clears_index(self):
+        def dispose(conn, cur, rollback=False):
+            if not rollback:
+                raise psycopg2.OperationalError('commit failed')
+        self.manager.db_dispose = dispose
+        self.assertRaises(
+            psycopg2.OperationalError,
+            self.manager.store_day, '2016-07-25', tt.Track('track.gpx', []), ''
+        )
+        self.assertFalse(self.manager.canonical_index.loaded)
+
+    def test_commit_keeps_index(self):
+        self.manager.db_dispose = lambda conn, cur, rollback=False: None
+        self.manager.store_day('2016-07-25', tt.Track('track.gpx', []), '')
+        self.assertTrue(self.manager.canonical_index.loaded)
+class TestClose(unittest.TestCase):
+    def count_listeners(self):
+        return sum([len(listeners) for listeners in db.LISTENERS.values()])
+
+    def test_close_removes_listeners(self):
+        before = self.count_listeners()
+        first = ProcessingManager(None, load=False)
+        second = ProcessingManager(None, load=False)
+        registered = self.count_listeners() - before
+        self.assertEqual(registered % 2, 0)
+        self.assertGreater(registered, 0)
+
+        first.close()
+        self.assertEqual(self.count_listeners() - before, registered / 2)
+        # the listeners of the other manager are kept
+        self.assertIn(second.location_cache.invalidate, db.LISTENERS['locations'])
+        second.close()
+        self.assertEqual(self.count_listeners(), before)
+
+if __name__ == '__main__':
+    unittest.main()
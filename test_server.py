@@ -0,0 +1,93 @@
+import sys
+import json
+import unittest
+from test_edits import build_track
+
+sys.argv = ['server.py']
+import server
+from processmysteps.process_manager import Step
+
+class ServerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.manager = server.manager
+        self.manager.history.reset(build_track(10))
+        self.step = self.manager.current_step
+        self.manager.current_step = Step.preview
+        self.client = server.app.test_client()
+
+    def tearDown(self):
+        self.manager.history.reset()
+        self.manager.current_step = self.step
+        server.STATE_CACHE['etag'] = None
+        server.STATE_CACHE['body'] = None
+
+class TestNext(ServerTestCase):
+    def post(self, payload):
+        return self.client.post('/next', data=json.dumps(payload))
+
+    def test_invalid_edits(self):
+        track = self.manager.current_track()
+        response = self.post({'edits': [{'type': 'delete', 'segment': 0, 'from': 5, 'to': 2}]})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('From is after to', json.loads(response.data)['error'])
+        self.assertIs(self.manager.current_track(), track)
+
+        response = self.post({'edits': {'type': 'merge', 'segment': 0}})
+        self.assertEqual(response.status_code, 400)
+        self.assertIs(self.manager.current_track(), track)
+
+    def test_other_errors_are_not_invalid_edits(self):
+        def process(payload):
+            raise ValueError('after the state changed')
+        self.manager.process = process
+        try:
+            response = self.post({'edits': []})
+        finally:
+            del self.manager.process
+        self.assertEqual(response.status_code, 500)
+
+class TestState(ServerTestCase):
+    def test_not_modified(self):
+        response = self.client.get('/current')
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+        self.assertEqual(json.loads(response.data)['step'], Step.preview)
+
+        response = self.client.get('/current', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, '')
+        self.assertEqual(response.headers['ETag'], etag)
+
+        response = self.client.get('/current', headers={'If-None-Match': '"other"'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_post_is_never_not_modified(self):
+        etag = self.client.get('/current').headers['ETag']
+        self.manager.load_life = lambda payload: None
+        try:
+            response = self.client.post('/loadLIFE', data='', headers={'If-None-Match': etag})
+        finally:
+            del self.manager.load_life
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['ETag'], etag)
+        self.assertEqual(json.loads(response.data)['step'], Step.preview)
+
+    def test_process_changes_etag(self):
+        etag = self.client.get('/current').headers['ETag']
+        self.manager.preview_to_adjust = lambda track: track
+        try:
+            response = self.client.post('/next', data='{}', headers={'If-None-Match': etag})
+        finally:
+            del self.manager.preview_to_adjust
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        self.assertEqual(json.loads(response.data)['step'], Step.adjust)
+
+        response = self.client.get('/current', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)['step'], Step.adjust)
+        response = self.client.get('/current', headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import shutil
+import unittest
+from os.path import isfile
+from tempfile import mkdtemp
+from processmysteps import db
+from processmysteps.tiles import tile_bounds, tile_range, is_valid_tile, TileCache
+
+class TestTileCoordinates(unittest.TestCase):
+    def test_world_tile(self):
+        min_lat, min_lon, max_lat, max_lon = tile_bounds(0, 0, 0)
+        self.assertAlmostEqual(min_lat, -85.0511287798)
+        self.assertAlmostEqual(max_lat, 85.0511287798)
+        self.assertEqual((min_lon, max_lon), (-180.0, 180.0))
+        self.assertEqual(tile_range((-90.0, -180.0, 90.0, 180.0), 0), (0, 0, 0, 0))
+
+    def test_bounds_and_range_agree(self):
+        for z, x, y in [(1, 0, 0), (1, 1, 1), (10, 487, 393), (16, 31124, 25161)]:
+            min_lat, min_lon, max_lat, max_lon = tile_bounds(z, x, y)
+            # a point inside of the tile
+            lat = (min_lat + max_lat) / 2
+            lon = (min_lon + max_lon) / 2
+            self.assertEqual(tile_range((lat, lon, lat, lon), z), (x, y, x, y))
+
+    def test_range(self):
+        # Lisbon, across x 485 (up to -9.140625) and 486
+        self.assertEqual(tile_range((38.7, -9.2, 38.8, -9.1), 10), (485, 392, 486, 392))
+        # and across y 392 (up to 38.8226) and 391, to the north
+        self.assertEqual(tile_range((38.7, -9.2, 38.9, -9.1), 10), (485, 391, 486, 392))
+        # y grows to the south
+        min_x, min_y, max_x, max_y = tile_range((-10.0, -10.0, 10.0, 10.0), 4)
+        self.assertEqual((min_x, min_y, max_x, max_y), (7, 7, 8, 8))
+
+    def test_range_is_clamped(self):
+        self.assertEqual(tile_range((-90.0, -200.0, 90.0, 200.0), 2), (0, 0, 3, 3))
+
+    def test_bounds_margin(self):
+        inner = tile_bounds(10, 487, 393)
+        outer = tile_bounds(10, 487, 393, margin=0.25)
+        self.assertLess(outer[0], inner[0])
+        self.assertLess(outer[1], inner[1])
+        self.assertGreater(outer[2], inner[2])
+        self.assertGreater(outer[3], inner[3])
+        # the margin doesn't go past the poles
+        self.assertAlmostEqual(tile_bounds(1, 0, 0, margin=0.5)[2], 85.0511287798)
+
+    def test_is_valid_tile(self):
+        self.assertTrue(is_valid_tile(2, 3, 3, 20))
+        self.assertFalse(is_valid_tile(2, 4, 0, 20))
+        self.assertFalse(is_valid_tile(2, 0, -1, 20))
+        self.assertFalse(is_valid_tile(21, 0, 0, 20))
+
+class TestTileCache(unittest.TestCase):
+    def setUp(self):
+        self.path = mkdtemp()
+        self.cache = TileCache(self.path, 60)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def put_around(self, layer, z, x, y, distance):
+        for i in range(x - distance, x + distance + 1):
+            for j in range(y - distance, y + distance + 1):
+                self.cache.put(layer, z, i, j, 'tile')
+
+    def cached(self, layer, z, x, y):
+        return isfile(self.cache.tile_path(layer, z, x, y))
+
+    def test_get_and_put(self):
+        self.assertIsNone(self.cache.get('trips', 10, 485, 391))
+        self.cache.put('trips', 10, 485, 391, 'tile')
+        self.assertEqual(self.cache.get('trips', 10, 485, 391), 'tile')
+        self.assertIsNone(TileCache(self.path, -1).get('trips', 10, 485, 391))
+
+    def test_invalidate_removes_neighbours(self):
+        # a point inside of tile 10/487/393
+        min_lat, min_lon, max_lat, max_lon = tile_bounds(10, 487, 393)
+        lat, lon = (min_lat + max_lat) / 2, (min_lon + max_lon) / 2
+        self.put_around('trips', 10, 487, 393, 2)
+        self.cache.invalidate('trips', (lat, lon, lat, lon))
+
+        for x in range(485, 490):
+            for y in range(391, 396):
+                near = abs(x - 487) <= 1 and abs(y - 393) <= 1
+                self.assertEqual(self.cached('trips', 10, x, y), not near, (x, y))
+
+    def test_invalidate_every_zoom(self):
+        min_lat, min_lon, max_lat, max_lon = tile_bounds(10, 487, 393)
+        lat, lon = (min_lat + max_lat) / 2, (min_lon + max_lon) / 2
+        self.cache.put('trips', 10, 487, 393, 'tile')
+        self.cache.put('trips', 9, 243, 196, 'tile')
+        # far from the area
+        self.cache.put('trips', 9, 100, 100, 'tile')
+        self.cache.invalidate('trips', (lat, lon, lat, lon))
+        self.assertFalse(self.cached('trips', 10, 487, 393))
+        self.assertFalse(self.cached('trips', 9, 243, 196))
+        self.assertTrue(self.cached('trips', 9, 100, 100))
+
+    def test_invalidate_other_layer(self):
+        min_lat, min_lon, max_lat, max_lon = tile_bounds(10, 487, 393)
+        self.cache.put('trips', 10, 487, 393, 'tile')
+        self.cache.put('locations', 10, 487, 393, 'tile')
+        self.cache.invalidate('locations', (min_lat, min_lon, max_lat, max_lon))
+        self.assertTrue(self.cached('trips', 10, 487, 393))
+        self.assertFalse(self.cached('locations', 10, 487, 393))
+        # layers without cached tiles
+        self.cache.invalidate('canonical_trips', (min_lat, min_lon, max_lat, max_lon))
+
+    def test_invalidated_after_commit(self):
+        class Connection(object):
+            def cursor(self):
+                return Cursor(self)
+            def commit(self):
+                pass
+            def close(self):
+                pass
+        class Cursor(object):
+            def __init__(self, connection):
+                self.connection = connection
+        listeners = dict(db.LISTENERS)
+        db.LISTENERS.clear()
+        try:
+            db.on_change('trips', lambda bounds: self.cache.invalidate('trips', bounds))
+            min_lat, min_lon, max_lat, max_lon = tile_bounds(10, 487, 393)
+            self.cache.put('trips', 10, 487, 393, 'tile')
+
+            conn = Connection()
+            db.changed(conn.cursor(), 'trips', (min_lat, min_lon, max_lat, max_lon))
+            self.assertTrue(self.cached('trips', 10, 487, 393))
+            db.dispose(conn, None)
+            self.assertFalse(self.cached('trips', 10, 487, 393))
+        finally:
+            db.LISTENERS.clear()
+            db.LISTENERS.update(listeners)
+
+if __name__ == '__main__':
+    unittest.main()
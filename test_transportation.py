@@ -0,0 +1,99 @@
+import random
+import unittest
+from datetime import datetime, timedelta
+import numpy as np
+import tracktotrip as tt
+from tracktotrip.transportation_mode import extract_features_2
+from processmysteps.transportation import parse_points, compute_metrics, \
+        extract_features, classify_segments
+
+def build_points(n_points, seed=0):
+    rand = random.Random(seed)
+    start = datetime(2016, 7, 25, 8, 0, 0)
+    lat, lon, time = 38.7, -9.1, start
+    points = []
+    for i in range(n_points):
+        points.append({'lat': lat, 'lon': lon, 'time': time.strftime('%Y-%m-%dT%H:%M:%SZ')})
+        # walking, driving and standing still, with repeated timestamps
+        speed = rand.choice([0, 1e-5, 1e-4, 5e-4])
+        lat = lat + speed * rand.uniform(-1, 1)
+        lon = lon + speed * rand.uniform(-1, 1)
+        time = time + timedelta(seconds=rand.choice([0, 1, 5, 10, 30]))
+    return points
+
+def reference_features(points):
+    segment = tt.Segment([tt.Point.from_json(point) for point in points])
+    segment.compute_metrics()
+    return segment, extract_features_2(segment.points)
+
+def features(points):
+    return extract_features(*compute_metrics(*parse_points(points)))
+
+class FakeClassifier(object):
+    def __init__(self):
+        self.calls = []
+
+    def predict(self, features, verbose=False):
+        self.calls.append(features)
+        return [{'walk': feature[0]} for feature in features]
+
+class TestFeatures(unittest.TestCase):
+    def assert_same_features(self, points):
+        _, expected = reference_features(points)
+        result = features(points)
+        if len(expected) == 0:
+            self.assertIsNone(result)
+        else:
+            self.assertEqual(result.tolist(), [float(value) for value in expected])
+
+    def test_metrics(self):
+        points = build_points(300)
+        segment, _ = reference_features(points)
+        d_t, vel = compute_metrics(*parse_points(points))
+        self.assertEqual(d_t.tolist(), [point.dt for point in segment.points])
+        np.testing.assert_allclose(vel, [point.vel for point in segment.points], rtol=1e-9)
+
+    def test_segments(self):
+        for seed in range(20):
+            points = build_points(300, seed)
+            self.assertIsNotNone(features(points))
+            self.assert_same_features(points)
+
+    def test_far_points(self):
+        points = build_points(10)
+        points[5]['lat'] = points[5]['lat'] + 0.5
+        points[6]['lon'] = points[6]['lon'] - 0.3
+        self.assert_same_features(points)
+
+    def test_short_segments(self):
+        for n_points in range(0, 10):
+            for seed in range(5):
+                self.assert_same_features(build_points(n_points, seed))
+
+    def test_without_movement(self):
+        points = build_points(5)
+        for point in points:
+            point['time'] = points[0]['time']
+        self.assert_same_features(points)
+        self.assertIsNone(features(points))
+
+class TestClassifySegments(unittest.TestCase):
+    def test_single_prediction(self):
+        clf = FakeClassifier()
+        segments = [build_points(50, 1), build_points(1), build_points(30, 2), []]
+        result = classify_segments(clf, segments)
+
+        self.assertEqual(len(clf.calls), 1)
+        self.assertEqual(len(clf.calls[0]), 2)
+        self.assertIsNone(result[1])
+        self.assertIsNone(result[3])
+        self.assertEqual(result[0], {'walk': features(segments[0])[0]})
+        self.assertEqual(result[2], {'walk': features(segments[2])[0]})
+
+    def test_no_features(self):
+        clf = FakeClassifier()
+        self.assertEqual(classify_segments(clf, [build_points(1)]), [None])
+        self.assertEqual(clf.calls, [])
+
+if __name__ == '__main__':
+    unittest.main()